@@ -1,156 +1,493 @@
+import time
+
+# Đo thời gian import và mỗi lần chạy script (cold start / rerun)
+SCRIPT_STARTED = time.perf_counter()
+
 import streamlit as st
 import dotenv
 import os
-import base64
-import anthropic
-import openai
+import io
 import json
-import docx
-import re
+import statistics
 import uuid
-from plantuml import PlantUML
+from collections import deque
+from artifacts import get_artifact_store
+from board import Board, page_count, page_slice
+from diagram_model import build_class_model, build_deployment_model
+from ingest import get_ingest_cache
+from emitters import generate_agile_process_plantuml, generate_class_plantuml, generate_deployment_plantuml
+from providers import ANTHROPIC, FAKE, MODELS, OPENAI
+from llm_cache import get_response_cache
+from export import EXPORT_MIMES, export_diagram, export_file_name, export_formats, write_bundle
+from jobs import DONE, FAILED, QUEUED, JobRejected, get_job_queue, job_key
+from metrics import get_metrics, profiled
+from pipeline import (
+    LLMConfig,
+    classify,
+    emit_deployment,
+    emit_functional,
+    functional_state,
+    generate_deployment,
+    generate_functional,
+    export,
+    render_targets,
+    split_story_lines,
+)
+from stories import new_story
+from storage import get_project_store
+from render import RENDERER_MODE, RENDERER_MODES, RenderError, get_render_cache, get_renderer
+
+IMPORTS_DONE = time.perf_counter()
+
+# Định dạng chỉ xuất khi người dùng chọn thêm vào file zip export
+EXTRA_EXPORT_FORMATS = ("svg", "pdf")
+# Chu kỳ (giây) hỏi trạng thái job đang chạy
+JOB_POLL_SECONDS = float(os.getenv("UML_JOB_POLL_SECONDS", 1.0))
+# Thư mục trong file zip export cho từng nhóm diagram
+EXPORT_GROUPS = {"functional": "Functional", "non_functional": "Non-Functional", "agile": "Agile"}
 
 dotenv.load_dotenv()
 
-def file_to_base64(file):
-    with open(file, "rb") as f:
-        return base64.b64encode(f.read())
-
-def assign_story_ids(stories):
-    """Assign a unique UUID to each user story and return as list of dicts."""
-    return [{"id": str(uuid.uuid4()), "text": s} for s in stories]
-
-def classify_user_story(stories, selected_model, anthropic_api_key, openai_api_key):
-    prompt = f"""
-        {stories}
-
-        Bạn là một chuyên gia phân tích hệ thống phần mềm. Hãy phân loại các câu chuyện người dùng (user stories) thành các loại sau: 
-        - Functional
-        - Non-Functional
-
-        Trả về JSON với định dạng sau:
-        {{
-            "Functional": [
-                "Câu chuyện người dùng 1",
-                "Câu chuyện người dùng 2"
-            ],
-            "Non-Functional": [
-                "Câu chuyện người dùng 3",
-                "Câu chuyện người dùng 4"
-            ]
-        }}
+@st.cache_resource
+def warm_renderer(mode):
+    """Renderer for ``mode``; a plantuml.jar pool is started once per process, not on the first render."""
+    renderer = get_renderer(mode)
+    if hasattr(renderer, "warm_up"):
+        try:
+            renderer.warm_up("png")
+        except RenderError:
+            pass
+    return renderer
+
+def ingest_upload(uploaded_file):
+    """Stories of an uploaded file, parsed once per upload.
+
+    Reruns reuse the result stored under the upload's ``file_id`` without
+    reading the file again; a new upload with known content is served from
+    the process-wide ingest cache after hashing it once.
     """
-    if selected_model == "Anthropic Claude":
-        client = anthropic.Client(api_key=anthropic_api_key)
-        message = client.messages.create(
-            model=selected_model,
-            max_tokens=8096,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.1,
-        )
-        response_text = message.content[0].text
+    cached = st.session_state.get("ingested_upload")
+    if cached is not None and cached[0] == uploaded_file.file_id:
+        return cached[1]
+    result = get_ingest_cache().ingest(uploaded_file, uploaded_file.name)
+    st.session_state["ingested_upload"] = (uploaded_file.file_id, result)
+    return result
+
+@st.cache_resource
+def run_timings():
+    """Process-wide cold start and rerun durations, shared by all sessions."""
+    return {"imports": IMPORTS_DONE - SCRIPT_STARTED, "cold_start": None, "reruns": deque(maxlen=500)}
+
+def report_run_timing(slot):
+    """Record how long this script run took and show the startup/rerun report in ``slot``."""
+    timings = run_timings()
+    elapsed = time.perf_counter() - SCRIPT_STARTED
+    if timings["cold_start"] is None:
+        timings["cold_start"] = elapsed
     else:
-        openai.api_key = openai_api_key
-        response = openai.chat.completions.create(
-            model=selected_model,
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=8096,
-            temperature=0.1,
+        timings["reruns"].append(elapsed)
+    get_metrics().observe("app.run", elapsed)
+    reruns = sorted(timings["reruns"])
+    report = {
+        "import_ms": round(timings["imports"] * 1000, 1),
+        "cold_start_ms": round(timings["cold_start"] * 1000, 1),
+        "this_run_ms": round(elapsed * 1000, 1),
+        "reruns": len(reruns),
+    }
+    if reruns:
+        report["rerun_p50_ms"] = round(statistics.median(reruns) * 1000, 1)
+        report["rerun_p95_ms"] = round(reruns[int(0.95 * (len(reruns) - 1))] * 1000, 1)
+    slot.json(report)
+
+def report_metrics(container):
+    """Hiển thị thời gian từng stage và các bộ đếm của process, kèm export JSON / Prometheus."""
+    metrics = get_metrics()
+    snapshot = metrics.snapshot()
+    with container:
+        st.dataframe(
+            [{"stage": name, "count": s["count"], "mean_ms": round(s["mean"] * 1000, 1),
+              "p95_ms": round(s["p95"] * 1000, 1), "total_s": round(s["total"], 2)}
+             for name, s in snapshot["spans"].items()],
+            hide_index=True,
         )
-        response_text = response.choices[0].message.content
-    # list 
-    match = re.search(r'```json\n(.*?)\n```', response_text, re.DOTALL)
-    data = json.loads(match.group(1)) if match else json.loads(response_text)
-    return data
+        st.json(snapshot["counters"])
+        st.download_button("Export JSON", json.dumps(snapshot), file_name="metrics.json",
+                           mime="application/json", key="export_metrics_json", on_click="ignore")
+        st.download_button("Export Prometheus", metrics.to_prometheus(), file_name="metrics.prom",
+                           mime="text/plain", key="export_metrics_prometheus", on_click="ignore")
+
+def artifact_download_button(label, session_id, name):
+    """Download button served straight from the artifact store (no base64 data URI)."""
+    store = get_artifact_store()
+    artifact = store.info(session_id, name)
+    if artifact is None:
+        return
+    st.download_button(
+        label,
+        data=store.open(session_id, name),
+        file_name=name,
+        mime=artifact.mime,
+        key=f"download_{name}",
+        on_click="ignore",
+    )
+
+def bundle_download_button(label, session_id, names, file_name):
+    """Download button for a zip of several artifacts of the session; the zip is only built when clicked."""
+    store = get_artifact_store()
+    names = [name for name in names if store.info(session_id, name) is not None]
+    if not names:
+        return
+    st.download_button(
+        label,
+        data=lambda: store.bundle(session_id, names).getvalue(),
+        file_name=file_name,
+        mime="application/zip",
+        key=f"download_{file_name}",
+        on_click="ignore",
+    )
+
+def display_formats():
+    """PNG (dùng để hiển thị) cùng các định dạng xuất mặc định; gọi khi cần để cairosvg chỉ import lúc dùng."""
+    return ("png",) + tuple(fmt for fmt in export_formats() if fmt != "png")
+
+def store_export(session_id, result):
+    """Lưu mọi định dạng đã xuất của một diagram vào artifact store, trả về tên các file."""
+    store = get_artifact_store()
+    names = []
+    for fmt, data in result.files.items():
+        name = export_file_name(result.name, fmt)
+        store.put(session_id, name, data, EXPORT_MIMES[fmt])
+        names.append(name)
+    return names
+
+def show_export(slot, result, label):
+    """Hiển thị PNG của diagram trong ``slot``; báo lỗi các định dạng không xuất được."""
+    preview = result.files.get("png")
+    if preview is None:
+        slot.error(f"Không render được {label} diagram: {result.errors.get('png')}")
+        return
+    with slot.container():
+        st.image(preview, caption=f"Generated {label} Diagram ({result.elapsed:.2f}s)")
+        if result.errors:
+            st.caption("Không xuất được: " + ", ".join(f"{fmt} ({error})" for fmt, error in result.errors.items()))
+
+def remember_export(group, names):
+    """Ghi lại các file của một nhóm diagram để đưa vào file zip export chung."""
+    st.session_state.setdefault("export_groups", {})[group] = list(names)
+
+def export_bundle_button(session_id, renderer):
+    """Nút tải một file zip gồm mọi .puml và hình đã sinh, chia thư mục Functional / Non-Functional / Agile.
+
+    File zip chỉ được tạo khi bấm nút, ghi lần lượt từng entry. Định dạng chọn thêm
+    (SVG/PDF khi không chuyển đổi cục bộ được) cũng chỉ được render lúc đó.
+    """
+    store = get_artifact_store()
+    entries = []
+    for group, names in st.session_state.get("export_groups", {}).items():
+        for name in names:
+            if store.info(session_id, name) is not None:
+                entries.append((EXPORT_GROUPS[group], name))
+    if not entries:
+        return
+    produced = display_formats()
+    available = [fmt for fmt in EXTRA_EXPORT_FORMATS if fmt not in produced]
+    extra_formats = st.multiselect("Thêm định dạng vào file zip", available, key="export_extra_formats") \
+        if available else []
+
+    def bundle_entries():
+        for folder, name in entries:
+            data = store.get(session_id, name)
+            yield f"{folder}/{name}", data
+            if extra_formats and name.endswith(".puml") and data is not None:
+                diagram = name[len("diagram_"):-len(".puml")]
+                result = export_diagram(diagram, data.decode("utf-8"), extra_formats, renderer=renderer)
+                for fmt, extra in result.files.items():
+                    yield f"{folder}/{export_file_name(diagram, fmt)}", extra
+
+    def build_bundle():
+        buffer = io.BytesIO()
+        with get_metrics().span("export.bundle"):
+            write_bundle(bundle_entries(), buffer)
+        return buffer.getvalue()
+
+    st.download_button(
+        f"📦 Export tất cả (.zip, {len(entries)} file)",
+        data=build_bundle,
+        file_name="uml_diagrams.zip",
+        mime="application/zip",
+        key="download_export_bundle",
+        on_click="ignore",
+    )
+
+def functional_preview(items, elapsed):
+    """Vẽ class diagram dở dang từ các mục đã stream về."""
+    model = build_class_model(items)
+    st.caption(
+        f"⏳ {len(model.classes)} class, {len(model.relationships)} quan hệ, "
+        f"{len(items.get('objects', []))} đối tượng, {len(items.get('messages', []))} thông điệp "
+        f"({elapsed:.1f}s)"
+    )
+    st.code(generate_class_plantuml(model), language="uml")
+
+def deployment_preview(items, elapsed):
+    """Vẽ deployment diagram dở dang từ các mục đã stream về."""
+    model = build_deployment_model(items)
+    st.caption(f"⏳ {len(model.nodes)} node, {len(model.links)} kết nối ({elapsed:.1f}s)")
+    st.code(generate_deployment_plantuml(model), language="uml")
+
+def diagram_label(name):
+    if name == "class":
+        return "Class"
+    if name == "class_overview":
+        return "Class (tổng quan)"
+    if name.startswith("class_"):
+        return f"Class (cụm {name.split('_')[1]})"
+    return name.capitalize()
+
+def stream_to_job(job):
+    """Callback on_items lưu bản sao các mục đã stream về vào job để session hiển thị xem trước."""
+    def on_items(items):
+        job.report(partial={"items": {key: list(values) for key, values in items.items()}})
+    return on_items
+
+def functional_job(job, stories, config, previous_model, stream, renderer):
+    """Chạy trong worker của job queue (không dùng st.*): sinh mô hình Functional và xuất mọi diagram."""
+    job.report(0.05, "Đang sinh mô hình...")
+    on_items = stream_to_job(job) if stream else None
+    mode, story_diff, data = generate_functional(stories, config, previous_model, on_items)
+    diagrams = emit_functional(data)
+    targets = render_targets(diagrams.sources)
+    job.report(0.6, f"Đang render {len(targets)} diagram...")
+    exports = {}
+    for result in export(diagrams.sources, display_formats(), renderer=renderer):
+        exports[result.name] = result
+        # Session hiển thị ngay từng diagram đã render xong, không đợi cả lượt
+        job.report(0.6 + 0.4 * len(exports) / len(targets), f"Đã render {len(exports)}/{len(targets)} diagram",
+                   partial={"exports": dict(exports)})
+    return {"mode": mode, "story_diff": story_diff, "diagrams": diagrams,
+            "state": functional_state(stories, diagrams, config), "exports": exports}
+
+def deployment_job(job, stories, config, stream, renderer):
+    """Chạy trong worker của job queue (không dùng st.*): sinh và xuất deployment diagram."""
+    job.report(0.05, "Đang sinh mô hình...")
+    on_items = stream_to_job(job) if stream else None
+    model, sources = emit_deployment(generate_deployment(stories, config, on_items))
+    job.report(0.7, "Đang render diagram...")
+    result = export_diagram("deployment", sources["deployment"], display_formats(), renderer=renderer)
+    return {"model": model, "source": sources["deployment"], "export": result}
+
+def submit_job(kind, session_id, key, fn, *args):
+    """Đưa việc sinh diagram vào job queue chung; session chỉ giữ job ID."""
+    try:
+        job = get_job_queue().submit(session_id, kind, key, fn, *args)
+    except JobRejected as e:
+        st.error(f"Server đang bận, vui lòng thử lại sau ({e}).")
+        return None
+    st.session_state[f"job_{kind}"] = job.id
+    return job
+
+def current_job(kind):
+    job_id = st.session_state.get(f"job_{kind}")
+    return get_job_queue().get(job_id) if job_id else None
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def job_progress(kind, preview):
+    """Hỏi trạng thái job định kỳ; chạy lại cả trang khi job xong để hiển thị kết quả."""
+    job = current_job(kind)
+    if job is None or job.done:
+        st.rerun()
+    if job.status == QUEUED:
+        st.progress(0.0, text=f"Đang chờ worker... ({time.time() - job.created:.0f}s)")
+    else:
+        st.progress(job.progress, text=f"{job.message} ({job.elapsed():.0f}s)")
+    partial = job.partial or {}
+    if "exports" in partial:
+        for name, result in partial["exports"].items():
+            show_export(st.empty(), result, diagram_label(name))
+    elif "items" in partial:
+        preview(partial["items"], job.elapsed())
+    if st.button("Hủy", key=f"cancel_job_{kind}"):
+        get_job_queue().cancel(job.id, st.session_state["session_id"])
+        st.session_state.pop(f"job_{kind}", None)
+        st.rerun()
 
 def display_functional_checklist(functional_stories):
     st.write("## Functional User Stories Checklist")
     for story in functional_stories:
         st.checkbox(story["text"], value=False)
 
-def generate_class_plantuml(data):
-    plantuml_code = "@startuml\nskinparam classAttributeIconSize 0\n\n"
-    for cls in data['classes']:
-        plantuml_code += f"class {cls['name']} {{\n"
-        for attr in cls['attributes']:
-            plantuml_code += f"  {attr}\n"
-        for method in cls['methods']:
-            plantuml_code += f"  {method}\n"
-        plantuml_code += "}\n\n"
-    for relation in data['relationships']:
-        entity1 = relation[0]
-        entity2 = relation[1]
-        relation_type = relation[2]
-        multiplicity = relation[3]
-        if relation_type == "Inheritance":
-            plantuml_code += f"{entity1} <|-- {entity2}\n"
-        elif relation_type == "Association":
-            if '-' in multiplicity:
-                multiplicity_start, multiplicity_end = multiplicity.split('-')
-                plantuml_code += f"{entity1} \"{multiplicity_start}\" --> \"{multiplicity_end}\" {entity2}\n"
-            else:
-                plantuml_code += f"{entity1} --> {entity2}\n"
-        elif relation_type == "Aggregation":
-            plantuml_code += f"{entity1} o-- {entity2}\n"
-        elif relation_type == "Composition":
-            plantuml_code += f"{entity1} *-- {entity2}\n"
-    plantuml_code += "\n@enduml"
-    return plantuml_code
-
-def generate_sequence_plantuml(data):
-    plantuml_code = "@startuml\n"
-    for obj in data['objects']:
-        plantuml_code += f"participant {obj}\n"
-    for msg in data['messages']:
-        sender = msg[0]
-        receiver = msg[1]
-        message = msg[2]
-        plantuml_code += f"{sender} -> {receiver}: {message}\n"
-    plantuml_code += "@enduml"
-    return plantuml_code
-
-def generate_deployment_plantuml(data):
-    plantuml_code = "@startuml\n"
-    # Sinh node với alias và service/artifact đúng chuẩn
-    for component in data.get('components', []):
-        node_name = component['name']
-        plantuml_code += f'node "{node_name}" as {node_name} {{\n'
-        for service in component.get('services', []):
-            plantuml_code += f'  [{service}]\n'
-        plantuml_code += '}\n'
-    # Sinh kết nối giữa các node
-    for relation in data.get('relationships', []):
-        if len(relation) == 3:
-            plantuml_code += f'{relation[0]} --> {relation[1]} : {relation[2]}\n'
-        elif len(relation) == 2:
-            plantuml_code += f'{relation[0]} --> {relation[1]}\n'
-    plantuml_code += "@enduml"
-    return plantuml_code
-
-def generate_agile_process_plantuml():
-    """
-    Sinh PlantUML cho quy trình Agile/Scrum tổng quát của ứng dụng.
-    """
-    return '''@startuml
-!define RECTANGLE class
-RECTANGLE "Product Backlog" as Backlog
-RECTANGLE "Sprint Planning" as Planning
-RECTANGLE "Sprint Backlog" as SprintBacklog
-RECTANGLE "Daily Scrum" as Daily
-RECTANGLE "Sprint" as Sprint
-RECTANGLE "Increment" as Increment
-RECTANGLE "Sprint Review" as Review
-RECTANGLE "Sprint Retrospective" as Retro
-
-Backlog --> Planning : "Chọn user story"
-Planning --> SprintBacklog : "Lập kế hoạch sprint"
-SprintBacklog --> Sprint : "Thực hiện sprint"
-Sprint --> Daily : "Họp mỗi ngày"
-Sprint --> Increment : "Tạo sản phẩm hoàn chỉnh"
-Increment --> Review : "Trình bày sản phẩm"
-Review --> Retro : "Phản hồi & cải tiến"
-Retro --> Backlog : "Cập nhật backlog"
-@enduml'''
+def page_selector(total, key):
+    """Page picker shown only when ``total`` items do not fit on one page; returns the 0-based page."""
+    pages = page_count(total)
+    if pages == 1:
+        return 0
+    if st.session_state.get(key, 1) > pages:
+        st.session_state[key] = pages
+    return st.number_input(f"Trang (1–{pages})", min_value=1, max_value=pages, value=1, step=1, key=key) - 1
+
+def story_editor(stories_key, board, prefix, label):
+    """Thêm / sửa / xóa user story của ``st.session_state[stories_key]``, mỗi lần một trang."""
+    stories = st.session_state[stories_key]
+    st.write(f"### {label} User Stories ({len(stories)})")
+    # --- Thêm mới user story ---
+    with st.expander(f"➕ Thêm user story mới ({label})"):
+        new_story_text = st.text_area("Nhập nội dung user story mới", key=f"new_{prefix}_story")
+        if st.button(f"Thêm user story ({label})", key=f"add_{prefix}_story"):
+            if new_story_text.strip():
+                stories.append(new_story(new_story_text.strip(), board.stories))
+                st.success("Đã thêm user story mới!")
+                st.rerun()
+    # --- Sửa/Xóa user story ---
+    editing_key = f"editing_{prefix}_story"
+    page = page_selector(len(stories), key=f"story_page_{prefix}")
+    for story in page_slice(stories, page):
+        col1, col2, col3 = st.columns([7,1,1])
+        with col1:
+            st.write(story["text"])
+        with col2:
+            if st.button("✏️", key=f"edit_{prefix}_{story['id']}"):
+                st.session_state[editing_key] = story["id"]
+        with col3:
+            if st.button("🗑️", key=f"delete_{prefix}_{story['id']}"):
+                st.session_state[stories_key] = [s for s in stories if s["id"] != story["id"]]
+                st.success("Đã xóa user story!")
+                st.rerun()
+        # Hiển thị form sửa nếu đang chọn story này
+        if st.session_state.get(editing_key) == story["id"]:
+            new_text = st.text_area("Sửa nội dung user story", value=story["text"], key=f"edit_text_{prefix}_{story['id']}")
+            if st.button("Lưu", key=f"save_{prefix}_{story['id']}"):
+                story["text"] = new_text.strip()
+                st.session_state[editing_key] = None
+                st.success("Đã cập nhật user story!")
+                st.rerun()
+            if st.button("Hủy", key=f"cancel_{prefix}_{story['id']}"):
+                st.session_state[editing_key] = None
+                st.rerun()
+
+@st.fragment
+def kanban_board(board, tab_name):
+    """Kanban theo trang; chuyển trạng thái chỉ chạy lại fragment này, không chạy lại cả trang."""
+    st.write("## Kanban User Story Board")
+    first, last = board.statuses[0], board.statuses[-1]
+    for col, status in zip(st.columns(len(board.statuses)), board.statuses):
+        with col:
+            st.markdown(f"#### {status} ({board.count(status)})")
+            page = page_selector(board.count(status), key=f"kanban_page_{tab_name}_{status}")
+            for story in board.page(status, page):
+                st.write(story["text"])
+                col1, col2 = st.columns([1, 1])
+                with col1:
+                    if status != first:
+                        st.button("◀️", key=f"move_left_{story['id']}", on_click=board.shift, args=(story["id"], -1))
+                with col2:
+                    if status != last:
+                        st.button("▶️", key=f"move_right_{story['id']}", on_click=board.shift, args=(story["id"], 1))
+
+@st.fragment
+def sprint_manager(board, tab_name):
+    st.write("## Quản lý Sprint")
+    new_sprint = st.text_input(f"Tên Sprint mới ({tab_name})", key=f"new_sprint_name_{tab_name}")
+    if st.button(f"Tạo Sprint mới ({tab_name})"):
+        board.add_sprint(new_sprint)
+    options = list(board.stories)
+    for name in board.sprints:
+        st.markdown(f"### {name}")
+        selected_stories = st.multiselect(
+            f"Chọn user story cho {name}",
+            options=options,
+            format_func=board.label,
+            default=board.sprint_stories(name),
+            key=f"sprints_{tab_name}_{name}_stories"
+        )
+        board.set_sprint_stories(name, selected_stories)
+
+def story_tab(stories_key, prefix, label, tab_name):
+    """Quản lý user story, Kanban và Sprint của một tab; trả về danh sách user story."""
+    board = st.session_state.setdefault(f"board_{tab_name}", Board())
+    board.sync(st.session_state[stories_key])
+    story_editor(stories_key, board, prefix, label)
+    kanban_board(board, tab_name)
+    sprint_manager(board, tab_name)
+    return st.session_state[stories_key]
+
+# (kind trong project store, key user story trong session, tên tab của board)
+PROJECT_TABS = (
+    ("functional", "functional_stories", "Functional"),
+    ("non_functional", "non_functional_stories", "NonFunctional"),
+)
+
+def open_project(name):
+    """Nạp user story, board, sprint và mô hình đã sinh của project vào session; diagram chỉ đọc khi cần."""
+    version = get_project_store().open(name)
+    if version is None:
+        return False
+    for kind, stories_key, tab_name in PROJECT_TABS:
+        stories = version.stories(kind)
+        board = Board()
+        board.sync(stories)
+        for sid, status in version.statuses(kind).items():
+            if sid in board:
+                board.move(sid, status)
+        for sprint, ids in version.sprints(kind).items():
+            board.add_sprint(sprint)
+            board.set_sprint_stories(sprint, ids)
+        st.session_state[stories_key] = stories
+        st.session_state[f"board_{tab_name}"] = board
+    st.session_state["functional_model"] = version.state("functional_model")
+    st.session_state["project"] = version
+    return True
+
+def save_project(name, session_id, note=""):
+    """Lưu user story, board, sprint, mô hình và diagram của session thành một phiên bản mới của project."""
+    stories, statuses, sprints = {}, {}, {}
+    for kind, stories_key, tab_name in PROJECT_TABS:
+        stories[kind] = st.session_state.get(stories_key, [])
+        board = st.session_state.get(f"board_{tab_name}")
+        if board is not None:
+            statuses[kind] = dict(board.status)
+            sprints[kind] = {sprint: board.sprint_stories(sprint) for sprint in board.sprints}
+    state = {}
+    if st.session_state.get("functional_model"):
+        state["functional_model"] = st.session_state["functional_model"]
+    artifacts = get_artifact_store()
+    saved_artifacts = {a.name: (artifacts.get(session_id, a.name), a.mime) for a in artifacts.list(session_id)}
+    store = get_project_store()
+    version = store.save(name, stories, statuses, sprints, state, saved_artifacts, note)
+    st.session_state["project"] = store.open(name, version)
+    return version
+
+def autosave_project(session_id, note):
+    """Lưu kết quả vừa sinh vào project đang mở (nếu có) để session khác không phải gọi lại LLM."""
+    project = st.session_state.get("project")
+    if project is not None:
+        version = save_project(project.name, session_id, note)
+        st.caption(f"💾 Đã lưu vào project {project.name} (v{version})")
+
+def project_panel(session_id):
+    store = get_project_store()
+    current = st.session_state.get("project")
+    if current is not None:
+        st.caption(f"Đang mở: {current.name} (v{current.version})")
+    names = [project.name for project in store.list_projects()]
+    choice = st.selectbox("Mở project", [""] + names, format_func=lambda n: n or "—", key="project_choice")
+    if st.button("📂 Mở", disabled=not choice, key="open_project"):
+        open_project(choice)
+        st.rerun()
+    name = st.text_input("Lưu thành project", value=current.name if current is not None else "",
+                         key="project_save_name")
+    if st.button("💾 Lưu", disabled=not name.strip(), key="save_project"):
+        version = save_project(name.strip(), session_id, note="manual")
+        st.success(f"Đã lưu {name.strip()} (v{version})")
+        current = st.session_state["project"]
+    if current is not None:
+        saved = current.artifact_names()
+        if saved:
+            artifact_name = st.selectbox("Diagram đã lưu", list(saved), key="saved_artifact")
+            saved_artifact = current.artifact(artifact_name)
+            if saved_artifact is not None:
+                data, mime = saved_artifact
+                st.download_button("Tải diagram đã lưu", data, file_name=artifact_name, mime=mime,
+                                   key="download_saved_artifact", on_click="ignore")
 
 def main():
     st.set_page_config(
@@ -160,74 +497,103 @@ def main():
         initial_sidebar_state="expanded",
     )
     st.html("""<h1 style="text-align: center; color: #6ca395;">🤖 <i>The UML diagram Generator</i> 💬</h1>""")
+    # Mỗi session có namespace riêng trong artifact store
+    session_id = st.session_state.setdefault("session_id", str(uuid.uuid4()))
+    artifacts = get_artifact_store()
 
     with st.sidebar:
-        model_option = st.radio("Chọn AI Model", ["Anthropic Claude", "OpenAI GPT"])
-        openai_models = {
-            "GPT-4o": "gpt-4o-2024-08-06",
-            "GPT-4.1": "gpt-4.1-2025-04-14",
-            "GPT-4o Mini": "gpt-4o-mini",
-            "GPT-3.5 Turbo": "gpt-3.5-turbo"
-        }
-        anthropic_models = {
-            "Claude 3.7 Sonnet": "claude-3-7-sonnet-latest",
-            "Claude 3.5 Sonnet": "claude-3-5-sonnet-latest",
-            "Claude 3.5 Haiku": "claude-3-5-haiku-latest",
-        }
-        if model_option == "OpenAI GPT":
-            model_name = st.selectbox("Chọn model GPT", list(openai_models.keys()), index=0)
-            selected_model = openai_models[model_name]
+        provider_options = [ANTHROPIC, OPENAI]
+        if os.getenv("UML_ENABLE_FAKE_PROVIDER"):
+            # Provider giả lập, dùng để load-test toàn bộ pipeline khi offline
+            provider_options.append(FAKE)
+        model_option = st.radio("Chọn AI Model", provider_options)
+        if model_option == FAKE:
+            selected_model = MODELS[FAKE]["Fake"]
         else:
-            model_name = st.selectbox("Chọn model Claude", list(anthropic_models.keys()), index=0)
-            selected_model = anthropic_models[model_name]
+            model_name = st.selectbox("Chọn model GPT" if model_option == OPENAI else "Chọn model Claude",
+                                      list(MODELS[model_option].keys()), index=0)
+            selected_model = MODELS[model_option][model_name]
 
         default_anthropic_api_key = os.getenv("ANTHROPIC_API_KEY") or ""
         default_openai_api_key = os.getenv("OPENAI_API_KEY") or ""
         anthropic_api_key = ""
         openai_api_key = ""
-        if model_option == "Anthropic Claude":
+        if model_option == ANTHROPIC:
             with st.popover("🔐 Anthropic"):
                 anthropic_api_key = st.text_input(
                     "Introduce your Anthropic API Key (https://console.anthropic.com/)",
                     value=default_anthropic_api_key, type="password"
                 )
-        else:
+        elif model_option == OPENAI:
             with st.popover("🔐 OpenAI"):
                 openai_api_key = st.text_input(
                     "Introduce your OpenAI API Key (https://platform.openai.com/)",
                     value=default_openai_api_key, type="password"
                 )
 
+        renderer_mode = st.selectbox(
+            "PlantUML renderer",
+            list(RENDERER_MODES.keys()),
+            index=list(RENDERER_MODES.keys()).index(RENDERER_MODE),
+            help="remote: PlantUML server, local: plantuml.jar per diagram, pool: warm plantuml.jar processes",
+        )
+        renderer = warm_renderer(renderer_mode)
+
+        api_key = anthropic_api_key if model_option == ANTHROPIC else openai_api_key
+        stream_responses = st.toggle("Streaming (xem trước khi đang sinh)", value=True)
+        bypass_cache = st.toggle("Bỏ qua cache LLM (bypass cache)", value=False,
+                                 help="Luôn gọi lại model thay vì dùng kết quả đã lưu")
+        llm_config = LLMConfig(model_option, selected_model, api_key, bypass_cache)
+        with st.expander("🧠 LLM cache"):
+            st.json(get_response_cache().stats())
+
+        with st.expander("📦 Render cache"):
+            st.json(get_render_cache().stats())
+
+        with st.expander("🧵 Job queue"):
+            st.json(get_job_queue().stats())
+
+        with st.expander("📁 Project"):
+            project_panel(session_id)
+
+        with st.expander("⏱️ Thời gian khởi động / rerun"):
+            timing_slot = st.empty()
+
+        with st.expander("📊 Metrics"):
+            metrics_container = st.container()
+
     st.markdown("### Nhập danh sách User Story (mỗi dòng là một user story)")
     user_story_input = st.text_area("Nhập user story hoặc để trống để import từ file", height=200)
     uploaded_us_file = st.file_uploader("Import user story từ file .docx hoặc .txt", type=["docx", "txt"])
 
     user_stories = []
     if uploaded_us_file is not None:
-        if uploaded_us_file.type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-            doc = docx.Document(uploaded_us_file)
-            user_stories = assign_story_ids([para.text.strip() for para in doc.paragraphs if para.text.strip()])
-        elif uploaded_us_file.type == "text/plain":
-            content = uploaded_us_file.getvalue().decode("utf-8")
-            user_stories = assign_story_ids([line.strip() for line in content.splitlines() if line.strip()])
-        st.success(f"Đã import {len(user_stories)} user story từ file.")
+        ingested = ingest_upload(uploaded_us_file)
+        user_stories = ingested.stories
+        message = f"Đã import {len(user_stories)} user story từ file."
+        if ingested.duplicates:
+            message += f" Bỏ qua {ingested.duplicates} user story trùng lặp."
+        st.success(message)
     elif user_story_input.strip():
-        user_stories = assign_story_ids([line.strip() for line in user_story_input.splitlines() if line.strip()])
+        user_stories = split_story_lines(user_story_input)
     text = ""
     # ...sau khi phân loại...
     if user_stories:
-        st.write("### Danh sách User Story đã nhập:")
-        st.write(user_stories)
+        st.write(f"### Danh sách User Story đã nhập ({len(user_stories)}):")
+        # Chỉ gửi trang đang xem lên trình duyệt, không gửi cả backlog
+        page = page_selector(len(user_stories), "input_stories_page")
+        st.dataframe(page_slice(user_stories, page), hide_index=True)
 
         if st.button("Phân loại user story (Function/Non-Function)"):
-            with st.spinner("Đang phân loại..."):
-                result = classify_user_story([s["text"] for s in user_stories], selected_model, anthropic_api_key, openai_api_key)
-            st.session_state["functional_stories"] = assign_story_ids(result.get("Functional", []))
-            st.session_state["non_functional_stories"] = assign_story_ids(result.get("Non-Functional", []))
-            st.write("### Functional User Stories (JSON)")
-            st.json(st.session_state["functional_stories"])
-            st.write("### Non-Functional User Stories (JSON)")
-            st.json(st.session_state["non_functional_stories"])
+            progress = st.progress(0.0, text="Đang phân loại...")
+            def report_progress(done, total):
+                progress.progress(done / total if total else 1.0, text=f"Đang phân loại... {done}/{total} batch")
+            functional, non_functional = classify(user_stories, llm_config, progress_callback=report_progress)
+            progress.empty()
+            st.session_state["functional_stories"] = functional
+            st.session_state["non_functional_stories"] = non_functional
+            st.success(f"Đã phân loại: {len(functional)} Functional, {len(non_functional)} Non-Functional "
+                       "(xem và chỉnh sửa trong từng tab bên dưới).")
 
     # Đảm bảo functional_stories và non_functional_stories luôn tồn tại trong session_state
     if "functional_stories" not in st.session_state:
@@ -239,334 +605,143 @@ def main():
     tab1, tab2 = st.tabs(["Chức năng (Functional)", "Phi chức năng (Non-Functional)"])
     # --- Tab 1: Functional ---
     with tab1:
-        functional_stories = st.session_state.get("functional_stories", [])
-        st.write("### Functional User Stories")
-        st.json(functional_stories)
-        # --- Thêm mới user story ---
-        with st.expander("➕ Thêm user story mới (Functional)"):
-            new_story_text = st.text_area("Nhập nội dung user story mới", key="new_func_story")
-            if st.button("Thêm user story (Functional)", key="add_func_story"):
-                if new_story_text.strip():
-                    new_story = {"id": str(uuid.uuid4()), "text": new_story_text.strip()}
-                    st.session_state["functional_stories"].append(new_story)
-                    st.success("Đã thêm user story mới!")
-                    st.rerun()
-        # --- Sửa/Xóa user story ---
-        for story in functional_stories:
-            col1, col2, col3 = st.columns([7,1,1])
-            with col1:
-                st.write(story["text"])
-            with col2:
-                if st.button("✏️", key=f"edit_func_{story['id']}"):
-                    st.session_state["editing_func_story"] = story["id"]
-            with col3:
-                if st.button("🗑️", key=f"delete_func_{story['id']}"):
-                    st.session_state["functional_stories"] = [s for s in functional_stories if s["id"] != story["id"]]
-                    st.success("Đã xóa user story!")
-                    st.rerun()
-            # Hiển thị form sửa nếu đang chọn story này
-            if st.session_state.get("editing_func_story") == story["id"]:
-                new_text = st.text_area("Sửa nội dung user story", value=story["text"], key=f"edit_text_func_{story['id']}")
-                if st.button("Lưu", key=f"save_func_{story['id']}"):
-                    for s in st.session_state["functional_stories"]:
-                        if s["id"] == story["id"]:
-                            s["text"] = new_text.strip()
-                    st.session_state["editing_func_story"] = None
-                    st.success("Đã cập nhật user story!")
-                    st.rerun()
-                if st.button("Hủy", key=f"cancel_func_{story['id']}"):
-                    st.session_state["editing_func_story"] = None
-                    st.rerun()
-        # Tạo Kanban và Sprint
-        tab_name = "Functional"
-        stories = functional_stories
-        status_options = ["To Do", "In Progress", "Done"]
-        us_key = f"us_status_{tab_name}"
-        if us_key not in st.session_state:
-            st.session_state[us_key] = {story["id"]: "To Do" for story in stories}
-        for story in stories:
-            if story["id"] not in st.session_state[us_key]:
-                st.session_state[us_key][story["id"]] = "To Do"
-        st.write("## Kanban User Story Board")
-        cols = st.columns(3)
-        for idx, status in enumerate(status_options):
-            with cols[idx]:
-                st.markdown(f"#### {status}")
-                for story in [s for s in stories if st.session_state[us_key].get(s["id"]) == status]:
-                    st.write(story["text"])
-                    col1, col2 = st.columns([1, 1])
-                    with col1:
-                        if status != "To Do" and st.button("◀️", key=f"move_left_{story['id']}"):
-                            prev_status = status_options[status_options.index(status) - 1]
-                            st.session_state[us_key][story["id"]] = prev_status
-                            st.rerun()
-                    with col2:
-                        if status != "Done" and st.button("▶️", key=f"move_right_{story['id']}"):
-                            next_status = status_options[status_options.index(status) + 1]
-                            st.session_state[us_key][story["id"]] = next_status
-                            st.rerun()
-        st.write("## Quản lý Sprint")
-        sprint_key = f"sprints_{tab_name}"
-        if sprint_key not in st.session_state:
-            st.session_state[sprint_key] = []
-        new_sprint = st.text_input(f"Tên Sprint mới ({tab_name})", key=f"new_sprint_name_{tab_name}")
-        if st.button(f"Tạo Sprint mới ({tab_name})"):
-            if new_sprint and new_sprint not in [s["name"] for s in st.session_state[sprint_key]]:
-                st.session_state[sprint_key].append({"name": new_sprint, "stories": []})
-        for sprint in st.session_state[sprint_key]:
-            st.markdown(f"### {sprint['name']}")
-            selected_stories = st.multiselect(
-                f"Chọn user story cho {sprint['name']}",
-                options=[s["id"] for s in stories],
-                format_func=lambda sid: next((s["text"] for s in stories if s["id"] == sid), sid),
-                default=sprint["stories"],
-                key=f"{sprint_key}_{sprint['name']}_stories"
-            )
-            sprint["stories"] = selected_stories
+        stories = story_tab("functional_stories", "func", "Functional", "Functional")
+        incremental = st.checkbox(
+            "Chỉ sinh lại phần thay đổi (incremental)", value=True, key="incremental_functional",
+            help="Gửi cho model chỉ các user story đã thêm/sửa/xóa so với lần sinh trước",
+        )
         if st.button("🤖 Generate UML Diagram (Functional)"):
-            prompt_stories = [s["text"] for s in stories]
-            prompt = f"""
-                json{prompt_stories}
-
-                Bạn là chuyên gia phân tích hệ thống phần mềm. Hãy thực hiện các bước sau và chỉ trả về một đối tượng JSON duy nhất với 2 trường: \"class\", \"sequence\". 
-                **YÊU CẦU BẮT BUỘC:** Mỗi trường trong JSON phải luôn có đầy đủ các trường con như mô tả dưới đây, kể cả khi không có dữ liệu thì trả về mảng rỗng.
-
-                **PHẦN 1: Class Diagram**
-                - Liệt kê tất cả các class, thuộc tính, phương thức.
-                - Liệt kê tất cả các mối quan hệ giữa các class (Association, Aggregation, Composition, Inheritance).
-                - Mỗi quan hệ phải có trường \"RelationshipType\" (ví dụ: Association, Aggregation, ...), và \"Multiplicity\" (ví dụ: 1-1, 1-n, n-n, hoặc rỗng nếu không xác định).
-                - Nếu không có mối quan hệ nào, trả về \"relationships\": [].
-                Trả về JSON:
-                \"class\": {{
-                    \"classes\": [
-                        {{
-                            \"name\": \"ClassName\",
-                            \"attributes\": [...],
-                            \"methods\": [...]
-                        }},
-                        ...
-                    ],
-                    \"relationships\": [
-                        [\"Class1\", \"Class2\", \"RelationshipType\", \"Multiplicity\"],
-                        ...
-                    ]
-                }}
-
-                **PHẦN 2: Sequence Diagram**
-                - Liệt kê các đối tượng (objects/lifelines) tham gia vào kịch bản chính.
-                - Liệt kê các thông điệp (messages) trao đổi giữa các đối tượng theo thứ tự thời gian.
-                - Nếu không có đối tượng hoặc thông điệp nào, trả về mảng rỗng.
-                Trả về JSON:
-                \"sequence\": {{
-                    \"objects\": [...],
-                    \"messages\": [[\"Sender\", \"Receiver\", \"Message\"], ...]
-                }}
-
-                **LƯU Ý QUAN TRỌNG:**  
-                - JSON trả về phải luôn có đầy đủ các trường như trên, kể cả khi không có dữ liệu thì trả về mảng rỗng.
-                - Không được bỏ sót bất kỳ trường nào.
-                - Không trả về giải thích, chỉ trả về đúng một đối tượng JSON duy nhất theo cấu trúc trên.
-                """
-            if model_option == "Anthropic Claude":
-                client = anthropic.Client(api_key=anthropic_api_key)
-                message = client.messages.create(
-                    model=selected_model,
-                    max_tokens=8096,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=1,
-                )
-                response_text = message.content[0].text
-            else:
-                openai.api_key = openai_api_key
-                response = openai.chat.completions.create(
-                    model=selected_model,
-                    messages=[{"role": "user", "content": prompt}],
-                    max_tokens=11000,
-                    temperature=0.1,
-                )
-                response_text = response.choices[0].message.content
-            match = re.search(r'```json\n(.*?)\n```', response_text, re.DOTALL)
-            data = json.loads(match.group(1)) if match else json.loads(response_text)
-            class_data = data["class"]
-            sequence_data = data["sequence"]
+            previous_model = st.session_state.get("functional_model") if incremental else None
+            # Cùng user story, model, API key và mô hình trước thì dùng chung một job đang chạy
+            key = job_key("functional", stories, model_option, selected_model, api_key, bypass_cache, previous_model,
+                          display_formats(), renderer_mode)
+            submit_job("functional", session_id, key, functional_job, [dict(s) for s in stories], llm_config,
+                       previous_model, stream_responses, renderer)
+        job = current_job("functional")
+        if job is not None and not job.done:
+            job_progress("functional", functional_preview)
+        elif job is not None and job.status == FAILED:
+            st.error(f"Không sinh được diagram: {job.error}")
+        elif job is not None and job.status == DONE:
+            mode, story_diff, diagrams, exports = (job.result["mode"], job.result["story_diff"],
+                                                   job.result["diagrams"], job.result["exports"])
+            if st.session_state.get("applied_functional") != job.id:
+                # Lưu mô hình để lần sinh sau chỉ cần gửi phần thay đổi
+                st.session_state["functional_model"] = job.result["state"]
+            if mode == "reuse":
+                st.info("Không có user story nào thay đổi, dùng lại mô hình trước.")
+            elif mode == "delta":
+                st.info(f"Sinh tăng dần: {len(story_diff['added'])} thêm, {len(story_diff['edited'])} sửa, "
+                        f"{len(story_diff['deleted'])} xóa.")
+            class_model, partition = diagrams.class_model, diagrams.partition
             st.write("### Class Diagram Data (JSON)")
-            st.json(class_data)
+            st.json(job.result["state"]["class"])
             st.write("### Sequence Diagram Data (JSON)")
-            st.json(sequence_data)
-            plantuml_class = generate_class_plantuml(class_data)
-            plantuml_sequence = generate_sequence_plantuml(sequence_data)
-            plantuml_server = "http://www.plantuml.com/plantuml/png/"
-            plantuml = PlantUML(url=plantuml_server)
+            st.json(job.result["state"]["sequence"])
+            plantuml_class = diagrams.sources["class"]
+            plantuml_sequence = diagrams.sources["sequence"]
+            # Diagram quá lớn để render một lần được chia thành tổng quan và từng cụm
+            class_diagrams = {name: diagrams.sources[name] for name in render_targets(diagrams.sources)
+                              if name != "sequence"}
             st.write("## Class Diagram")
             st.code(plantuml_class, language="uml")
-            uml_file_cl = "diagram_class.puml"
-            with open(uml_file_cl, "w", encoding="utf-8") as f:
-                f.write(plantuml_class)
-            plantuml.processes_file(uml_file_cl)
-            uml_image_file_cl = "diagram_class.png"
-            plantuml.processes_file(uml_file_cl, outfile=uml_image_file_cl)
-            st.image(uml_image_file_cl, caption="Generated Class Diagram")
+            if len(partition.clusters) > 1:
+                st.info(f"Class diagram có {len(class_model.classes)} class, được chia thành "
+                        f"{len(partition.clusters)} cụm và một diagram tổng quan.")
+            render_slots = {}
+            for name in class_diagrams:
+                render_slots[name] = (st.empty(), f"diagram_{name}.png", diagram_label(name))
             st.write("## Sequence Diagram")
             st.code(plantuml_sequence, language="uml")
+            render_slots["sequence"] = (st.empty(), "diagram_sequence.png", diagram_label("sequence"))
+            uml_file_cl = "diagram_class.puml"
+            artifacts.put(session_id, uml_file_cl, plantuml_class, "text/plain")
             uml_file_sq = "diagram_sequence.puml"
-            with open(uml_file_sq, "w", encoding="utf-8") as f:
-                f.write(plantuml_sequence)
-            plantuml.processes_file(uml_file_sq)
-            uml_image_file_sq = "diagram_sequence.png"
-            plantuml.processes_file(uml_file_sq, outfile=uml_image_file_sq)
-            st.image(uml_image_file_sq, caption="Generated Sequence Diagram")
+            artifacts.put(session_id, uml_file_sq, plantuml_sequence, "text/plain")
+            puml_files = [uml_file_cl, uml_file_sq]
+            if len(partition.clusters) > 1:
+                for name, source in class_diagrams.items():
+                    artifacts.put(session_id, f"diagram_{name}.puml", source, "text/plain")
+                    puml_files.append(f"diagram_{name}.puml")
+            rendered = {}
+            for name, result in exports.items():
+                slot, _, label = render_slots[name]
+                rendered[name] = store_export(session_id, result)
+                show_export(slot, result, label)
             st.write("## Download PlantUML files")
-            st.markdown(f'<a href="data:file/txt;base64,{file_to_base64(uml_file_cl).decode()}" download="{uml_file_cl}">Download Class PlantUML</a>', unsafe_allow_html=True)
-            st.markdown(f'<a href="data:file/txt;base64,{file_to_base64(uml_file_sq).decode()}" download="{uml_file_sq}">Download Sequence PlantUML</a>', unsafe_allow_html=True)
+            artifact_download_button("Download Class PlantUML", session_id, uml_file_cl)
+            artifact_download_button("Download Sequence PlantUML", session_id, uml_file_sq)
             st.write("## Download Images")
-            st.markdown(f'<a href="data:image/png;base64,{file_to_base64(uml_image_file_cl).decode()}" download="{uml_image_file_cl}">Download Class Image</a>', unsafe_allow_html=True)
-            st.markdown(f'<a href="data:image/png;base64,{file_to_base64(uml_image_file_sq).decode()}" download="{uml_image_file_sq}">Download Sequence Image</a>', unsafe_allow_html=True)
+            for name, (_, image_file, label) in render_slots.items():
+                if image_file in rendered.get(name, []):
+                    artifact_download_button(f"Download {label} Image", session_id, image_file)
+            image_files = [file for files in rendered.values() for file in files]
+            bundle_download_button("Download All (.zip)", session_id, puml_files + image_files,
+                                   "diagram_functional.zip")
+            remember_export("functional", puml_files + image_files)
+            if st.session_state.get("applied_functional") != job.id:
+                st.session_state["applied_functional"] = job.id
+                autosave_project(session_id, "functional")
 
     # --- Tab 2: Non-Functional ---
     with tab2:
-        non_functional_stories = st.session_state.get("non_functional_stories", [])
-        st.write("### Non-Functional User Stories")
-        st.json(non_functional_stories)
-        # --- Thêm mới user story ---
-        with st.expander("➕ Thêm user story mới (Non-Functional)"):
-            new_story_text_nf = st.text_area("Nhập nội dung user story mới", key="new_nonfunc_story")
-            if st.button("Thêm user story (Non-Functional)", key="add_nonfunc_story"):
-                if new_story_text_nf.strip():
-                    new_story = {"id": str(uuid.uuid4()), "text": new_story_text_nf.strip()}
-                    st.session_state["non_functional_stories"].append(new_story)
-                    st.success("Đã thêm user story mới!")
-                    st.rerun()
-        # --- Sửa/Xóa user story ---
-        for story in non_functional_stories:
-            col1, col2, col3 = st.columns([7,1,1])
-            with col1:
-                st.write(story["text"])
-            with col2:
-                if st.button("✏️", key=f"edit_nonfunc_{story['id']}"):
-                    st.session_state["editing_nonfunc_story"] = story["id"]
-            with col3:
-                if st.button("🗑️", key=f"delete_nonfunc_{story['id']}"):
-                    st.session_state["non_functional_stories"] = [s for s in non_functional_stories if s["id"] != story["id"]]
-                    st.success("Đã xóa user story!")
-                    st.rerun()
-            # Hiển thị form sửa nếu đang chọn story này
-            if st.session_state.get("editing_nonfunc_story") == story["id"]:
-                new_text = st.text_area("Sửa nội dung user story", value=story["text"], key=f"edit_text_nonfunc_{story['id']}")
-                if st.button("Lưu", key=f"save_nonfunc_{story['id']}"):
-                    for s in st.session_state["non_functional_stories"]:
-                        if s["id"] == story["id"]:
-                            s["text"] = new_text.strip()
-                    st.session_state["editing_nonfunc_story"] = None
-                    st.success("Đã cập nhật user story!")
-                    st.rerun()
-                if st.button("Hủy", key=f"cancel_nonfunc_{story['id']}"):
-                    st.session_state["editing_nonfunc_story"] = None
-                    st.rerun()
-        # Tạo Kanban và Sprint
-        tab_name = "NonFunctional"
-        stories = non_functional_stories
-        status_options = ["To Do", "In Progress", "Done"]
-        us_key = f"us_status_{tab_name}"
-        if us_key not in st.session_state:
-            st.session_state[us_key] = {story["id"]: "To Do" for story in stories}
-        for story in stories:
-            if story["id"] not in st.session_state[us_key]:
-                st.session_state[us_key][story["id"]] = "To Do"
-        st.write("## Kanban User Story Board")
-        cols = st.columns(3)
-        for idx, status in enumerate(status_options):
-            with cols[idx]:
-                st.markdown(f"#### {status}")
-                for story in [s for s in stories if st.session_state[us_key].get(s["id"]) == status]:
-                    st.write(story["text"])
-                    col1, col2 = st.columns([1, 1])
-                    with col1:
-                        if status != "To Do" and st.button("◀️", key=f"move_left_{story['id']}"):
-                            prev_status = status_options[status_options.index(status) - 1]
-                            st.session_state[us_key][story["id"]] = prev_status
-                            st.rerun()
-                    with col2:
-                        if status != "Done" and st.button("▶️", key=f"move_right_{story['id']}"):
-                            next_status = status_options[status_options.index(status) + 1]
-                            st.session_state[us_key][story["id"]] = next_status
-                            st.rerun()
-        st.write("## Quản lý Sprint")
-        sprint_key = f"sprints_{tab_name}"
-        if sprint_key not in st.session_state:
-            st.session_state[sprint_key] = []
-        new_sprint = st.text_input(f"Tên Sprint mới ({tab_name})", key=f"new_sprint_name_{tab_name}")
-        if st.button(f"Tạo Sprint mới ({tab_name})"):
-            if new_sprint and new_sprint not in [s["name"] for s in st.session_state[sprint_key]]:
-                st.session_state[sprint_key].append({"name": new_sprint, "stories": []})
-        for sprint in st.session_state[sprint_key]:
-            st.markdown(f"### {sprint['name']}")
-            selected_stories = st.multiselect(
-                f"Chọn user story cho {sprint['name']}",
-                options=[s["id"] for s in stories],
-                format_func=lambda sid: next((s["text"] for s in stories if s["id"] == sid), sid),
-                default=sprint["stories"],
-                key=f"{sprint_key}_{sprint['name']}_stories"
-            )
-            sprint["stories"] = selected_stories
+        stories = story_tab("non_functional_stories", "nonfunc", "Non-Functional", "NonFunctional")
         if st.button("🤖 Generate Deployment Diagram (Non-Functional)"):
-            prompt_stories = [s["text"] for s in stories]
-            deployment_prompt = f"""
-            {prompt_stories}\n\nBạn là chuyên gia phân tích hệ thống phần mềm. Hãy phân tích các yêu cầu phi chức năng trên và trả về một đối tượng JSON duy nhất mô tả deployment diagram với các trường sau:\n\n{{\n  \"components\": [{{\"name\": \"NodeName\", \"services\": [\"Service1\", ...]}}, ...],\n  \"relationships\": [[\"Node1\", \"Node2\", \"Kết nối hoặc giao thức\"], ...]\n}}\n\n- Luôn trả về đầy đủ các trường như trên, kể cả khi không có dữ liệu thì trả về mảng rỗng.\n- Không giải thích, chỉ trả về đúng một đối tượng JSON duy nhất.\n"""
-            if model_option == "Anthropic Claude":
-                client = anthropic.Client(api_key=anthropic_api_key)
-                message = client.messages.create(
-                    model=selected_model,
-                    max_tokens=8096,
-                    messages=[{"role": "user", "content": deployment_prompt}],
-                    temperature=1,
-                )
-                deployment_response_text = message.content[0].text
-            else:
-                openai.api_key = openai_api_key
-                deployment_response = openai.chat.completions.create(
-                    model=selected_model,
-                    messages=[{"role": "user", "content": deployment_prompt}],
-                    max_tokens=4096,
-                    temperature=0.1,
-                )
-                deployment_response_text = deployment_response.choices[0].message.content
-            match_dep = re.search(r'```json\n(.*?)\n```', deployment_response_text, re.DOTALL)
-            deployment_data = json.loads(match_dep.group(1)) if match_dep else json.loads(deployment_response_text)
+            key = job_key("deployment", stories, model_option, selected_model, api_key, bypass_cache,
+                          display_formats(), renderer_mode)
+            submit_job("deployment", session_id, key, deployment_job, [dict(s) for s in stories], llm_config,
+                       stream_responses, renderer)
+        job = current_job("deployment")
+        if job is not None and not job.done:
+            job_progress("deployment", deployment_preview)
+        elif job is not None and job.status == FAILED:
+            st.error(f"Không sinh được diagram: {job.error}")
+        elif job is not None and job.status == DONE:
+            deployment_model, result = job.result["model"], job.result["export"]
             st.write("### Deployment Diagram Data (JSON)")
-            st.json(deployment_data)
-            plantuml_deployment = generate_deployment_plantuml(deployment_data)
-            plantuml_server = "http://www.plantuml.com/plantuml/png/"
-            plantuml = PlantUML(url=plantuml_server)
+            st.json(deployment_model.to_dict())
+            plantuml_deployment = job.result["source"]
             st.write("## Deployment Diagram")
             st.code(plantuml_deployment, language="uml")
             uml_file_dp = "diagram_deployment.puml"
-            with open(uml_file_dp, "w", encoding="utf-8") as f:
-                f.write(plantuml_deployment)
-            plantuml.processes_file(uml_file_dp)
+            artifacts.put(session_id, uml_file_dp, plantuml_deployment, "text/plain")
             uml_image_file_dp = "diagram_deployment.png"
-            plantuml.processes_file(uml_file_dp, outfile=uml_image_file_dp)
-            st.image(uml_image_file_dp, caption="Generated Deployment Diagram")
+            image_files_dp = store_export(session_id, result)
+            show_export(st.empty(), result, "Deployment")
             st.write("## Download PlantUML file")
-            st.markdown(f'<a href="data:file/txt;base64,{file_to_base64(uml_file_dp).decode()}" download="{uml_file_dp}">Download Deployment PlantUML</a>', unsafe_allow_html=True)
+            artifact_download_button("Download Deployment PlantUML", session_id, uml_file_dp)
             st.write("## Download Image")
-            st.markdown(f'<a href="data:image/png;base64,{file_to_base64(uml_image_file_dp).decode()}" download="{uml_image_file_dp}">Download Deployment Image</a>', unsafe_allow_html=True)
+            artifact_download_button("Download Deployment Image", session_id, uml_image_file_dp)
+            bundle_download_button("Download All (.zip)", session_id, [uml_file_dp] + image_files_dp, "diagram_deployment.zip")
+            remember_export("non_functional", [uml_file_dp] + image_files_dp)
+            if st.session_state.get("applied_deployment") != job.id:
+                st.session_state["applied_deployment"] = job.id
+                autosave_project(session_id, "deployment")
         if st.button("🤖 Show Agile Process Diagram"):
             agile_plantuml = generate_agile_process_plantuml()
-            plantuml_server = "http://www.plantuml.com/plantuml/png/"
-            plantuml = PlantUML(url=plantuml_server)
             st.write("## Agile Process Diagram (Scrum)")
             st.code(agile_plantuml, language="uml")
             uml_file_agile = "diagram_agile.puml"
-            with open(uml_file_agile, "w", encoding="utf-8") as f:
-                f.write(agile_plantuml)
-            plantuml.processes_file(uml_file_agile)
+            artifacts.put(session_id, uml_file_agile, agile_plantuml, "text/plain")
             uml_image_file_agile = "diagram_agile.png"
-            plantuml.processes_file(uml_file_agile, outfile=uml_image_file_agile)
-            st.image(uml_image_file_agile, caption="Agile/Scrum Process")
+            result = export_diagram("agile", agile_plantuml, display_formats(), renderer=renderer)
+            image_files_agile = store_export(session_id, result)
+            show_export(st.empty(), result, "Agile/Scrum Process")
             st.write("## Download PlantUML file")
-            st.markdown(f'<a href="data:file/txt;base64,{file_to_base64(uml_file_agile).decode()}" download="{uml_file_agile}">Download Agile PlantUML</a>', unsafe_allow_html=True)
+            artifact_download_button("Download Agile PlantUML", session_id, uml_file_agile)
             st.write("## Download Image")
-            st.markdown(f'<a href="data:image/png;base64,{file_to_base64(uml_image_file_agile).decode()}" download="{uml_image_file_agile}">Download Agile Image</a>', unsafe_allow_html=True)
+            artifact_download_button("Download Agile Image", session_id, uml_image_file_agile)
+            bundle_download_button("Download All (.zip)", session_id, [uml_file_agile] + image_files_agile, "diagram_agile.zip")
+            remember_export("agile", [uml_file_agile] + image_files_agile)
+
+    if st.session_state.get("export_groups"):
+        st.write("## Export")
+        export_bundle_button(session_id, renderer)
+
+    report_run_timing(timing_slot)
+    report_metrics(metrics_container)
 
 if __name__ == "__main__":
-    main()
+    # Đặt UML_METRICS_PROFILE_DIR để ghi cProfile của từng lần chạy script
+    with profiled("app"):
+        main()
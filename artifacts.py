@@ -0,0 +1,228 @@
+"""Per-session, content-addressed store for generated artifacts (PlantUML sources, images)."""
+import hashlib
+import io
+import os
+import threading
+import zipfile
+from collections import OrderedDict, namedtuple
+
+ARTIFACT_MEMORY_BYTES = int(os.getenv("UML_ARTIFACT_MEMORY_BYTES", 256 * 1024 * 1024))
+ARTIFACT_SPILL_DIR = os.getenv("UML_ARTIFACT_SPILL_DIR") or None
+ARTIFACT_MAX_SESSIONS = int(os.getenv("UML_ARTIFACT_MAX_SESSIONS", 500))
+
+Artifact = namedtuple("Artifact", ["name", "mime", "digest", "size"])
+
+
+class ArtifactStore:
+    """Keep generated files in memory, keyed by session and content hash.
+
+    Each session has its own namespace of artifact names, so concurrent users
+    never overwrite each other. Identical bytes are stored once and shared
+    between sessions. When memory use exceeds ``max_memory_bytes`` and a
+    ``spill_dir`` is configured, the least recently used blobs are moved to
+    disk and read back on demand. The least recently active sessions are
+    dropped beyond ``max_sessions``.
+    """
+
+    def __init__(self, max_memory_bytes=ARTIFACT_MEMORY_BYTES, spill_dir=ARTIFACT_SPILL_DIR,
+                 max_sessions=ARTIFACT_MAX_SESSIONS):
+        self.max_memory_bytes = max_memory_bytes
+        self.spill_dir = spill_dir
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._blobs = OrderedDict()
+        self._spilled = set()
+        self._refcounts = {}
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+
+    def put(self, session_id, name, data, mime="application/octet-stream"):
+        """Store ``data`` as ``name`` for the session and return its Artifact."""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        artifact = Artifact(name, mime, digest, len(data))
+        with self._lock:
+            artifacts = self._touch_session(session_id)
+            previous = artifacts.get(name)
+            if previous is not None and previous.digest == digest:
+                return previous
+            self._retain(digest, data)
+            artifacts[name] = artifact
+            if previous is not None:
+                self._release(previous.digest)
+            self._spill()
+        return artifact
+
+    def get(self, session_id, name):
+        """Return the bytes of a session's artifact, or None if it does not exist."""
+        with self._lock:
+            artifact = self._sessions.get(session_id, {}).get(name)
+            if artifact is None:
+                return None
+            self._sessions.move_to_end(session_id)
+            return self._read(artifact.digest)
+
+    def open(self, session_id, name):
+        """Return an in-memory binary file object over a session's artifact.
+
+        In-memory blobs are wrapped without copying; a spilled blob is read
+        back whole, so no file handle is left open for the caller to close.
+        """
+        with self._lock:
+            artifact = self._sessions.get(session_id, {}).get(name)
+            if artifact is None:
+                return None
+            self._sessions.move_to_end(session_id)
+            return io.BytesIO(self._read(artifact.digest))
+
+    def bundle(self, session_id, names=None):
+        """Return a BytesIO zip of the session's artifacts (all of them when ``names`` is None)."""
+        if names is None:
+            names = [artifact.name for artifact in self.list(session_id)]
+        buffer = io.BytesIO()
+        for chunk in stream_zip((name, self.get(session_id, name)) for name in names):
+            buffer.write(chunk)
+        buffer.seek(0)
+        return buffer
+
+    def info(self, session_id, name):
+        with self._lock:
+            return self._sessions.get(session_id, {}).get(name)
+
+    def list(self, session_id):
+        """Return the session's artifacts in insertion order."""
+        with self._lock:
+            return list(self._sessions.get(session_id, {}).values())
+
+    def drop_session(self, session_id):
+        with self._lock:
+            for artifact in self._sessions.pop(session_id, {}).values():
+                self._release(artifact.digest)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "blobs": len(self._refcounts),
+                "memory_blobs": len(self._blobs),
+                "memory_bytes": self._memory_bytes,
+                "spilled_blobs": len(self._spilled),
+            }
+
+    def _touch_session(self, session_id):
+        artifacts = self._sessions.get(session_id)
+        if artifacts is None:
+            artifacts = self._sessions[session_id] = {}
+            while len(self._sessions) > self.max_sessions:
+                _, dropped = self._sessions.popitem(last=False)
+                for artifact in dropped.values():
+                    self._release(artifact.digest)
+        self._sessions.move_to_end(session_id)
+        return artifacts
+
+    def _retain(self, digest, data):
+        count = self._refcounts.get(digest, 0)
+        self._refcounts[digest] = count + 1
+        if count == 0:
+            self._blobs[digest] = data
+            self._memory_bytes += len(data)
+
+    def _release(self, digest):
+        count = self._refcounts.get(digest, 0) - 1
+        if count > 0:
+            self._refcounts[digest] = count
+            return
+        self._refcounts.pop(digest, None)
+        data = self._blobs.pop(digest, None)
+        if data is not None:
+            self._memory_bytes -= len(data)
+        if digest in self._spilled:
+            self._spilled.discard(digest)
+            try:
+                os.remove(self._spill_path(digest))
+            except OSError:
+                pass
+
+    def _read(self, digest):
+        data = self._blobs.get(digest)
+        if data is not None:
+            self._blobs.move_to_end(digest)
+            return data
+        with open(self._spill_path(digest), "rb") as f:
+            return f.read()
+
+    def _spill_path(self, digest):
+        return os.path.join(self.spill_dir, digest)
+
+    def _spill(self):
+        if not self.spill_dir:
+            return
+        while self._memory_bytes > self.max_memory_bytes and self._blobs:
+            digest, data = self._blobs.popitem(last=False)
+            with open(self._spill_path(digest), "wb") as f:
+                f.write(data)
+            self._spilled.add(digest)
+            self._memory_bytes -= len(data)
+
+
+class _ChunkWriter:
+    """Write-only, unseekable sink that hands written bytes back in chunks."""
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+# Already-compressed formats are stored as-is instead of being deflated again.
+_STORED_EXTENSIONS = (".png", ".pdf", ".zip")
+
+
+def stream_zip(entries):
+    """Yield a zip archive of ``(name, bytes)`` entries chunk by chunk.
+
+    Only one entry is held at a time, so the archive never exists in memory
+    as a whole. Entries whose bytes are None are skipped.
+    """
+    sink = _ChunkWriter()
+    with zipfile.ZipFile(sink, "w") as archive:
+        for name, data in entries:
+            if data is None:
+                continue
+            if isinstance(data, str):
+                data = data.encode("utf-8")
+            compression = zipfile.ZIP_STORED if name.lower().endswith(_STORED_EXTENSIONS) else zipfile.ZIP_DEFLATED
+            archive.writestr(zipfile.ZipInfo(name), data, compress_type=compression)
+            yield sink.drain()
+    yield sink.drain()
+
+
+_artifact_store = None
+_artifact_store_lock = threading.Lock()
+
+
+def get_artifact_store():
+    """Return the process-wide artifact store shared by all sessions."""
+    global _artifact_store
+    with _artifact_store_lock:
+        if _artifact_store is None:
+            _artifact_store = ArtifactStore()
+        return _artifact_store
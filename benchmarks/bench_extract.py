@@ -0,0 +1,75 @@
+"""Measure the parse success rate and speed of JSON extraction over a corpus of LLM responses.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_extract [--corpus benchmarks/corpus] [--repeat 200]
+
+Corpus files are named ``<kind>--<description>.txt`` where ``kind`` is one
+of the keys of ``extract.VALIDATORS``. Each file is scored for the legacy
+``re.search`` + ``json.loads`` path and for ``extract.parse_response``
+(without the repair retry, which needs a model).
+"""
+import argparse
+import json
+import os
+import re
+import time
+
+from extract import ExtractionError, VALIDATORS, parse_response
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), "corpus")
+
+
+def legacy_parse(text, kind):
+    match = re.search(r'```json\n(.*?)\n```', text, re.DOTALL)
+    data = json.loads(match.group(1)) if match else json.loads(text)
+    if VALIDATORS[kind](data):
+        raise ValueError("schema")
+    return data
+
+
+def load_corpus(corpus_dir):
+    corpus = []
+    for name in sorted(os.listdir(corpus_dir)):
+        if not name.endswith(".txt") or "--" not in name:
+            continue
+        kind = name.split("--", 1)[0]
+        with open(os.path.join(corpus_dir, name), encoding="utf-8", newline="") as f:
+            corpus.append((name, kind, f.read()))
+    return corpus
+
+
+def score(parse, corpus, repeat):
+    results = {}
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for name, kind, text in corpus:
+            try:
+                parse(text, kind)
+                results[name] = True
+            except (ValueError, ExtractionError, KeyError, TypeError):
+                results[name] = False
+    elapsed = time.perf_counter() - start
+    return results, elapsed / (repeat * len(corpus))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", default=CORPUS_DIR)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    legacy, legacy_time = score(legacy_parse, corpus, args.repeat)
+    tolerant, tolerant_time = score(parse_response, corpus, args.repeat)
+
+    print(f"{'response':<45} {'legacy':>7} {'extract':>8}")
+    for name, _, _ in corpus:
+        print(f"{name:<45} {'ok' if legacy[name] else 'FAIL':>7} {'ok' if tolerant[name] else 'FAIL':>8}")
+    total = len(corpus)
+    print(f"\nsuccess rate: legacy {sum(legacy.values())}/{total}, extract {sum(tolerant.values())}/{total}")
+    print(f"mean parse time: legacy {legacy_time * 1e6:.1f}us, extract {tolerant_time * 1e6:.1f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Offline load test of the LLM provider layer with the fake provider.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_llm --sessions 20 --stories 200 --latency 0.5
+
+Each simulated session classifies its stories and then generates the
+Functional model, as the Streamlit app does. The response cache is an
+in-memory SQLite database and is bypassed, so every call reaches the
+provider.
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import llm_cache
+from classify import classify_in_batches
+from llm import complete
+from prompts import FUNCTIONAL_PROMPT_VERSION, build_functional_prompt
+from providers import FAKE, FakeProvider, set_provider
+from stories import assign_story_ids
+
+
+def run_session(session, stories, cache):
+    start = time.perf_counter()
+    result = classify_in_batches(stories, FAKE, "fake-model", None, bypass_cache=True)
+    texts = [s["text"] for s in stories if s["id"] in set(result["Functional"])]
+    complete(build_functional_prompt(texts), FAKE, "fake-model", None, 8096, 0.1,
+             kind="functional", stories=texts, prompt_version=FUNCTIONAL_PROMPT_VERSION,
+             bypass_cache=True, cache=cache)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--stories", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.2, help="simulated seconds per LLM call")
+    parser.add_argument("--concurrency", type=int, default=8, help="provider concurrency limit")
+    args = parser.parse_args()
+
+    provider = FakeProvider(latency=args.latency, concurrency=args.concurrency)
+    set_provider(FAKE, provider)
+    cache = llm_cache.ResponseCache(":memory:")
+    llm_cache._response_cache = cache
+    stories = assign_story_ids([f"Là người dùng {i}, tôi muốn quản lý đơn hàng số {i}" for i in range(args.stories)])
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as executor:
+        durations = list(executor.map(lambda i: run_session(i, stories, cache), range(args.sessions)))
+    elapsed = time.perf_counter() - start
+
+    print(f"sessions={args.sessions} stories={args.stories} provider_calls={provider.calls}")
+    print(f"wall={elapsed:.2f}s sessions/s={args.sessions / elapsed:.2f} "
+          f"session median={statistics.median(durations):.2f}s max={max(durations):.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""End-to-end pipeline benchmark on replayed LLM responses and a stub renderer, for offline regression runs.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_pipeline [--sizes 10,100,1000] [--runs 3] [--replay DIR]
+    python -m benchmarks.bench_pipeline --save baseline.json
+    python -m benchmarks.bench_pipeline --baseline baseline.json --tolerance 0.25
+
+Each run classifies a synthetic story list, generates and emits the
+Functional and deployment models and renders every diagram, as the app
+does. LLM calls go to the fake provider: a response recorded in
+``--replay`` (one ``<sha1 of the prompt>.txt`` per prompt) is returned
+as-is, any other prompt gets the fake provider's synthetic answer.
+``--record DIR --provider anthropic`` runs the pipeline configured for that
+real provider (model, max_tokens, temperature) and stores its responses
+for later replays. Renders go to a stub that
+returns placeholder bytes after ``--render-latency`` seconds, and both
+caches are bypassed, so every run does all the work.
+
+The report gives the wall time and stories/s per size and the mean time
+per stage from :mod:`metrics`. With ``--baseline`` the exit status is 1
+when the median wall time of a size regressed by more than ``--tolerance``.
+"""
+import argparse
+import hashlib
+import json
+import os
+import statistics
+import sys
+import time
+
+import llm_cache
+from metrics import get_metrics
+from pipeline import (
+    DEFAULT_MODELS,
+    LLMConfig,
+    classify,
+    emit_deployment,
+    emit_functional,
+    generate_deployment,
+    generate_functional,
+    render_targets,
+)
+from providers import ANTHROPIC, FAKE, OPENAI, FakeProvider, Provider, get_provider, set_provider
+from render import RenderCache, render_many
+from stories import assign_story_ids
+
+RECORD_PROVIDERS = {"anthropic": ANTHROPIC, "openai": OPENAI}
+API_KEY_ENV = {ANTHROPIC: "ANTHROPIC_API_KEY", OPENAI: "OPENAI_API_KEY"}
+ROLES = ("khách hàng", "quản trị viên", "nhân viên kho", "kế toán", "người giao hàng")
+ACTIONS = ("tạo", "xem", "cập nhật", "xóa", "duyệt", "xuất báo cáo")
+ENTITIES = ("đơn hàng", "sản phẩm", "hóa đơn", "tài khoản", "phiếu nhập kho", "lịch giao hàng", "khuyến mãi")
+
+
+def prompt_key(prompt):
+    return hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+
+
+class RecordedResponses:
+    """Responder for :class:`providers.FakeProvider` that replays ``<directory>/<prompt sha1>.txt``."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.replayed = 0
+        self.synthetic = 0
+
+    def __call__(self, prompt):
+        path = os.path.join(self.directory, prompt_key(prompt) + ".txt") if self.directory else None
+        if path is None or not os.path.exists(path):
+            self.synthetic += 1
+            return None
+        self.replayed += 1
+        with open(path, encoding="utf-8", newline="") as f:
+            return f.read()
+
+
+class RecordingProvider(Provider):
+    """Forwards every prompt to a real provider and stores the response for :class:`RecordedResponses`.
+
+    Only the transport is wrapped: register it under the real provider's
+    name with :func:`providers.set_provider` so the pipeline sends the
+    real provider's settings.
+    """
+
+    def __init__(self, inner, directory, **kwargs):
+        kwargs.setdefault("timeout", inner.timeout)
+        super().__init__(inner.api_key, **kwargs)
+        self.name = inner.name
+        self.inner = inner
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    async def _complete(self, prompt, model, max_tokens, temperature):
+        text = await self.inner._complete(prompt, model, max_tokens, temperature)
+        with open(os.path.join(self.directory, prompt_key(prompt) + ".txt"), "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+        return text
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+class StubRenderer:
+    """Renderer that returns placeholder image bytes (about the size of a real PNG) after ``latency`` seconds."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def render(self, source, fmt="png"):
+        if self.latency:
+            time.sleep(self.latency)
+        return b"\x89PNG\r\n\x1a\n" + hashlib.sha256(source.encode("utf-8")).digest() * (len(source) // 32 + 1)
+
+    def close(self):
+        pass
+
+
+def synthetic_stories(count):
+    texts = []
+    for i in range(count):
+        role = ROLES[i % len(ROLES)]
+        action = ACTIONS[(i // len(ROLES)) % len(ACTIONS)]
+        entity = ENTITIES[(i // 3) % len(ENTITIES)]
+        texts.append(f"Là {role}, tôi muốn {action} {entity} số {i} để hoàn thành công việc")
+    return assign_story_ids(texts)
+
+
+def run_once(stories, config, renderer):
+    """Run the app's pipeline once and return its wall time in seconds."""
+    cache = RenderCache(disk_dir=None)
+    start = time.perf_counter()
+    functional, non_functional = classify(stories, config)
+    sources = {}
+    if functional:
+        _, _, data = generate_functional(functional, config)
+        sources.update(emit_functional(data).sources)
+    if non_functional:
+        sources.update(emit_deployment(generate_deployment(non_functional, config))[1])
+    for result in render_many({name: sources[name] for name in render_targets(sources)}, cache=cache,
+                              renderer=renderer):
+        if result.error is not None:
+            raise result.error
+    return time.perf_counter() - start
+
+
+def bench_size(size, runs, config, renderer):
+    stories = synthetic_stories(size)
+    metrics = get_metrics()
+    metrics.reset()
+    # One untimed run warms imports, thread pools and the provider loop.
+    run_once(stories, config, renderer)
+    metrics.reset()
+    walls = sorted(run_once(stories, config, renderer) for _ in range(runs))
+    snapshot = metrics.snapshot()
+    return {
+        "stories": size,
+        "runs": runs,
+        "wall_median": statistics.median(walls),
+        "wall_max": walls[-1],
+        "stories_per_second": size / statistics.median(walls),
+        "stages": {name: s["total"] / runs for name, s in snapshot["spans"].items()},
+        "counters": {name: value / runs for name, value in snapshot["counters"].items()},
+    }
+
+
+def report(result):
+    print(f"\n{result['stories']} stories: median {result['wall_median'] * 1000:.1f}ms, "
+          f"max {result['wall_max'] * 1000:.1f}ms, {result['stories_per_second']:.1f} stories/s")
+    for name, seconds in sorted(result["stages"].items(), key=lambda item: -item[1]):
+        print(f"  {name:<22} {seconds * 1000:9.1f}ms/run")
+    counters = result["counters"]
+    print(f"  llm calls {counters.get('llm.calls', 0):.0f}/run, tokens in/out "
+          f"{counters.get('llm.input_tokens', 0):.0f}/{counters.get('llm.output_tokens', 0):.0f}, "
+          f"rendered {counters.get('render.png_bytes', 0) / 1024:.0f} KiB")
+
+
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {r["stories"]: r for r in json.load(f)["results"]}
+    regressions = 0
+    print()
+    for result in results:
+        base = baseline.get(result["stories"])
+        if base is None:
+            continue
+        change = result["wall_median"] / base["wall_median"] - 1
+        regressed = change > tolerance
+        regressions += regressed
+        print(f"{'REGRESSION' if regressed else 'ok':<10} {result['stories']} stories: "
+              f"{base['wall_median'] * 1000:.1f}ms -> {result['wall_median'] * 1000:.1f}ms ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10,100,1000", help="comma-separated story counts")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--replay", metavar="DIR", help="directory of recorded responses")
+    parser.add_argument("--record", metavar="DIR", help="call --provider and record its responses to DIR")
+    parser.add_argument("--provider", choices=sorted(RECORD_PROVIDERS), default="anthropic",
+                        help="provider used with --record")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated seconds per LLM call")
+    parser.add_argument("--render-latency", type=float, default=0.0, help="simulated seconds per render")
+    parser.add_argument("--save", metavar="PATH", help="write the results as JSON (e.g. as a baseline)")
+    parser.add_argument("--baseline", metavar="PATH", help="compare with results saved by --save")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown against --baseline")
+    args = parser.parse_args()
+
+    llm_cache._response_cache = llm_cache.ResponseCache(":memory:")
+    responses = RecordedResponses(args.replay)
+    if args.record:
+        real = RECORD_PROVIDERS[args.provider]
+        api_key = os.getenv(API_KEY_ENV[real], "")
+        set_provider(real, RecordingProvider(get_provider(real, api_key), args.record), api_key)
+        config = LLMConfig(real, DEFAULT_MODELS[real], api_key, True)
+    else:
+        set_provider(FAKE, FakeProvider(responder=responses, latency=args.latency))
+        config = LLMConfig(FAKE, DEFAULT_MODELS[FAKE], None, True)
+    renderer = StubRenderer(args.render_latency)
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+        results.append(bench_size(size, args.runs, config, renderer))
+        report(results[-1])
+    if not args.record:
+        print(f"\nresponses: {responses.replayed} replayed, {responses.synthetic} synthetic")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "results": results}, f, indent=2)
+    if args.baseline:
+        return 1 if compare(results, args.baseline, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
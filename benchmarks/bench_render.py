@@ -0,0 +1,100 @@
+"""Compare per-diagram render latency of the remote, cold-local and warm-pool backends.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_render --runs 10 --jar /path/to/plantuml.jar
+
+The render cache is bypassed so every run measures a real render.
+"""
+import argparse
+import statistics
+import time
+
+from render import PLANTUML_JAR, PLANTUML_SERVER, LocalRenderer, PooledLocalRenderer, RemoteRenderer
+
+SAMPLE_DIAGRAMS = {
+    "class": """@startuml
+skinparam classAttributeIconSize 0
+
+class User {
+  - id: int
+  - name: str
+  + login()
+}
+
+class Order {
+  - total: float
+  + checkout()
+}
+
+User "1" --> "n" Order
+@enduml""",
+    "sequence": """@startuml
+participant User
+participant Shop
+participant Payment
+User -> Shop: placeOrder()
+Shop -> Payment: charge()
+Payment -> Shop: receipt
+Shop -> User: confirmation
+@enduml""",
+    "deployment": """@startuml
+node "WebServer" as WebServer {
+  [Frontend]
+}
+node "Database" as Database {
+  [PostgreSQL]
+}
+WebServer --> Database : TCP/5432
+@enduml""",
+}
+
+
+def bench(renderer, runs, fmt):
+    timings = []
+    for i in range(runs):
+        for source in SAMPLE_DIAGRAMS.values():
+            # Vary the source so no server-side cache can answer.
+            source = source.replace("@enduml", f"' run {i}\n@enduml")
+            start = time.perf_counter()
+            renderer.render(source, fmt)
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{name:<12} n={len(timings):<4} mean={statistics.mean(timings) * 1000:8.1f}ms "
+          f"median={statistics.median(timings) * 1000:8.1f}ms p95={p95 * 1000:8.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--fmt", default="png")
+    parser.add_argument("--server", default=PLANTUML_SERVER)
+    parser.add_argument("--jar", default=PLANTUML_JAR)
+    parser.add_argument("--pool-size", type=int, default=2)
+    parser.add_argument("--backends", default="remote,local,pool",
+                        help="comma separated subset of remote,local,pool")
+    args = parser.parse_args()
+    backends = args.backends.split(",")
+
+    if "remote" in backends:
+        report("remote", bench(RemoteRenderer(args.server), args.runs, args.fmt))
+    if "local" in backends:
+        report("cold-local", bench(LocalRenderer(args.jar), args.runs, args.fmt))
+    if "pool" in backends:
+        pool = PooledLocalRenderer(args.jar, pool_size=args.pool_size)
+        try:
+            pool.warm_up(args.fmt)
+            # One untimed pass so the JIT has seen every diagram type.
+            bench(pool, 1, args.fmt)
+            report("warm-pool", bench(pool, args.runs, args.fmt))
+        finally:
+            pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Measure the cold import time of the app's modules and check that heavy dependencies stay lazy.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_startup [--runs 5] [--module app]
+
+Every run imports ``--module`` in a fresh interpreter. The report lists the
+mean and best import time, plus which of the lazily loaded dependencies
+(provider SDKs, python-docx, plantuml) were imported anyway. Importing
+``app`` needs Streamlit installed; the default ``pipeline`` does not.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+LAZY_MODULES = ("anthropic", "openai", "docx", "plantuml", "httpx", "streamlit")
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"elapsed": elapsed, "loaded": [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module, runs):
+    probe = _PROBE.format(module=module, lazy=LAZY_MODULES)
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--module", default="pipeline")
+    args = parser.parse_args()
+
+    results = measure(args.module, args.runs)
+    times = [r["elapsed"] * 1000 for r in results]
+    loaded = sorted(set().union(*(r["loaded"] for r in results)))
+    print(f"import {args.module}: mean {statistics.mean(times):.1f}ms, best {min(times):.1f}ms over {args.runs} runs")
+    print(f"eagerly loaded: {', '.join(loaded) if loaded else 'none'}")
+    if args.module != "app" and "streamlit" in loaded:
+        print("WARNING: streamlit imported by a headless module")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,33 @@
+"""Smoke check: build every real provider with the installed SDKs, without sending any request.
+
+Run from the repository root:
+
+    python -m benchmarks.check_providers
+
+Catches missing or incompatible SDK dependencies (e.g. a transport
+library the SDK no longer ships) before the first real classification
+fails in the app. Exits with status 1 if a provider cannot be built.
+"""
+import sys
+
+from providers import FAKE, PROVIDERS, run_sync
+
+
+def main():
+    failed = 0
+    for name, provider_class in PROVIDERS.items():
+        if name == FAKE:
+            continue
+        try:
+            provider = provider_class("sk-smoke-check")
+            run_sync(provider.aclose())
+        except Exception as e:
+            failed += 1
+            print(f"FAIL {name}: {type(e).__name__}: {e}")
+            continue
+        print(f"ok   {name}: {type(provider.client).__module__}.{type(provider.client).__name__}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
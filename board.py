@@ -0,0 +1,108 @@
+"""Indexed Kanban board and sprints for a story list, independent of the UI."""
+import os
+from itertools import islice
+
+BOARD_STATUSES = ("To Do", "In Progress", "Done")
+BOARD_PAGE_SIZE = int(os.getenv("UML_BOARD_PAGE_SIZE", 20))
+
+
+class Board:
+    """Stories indexed by ID, with one insertion-ordered bucket per status.
+
+    Every lookup, status move and sprint label is O(1); listing a status
+    only touches the requested page. :meth:`sync` reconciles the board with
+    the current story list, keeping the status of stories it already knows.
+    """
+
+    def __init__(self, statuses=BOARD_STATUSES):
+        self.statuses = tuple(statuses)
+        self.stories = {}
+        self.status = {}
+        # dicts used as ordered sets: status -> {story id: None}
+        self.buckets = {status: {} for status in self.statuses}
+        self.sprints = {}
+
+    def __len__(self):
+        return len(self.stories)
+
+    def __contains__(self, sid):
+        return sid in self.stories
+
+    def sync(self, stories):
+        """Make the board hold exactly ``stories``: new ones start in the first status."""
+        current = {}
+        for story in stories:
+            current[story["id"]] = story
+            if story["id"] not in self.stories:
+                self.status[story["id"]] = self.statuses[0]
+                self.buckets[self.statuses[0]][story["id"]] = None
+        for sid in self.stories.keys() - current.keys():
+            self._forget(sid)
+        self.stories = current
+
+    def add(self, story, status=None):
+        status = status or self.statuses[0]
+        self.stories[story["id"]] = story
+        self.status[story["id"]] = status
+        self.buckets[status][story["id"]] = None
+
+    def remove(self, sid):
+        if sid in self.stories:
+            del self.stories[sid]
+            self._forget(sid)
+
+    def _forget(self, sid):
+        status = self.status.pop(sid, None)
+        if status is not None:
+            self.buckets[status].pop(sid, None)
+        for ids in self.sprints.values():
+            ids.pop(sid, None)
+
+    def move(self, sid, status):
+        """Put story ``sid`` in ``status`` (at the end of its bucket)."""
+        if status not in self.buckets:
+            raise ValueError(f"Unknown status: {status}")
+        old = self.status[sid]
+        if old != status:
+            del self.buckets[old][sid]
+            self.buckets[status][sid] = None
+            self.status[sid] = status
+
+    def shift(self, sid, step):
+        """Move story ``sid`` ``step`` columns left (negative) or right, staying on the board."""
+        index = self.statuses.index(self.status[sid]) + step
+        self.move(sid, self.statuses[max(0, min(index, len(self.statuses) - 1))])
+
+    def count(self, status):
+        return len(self.buckets[status])
+
+    def page(self, status, page, page_size=BOARD_PAGE_SIZE):
+        """Return the story dicts on ``page`` (0-based) of ``status``."""
+        start = page * page_size
+        return [self.stories[sid] for sid in islice(self.buckets[status], start, start + page_size)]
+
+    def label(self, sid):
+        story = self.stories.get(sid)
+        return story["text"] if story is not None else sid
+
+    def add_sprint(self, name):
+        """Create an empty sprint; return False if ``name`` is empty or already used."""
+        if not name or name in self.sprints:
+            return False
+        self.sprints[name] = {}
+        return True
+
+    def set_sprint_stories(self, name, ids):
+        self.sprints[name] = {sid: None for sid in ids if sid in self.stories}
+
+    def sprint_stories(self, name):
+        return list(self.sprints[name])
+
+
+def page_count(total, page_size=BOARD_PAGE_SIZE):
+    return max(1, -(-total // page_size))
+
+
+def page_slice(items, page, page_size=BOARD_PAGE_SIZE):
+    """Return the items of ``page`` (0-based) of a list."""
+    return items[page * page_size:(page + 1) * page_size]
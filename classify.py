@@ -0,0 +1,138 @@
+"""Classification of user stories into Functional / Non-Functional, in token-budgeted batches."""
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from llm import complete, parse_llm_json
+from prompts import CLASSIFY_PROMPT_VERSION, build_classify_prompt
+
+CLASSIFY_BATCH_TOKENS = int(os.getenv("UML_CLASSIFY_BATCH_TOKENS", 2000))
+CLASSIFY_CONCURRENCY = int(os.getenv("UML_CLASSIFY_CONCURRENCY", 4))
+CLASSIFY_MAX_RETRIES = int(os.getenv("UML_CLASSIFY_MAX_RETRIES", 5))
+CLASSIFY_RETRY_SECONDS = float(os.getenv("UML_CLASSIFY_RETRY_SECONDS", 120))
+CLASSIFY_LABELS = ("Functional", "Non-Functional")
+
+
+def classify_user_story(stories, model_option, selected_model, api_key, bypass_cache=False):
+    """Classify ``{"id", "text"}`` stories; returns ``{"Functional": [ids], "Non-Functional": [ids]}``."""
+    prompt = build_classify_prompt(stories)
+    response_text = complete(
+        prompt, model_option, selected_model, api_key, max_tokens=8096, temperature=0.1,
+        kind="classify", stories=[f"{s['id']}\t{s['text']}" for s in stories],
+        prompt_version=CLASSIFY_PROMPT_VERSION, bypass_cache=bypass_cache,
+    )
+    return parse_llm_json(response_text, "classify", model_option, selected_model, api_key, bypass_cache)
+
+
+def estimate_tokens(text):
+    """Rough token count; Vietnamese text tokenizes to about 3 characters per token."""
+    return len(text) // 3 + 1
+
+
+def batch_stories(stories, max_tokens=CLASSIFY_BATCH_TOKENS):
+    """Split stories into consecutive batches whose estimated size fits ``max_tokens``.
+
+    A single story larger than the budget gets a batch of its own.
+    """
+    batches = []
+    batch, batch_tokens = [], 0
+    for story in stories:
+        tokens = estimate_tokens(story["text"])
+        if batch and batch_tokens + tokens > max_tokens:
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(story)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def is_rate_limit_error(error):
+    """True for provider errors worth retrying after a pause (rate limits, overload, 5xx).
+
+    Timeouts are not retried: a request that already ran for the whole
+    provider timeout would only block the batch again.
+    """
+    status = getattr(error, "status_code", None)
+    if status in (429, 529) or (status is not None and status >= 500):
+        return True
+    name = type(error).__name__
+    return "RateLimit" in name or "Overloaded" in name
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def call_with_backoff(fn, max_retries=CLASSIFY_MAX_RETRIES, base_delay=1.0, max_delay=60.0,
+                      budget=CLASSIFY_RETRY_SECONDS):
+    """Call ``fn()`` and retry rate-limit errors with exponential backoff and jitter.
+
+    No retry starts once ``budget`` seconds have passed since the first call
+    (or would pass during the pause before it).
+    """
+    deadline = time.monotonic() + budget
+    for attempt in range(max_retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == max_retries or not is_rate_limit_error(e):
+                raise
+            delay = _retry_after(e)
+            if delay is None:
+                delay = min(max_delay, base_delay * 2 ** attempt) * (0.5 + random.random() / 2)
+            if time.monotonic() + delay >= deadline:
+                raise
+            time.sleep(delay)
+
+
+def _classify_batch(batch, model_option, selected_model, api_key, bypass_cache):
+    """Classify one batch and return ``{story id: label}``."""
+    result = call_with_backoff(
+        lambda: classify_user_story(batch, model_option, selected_model, api_key, bypass_cache)
+    )
+    batch_ids = {story["id"] for story in batch}
+    labels = {}
+    for label in CLASSIFY_LABELS:
+        for sid in result.get(label, []):
+            sid = str(sid).strip()
+            if sid in batch_ids:
+                labels.setdefault(sid, label)
+    return labels
+
+
+def classify_in_batches(stories, model_option, selected_model, api_key, bypass_cache=False,
+                        batch_tokens=CLASSIFY_BATCH_TOKENS, concurrency=CLASSIFY_CONCURRENCY,
+                        progress_callback=None):
+    """Classify a large list of ``{"id", "text"}`` stories in concurrent batches.
+
+    Returns ``{"Functional": [ids], "Non-Functional": [ids]}`` with IDs in
+    the original story order; map them back through a
+    :class:`stories.StoryIndex`. Stories the model left out are kept as
+    Functional rather than dropped. ``progress_callback(done, total)`` is
+    called from the calling thread after each batch.
+    """
+    batches = batch_stories(stories, batch_tokens)
+    labels = {}
+    if progress_callback:
+        progress_callback(0, len(batches))
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="classify") as executor:
+        futures = [
+            executor.submit(_classify_batch, batch, model_option, selected_model, api_key, bypass_cache)
+            for batch in batches
+        ]
+        for done, future in enumerate(as_completed(futures), 1):
+            labels.update(future.result())
+            if progress_callback:
+                progress_callback(done, len(batches))
+    result = {label: [] for label in CLASSIFY_LABELS}
+    for story in stories:
+        result[labels.get(story["id"], "Functional")].append(story["id"])
+    return result
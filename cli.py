@@ -0,0 +1,125 @@
+"""Generate diagrams for a directory of story files without the Streamlit UI.
+
+    python cli.py stories/ --out diagrams/ --provider anthropic --formats puml,png,svg,pdf --workers 4
+
+Each ``.docx``/``.txt`` file gets its own output directory named after it.
+API keys are read from ANTHROPIC_API_KEY / OPENAI_API_KEY (or a .env file).
+"""
+import argparse
+import dotenv
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from metrics import get_metrics, profiled
+from pipeline import DEFAULT_MODELS, STORY_FORMATS, LLMConfig, process_file
+from providers import ANTHROPIC, FAKE, OPENAI
+from render import RENDERER_MODE, RENDERER_MODES, get_renderer
+
+PROVIDER_ARGS = {"anthropic": ANTHROPIC, "openai": OPENAI, "fake": FAKE}
+API_KEY_ENV = {ANTHROPIC: "ANTHROPIC_API_KEY", OPENAI: "OPENAI_API_KEY"}
+OUTPUT_FORMATS = ("puml", "png", "svg", "pdf")
+
+
+def find_story_files(directory):
+    files = []
+    for root, _, names in os.walk(directory):
+        for name in sorted(names):
+            if os.path.splitext(name)[1].lower() in STORY_FORMATS and not name.startswith("~$"):
+                files.append(os.path.join(root, name))
+    return sorted(files)
+
+
+def run_files(files, args, config, renderer, sequential=False):
+    """Process ``files`` and yield ``(path, FileResult, None)`` or ``(path, None, error)`` as each one finishes."""
+    jobs = [(path, os.path.join(args.out, os.path.splitext(os.path.relpath(path, args.input))[0])) for path in files]
+    if sequential:
+        for path, out_dir in jobs:
+            try:
+                yield path, process_file(path, out_dir, config, args.formats, renderer), None
+            except Exception as e:
+                yield path, None, e
+        return
+    with ThreadPoolExecutor(max_workers=max(1, args.workers), thread_name_prefix="cli") as pool:
+        futures = {pool.submit(process_file, path, out_dir, config, args.formats, renderer): path
+                   for path, out_dir in jobs}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+
+
+def write_metrics(path):
+    metrics = get_metrics()
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(metrics.to_prometheus() if path.endswith(".prom") else metrics.to_json(indent=2))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate UML diagrams from user story files.")
+    parser.add_argument("input", help="directory of .docx/.txt story files")
+    parser.add_argument("--out", default="diagrams", help="output directory (default: diagrams)")
+    parser.add_argument("--provider", choices=sorted(PROVIDER_ARGS), default="anthropic")
+    parser.add_argument("--model", help="model name (default depends on the provider)")
+    parser.add_argument("--formats", default="puml,png",
+                        help=f"comma-separated output formats among {', '.join(OUTPUT_FORMATS)} (default: puml,png)")
+    parser.add_argument("--workers", type=int, default=4, help="story files processed concurrently (default: 4)")
+    parser.add_argument("--renderer", choices=sorted(RENDERER_MODES), default=RENDERER_MODE)
+    parser.add_argument("--bypass-cache", action="store_true", help="always call the model")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="write per-stage timings and counters to PATH (Prometheus text if it ends in .prom, "
+                             "JSON otherwise)")
+    parser.add_argument("--profile", metavar="DIR",
+                        help="write a cProfile dump of the run to DIR; files are then processed one at a time "
+                             "in the main thread so the profile sees them")
+    args = parser.parse_args(argv)
+    args.formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+    unknown = set(args.formats) - set(OUTPUT_FORMATS)
+    if unknown:
+        parser.error(f"unknown format(s): {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    dotenv.load_dotenv()
+    provider = PROVIDER_ARGS[args.provider]
+    config = LLMConfig(provider, args.model or DEFAULT_MODELS[provider],
+                       os.getenv(API_KEY_ENV.get(provider, ""), ""), args.bypass_cache)
+    renderer = get_renderer(args.renderer)
+    files = find_story_files(args.input)
+    if not files:
+        print(f"No .docx/.txt files in {args.input}", file=sys.stderr)
+        return 1
+
+    start = time.perf_counter()
+    results = []
+    failed = 0
+    with profiled("cli", args.profile) as profile_path:
+        for path, result, error in run_files(files, args, config, renderer, sequential=profile_path is not None):
+            if error is not None:
+                failed += 1
+                print(f"FAIL {path}: {error}", file=sys.stderr)
+                continue
+            results.append(result)
+            status = "ok  " if not result.errors else "WARN"
+            print(f"{status} {path}: {result.stories} stories, {len(result.outputs)} files, {result.elapsed:.1f}s")
+            for error in result.errors:
+                print(f"     {error}", file=sys.stderr)
+    elapsed = time.perf_counter() - start
+
+    stories = sum(r.stories for r in results)
+    outputs = sum(len(r.outputs) for r in results)
+    print(f"\n{len(results)}/{len(files)} files, {stories} stories, {outputs} outputs in {elapsed:.1f}s "
+          f"({len(files) / elapsed * 60:.1f} files/min, {stories / elapsed:.1f} stories/s)")
+    if profile_path is not None:
+        print(f"profile written to {profile_path}")
+    if args.metrics:
+        write_metrics(args.metrics)
+    return 1 if failed or any(r.errors for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
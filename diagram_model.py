@@ -0,0 +1,226 @@
+"""Typed diagram model between the LLM JSON and the PlantUML emitters.
+
+The builders accept the JSON of :mod:`prompts` (dicts and positional
+lists) and resolve it once: names are interned and stripped, duplicate
+classes and nodes are merged, and relationship or message endpoints that
+were never declared get an empty declaration. Malformed entries are
+skipped, so a partial streamed response builds as well as a complete one.
+"""
+import re
+import sys
+from dataclasses import dataclass, field
+
+RELATIONSHIP_KINDS = ("Inheritance", "Association", "Aggregation", "Composition")
+_KINDS_BY_LOWER = {kind.lower(): kind for kind in RELATIONSHIP_KINDS}
+_NON_IDENTIFIER = re.compile(r"\W+")
+
+
+@dataclass(slots=True)
+class Class:
+    name: str
+    attributes: list = field(default_factory=list)
+    methods: list = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class Relationship:
+    source: str
+    target: str
+    kind: str
+    multiplicity: str = ""
+
+
+@dataclass(slots=True)
+class Participant:
+    name: str
+
+
+@dataclass(slots=True)
+class Message:
+    sender: str
+    receiver: str
+    label: str
+
+
+@dataclass(slots=True)
+class Node:
+    name: str
+    alias: str
+    services: list = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class Link:
+    source: str
+    target: str
+    label: str = ""
+
+
+@dataclass(slots=True)
+class ClassModel:
+    classes: list
+    relationships: list
+    index: dict
+
+    def to_dict(self):
+        return {
+            "classes": [{"name": c.name, "attributes": c.attributes, "methods": c.methods} for c in self.classes],
+            "relationships": [[r.source, r.target, r.kind, r.multiplicity] for r in self.relationships],
+        }
+
+
+@dataclass(slots=True)
+class SequenceModel:
+    participants: list
+    messages: list
+    index: dict
+
+    def to_dict(self):
+        return {
+            "objects": [p.name for p in self.participants],
+            "messages": [[m.sender, m.receiver, m.label] for m in self.messages],
+        }
+
+
+@dataclass(slots=True)
+class DeploymentModel:
+    nodes: list
+    links: list
+    index: dict
+
+    def to_dict(self):
+        return {
+            "components": [{"name": n.name, "services": n.services} for n in self.nodes],
+            "relationships": [[l.source, l.target, l.label] if l.label else [l.source, l.target] for l in self.links],
+        }
+
+
+def _name(value):
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    return sys.intern(value) if value else None
+
+
+def _text(value):
+    return value.strip() if isinstance(value, str) else str(value)
+
+
+def _merge(target, values):
+    for value in values or []:
+        value = _text(value)
+        if value and value not in target:
+            target.append(value)
+
+
+def _row(value, size):
+    if not isinstance(value, (list, tuple)) or len(value) < size:
+        return None
+    return value
+
+
+def build_class_model(data):
+    """Build a :class:`ClassModel` from ``{"classes": [...], "relationships": [...]}``."""
+    data = data or {}
+    index = {}
+    for item in data.get("classes") or []:
+        name = _name(item.get("name")) if isinstance(item, dict) else None
+        if name is None:
+            continue
+        cls = index.get(name)
+        if cls is None:
+            cls = index[name] = Class(name)
+        _merge(cls.attributes, item.get("attributes"))
+        _merge(cls.methods, item.get("methods"))
+    relationships = []
+    seen = set()
+    for row in data.get("relationships") or []:
+        row = _row(row, 3)
+        if row is None:
+            continue
+        source, target = _name(row[0]), _name(row[1])
+        kind = _KINDS_BY_LOWER.get(_text(row[2]).lower())
+        if source is None or target is None or kind is None:
+            continue
+        multiplicity = _text(row[3]) if len(row) > 3 else ""
+        key = (source, target, kind, multiplicity)
+        if key in seen:
+            continue
+        seen.add(key)
+        for name in (source, target):
+            if name not in index:
+                index[name] = Class(name)
+        relationships.append(Relationship(source, target, kind, multiplicity))
+    return ClassModel(list(index.values()), relationships, index)
+
+
+def build_sequence_model(data):
+    """Build a :class:`SequenceModel` from ``{"objects": [...], "messages": [...]}``."""
+    data = data or {}
+    index = {}
+    for obj in data.get("objects") or []:
+        name = _name(obj)
+        if name is not None and name not in index:
+            index[name] = Participant(name)
+    messages = []
+    for row in data.get("messages") or []:
+        row = _row(row, 2)
+        if row is None:
+            continue
+        sender, receiver = _name(row[0]), _name(row[1])
+        if sender is None or receiver is None:
+            continue
+        for name in (sender, receiver):
+            if name not in index:
+                index[name] = Participant(name)
+        messages.append(Message(sender, receiver, _text(row[2]) if len(row) > 2 else ""))
+    return SequenceModel(list(index.values()), messages, index)
+
+
+def node_alias(name, taken=()):
+    """Return a PlantUML identifier for ``name`` that is not in ``taken``."""
+    alias = _NON_IDENTIFIER.sub("_", name).strip("_") or "node"
+    if alias[0].isdigit():
+        alias = "n_" + alias
+    candidate = alias
+    suffix = 2
+    while candidate in taken:
+        candidate = f"{alias}_{suffix}"
+        suffix += 1
+    return sys.intern(candidate)
+
+
+def build_deployment_model(data):
+    """Build a :class:`DeploymentModel` from ``{"components": [...], "relationships": [...]}``."""
+    data = data or {}
+    index = {}
+    aliases = set()
+
+    def node(name):
+        found = index.get(name)
+        if found is None:
+            found = index[name] = Node(name, node_alias(name, aliases))
+            aliases.add(found.alias)
+        return found
+
+    for item in data.get("components") or []:
+        name = _name(item.get("name")) if isinstance(item, dict) else None
+        if name is not None:
+            _merge(node(name).services, item.get("services"))
+    links = []
+    seen = set()
+    for row in data.get("relationships") or []:
+        row = _row(row, 2)
+        if row is None:
+            continue
+        source, target = _name(row[0]), _name(row[1])
+        if source is None or target is None:
+            continue
+        label = _text(row[2]) if len(row) > 2 else ""
+        if (source, target, label) in seen:
+            continue
+        seen.add((source, target, label))
+        node(source)
+        node(target)
+        links.append(Link(source, target, label))
+    return DeploymentModel(list(index.values()), links, index)
@@ -0,0 +1,97 @@
+"""PlantUML text for the diagram models of :mod:`diagram_model`."""
+from diagram_model import (
+    ClassModel, DeploymentModel, SequenceModel,
+    build_class_model, build_deployment_model, build_sequence_model,
+)
+
+_ARROWS = {"Inheritance": "<|--", "Aggregation": "o--", "Composition": "*--"}
+
+
+def generate_class_plantuml(model):
+    """Return the class diagram for a :class:`ClassModel` (or its JSON dict)."""
+    if not isinstance(model, ClassModel):
+        model = build_class_model(model)
+    lines = ["@startuml", "skinparam classAttributeIconSize 0", ""]
+    for cls in model.classes:
+        lines.append(f"class {cls.name} {{")
+        lines.extend(f"  {attr}" for attr in cls.attributes)
+        lines.extend(f"  {method}" for method in cls.methods)
+        lines.append("}")
+        lines.append("")
+    for rel in model.relationships:
+        if rel.kind == "Association":
+            if "-" in rel.multiplicity:
+                start, end = rel.multiplicity.split("-", 1)
+                lines.append(f'{rel.source} "{start}" --> "{end}" {rel.target}')
+            else:
+                lines.append(f"{rel.source} --> {rel.target}")
+        else:
+            lines.append(f"{rel.source} {_ARROWS[rel.kind]} {rel.target}")
+    lines.append("")
+    lines.append("@enduml")
+    return "\n".join(lines)
+
+
+def generate_overview_plantuml(partition, max_names=6):
+    """Return a diagram with one box per cluster of a :class:`partition.Partition` and the links between them."""
+    lines = ["@startuml"]
+    for i, members in enumerate(partition.members, 1):
+        names = members[:max_names] + (["…"] if len(members) > max_names else [])
+        lines.append(f'rectangle "Cụm {i}\\n({len(members)} class)\\n{", ".join(names)}" as cluster_{i}')
+    for (i, j), count in sorted(partition.links.items()):
+        lines.append(f"cluster_{i + 1} --> cluster_{j + 1} : {count}")
+    lines.append("@enduml")
+    return "\n".join(lines)
+
+
+def generate_sequence_plantuml(model):
+    """Return the sequence diagram for a :class:`SequenceModel` (or its JSON dict)."""
+    if not isinstance(model, SequenceModel):
+        model = build_sequence_model(model)
+    lines = ["@startuml"]
+    lines.extend(f"participant {p.name}" for p in model.participants)
+    lines.extend(f"{m.sender} -> {m.receiver}: {m.label}" for m in model.messages)
+    lines.append("@enduml")
+    return "\n".join(lines)
+
+
+def generate_deployment_plantuml(model):
+    """Return the deployment diagram for a :class:`DeploymentModel` (or its JSON dict)."""
+    if not isinstance(model, DeploymentModel):
+        model = build_deployment_model(model)
+    lines = ["@startuml"]
+    for node in model.nodes:
+        lines.append(f'node "{node.name}" as {node.alias} {{')
+        lines.extend(f"  [{service}]" for service in node.services)
+        lines.append("}")
+    for link in model.links:
+        source, target = model.index[link.source].alias, model.index[link.target].alias
+        lines.append(f"{source} --> {target} : {link.label}" if link.label else f"{source} --> {target}")
+    lines.append("@enduml")
+    return "\n".join(lines)
+
+
+def generate_agile_process_plantuml():
+    """
+    Sinh PlantUML cho quy trình Agile/Scrum tổng quát của ứng dụng.
+    """
+    return '''@startuml
+!define RECTANGLE class
+RECTANGLE "Product Backlog" as Backlog
+RECTANGLE "Sprint Planning" as Planning
+RECTANGLE "Sprint Backlog" as SprintBacklog
+RECTANGLE "Daily Scrum" as Daily
+RECTANGLE "Sprint" as Sprint
+RECTANGLE "Increment" as Increment
+RECTANGLE "Sprint Review" as Review
+RECTANGLE "Sprint Retrospective" as Retro
+
+Backlog --> Planning : "Chọn user story"
+Planning --> SprintBacklog : "Lập kế hoạch sprint"
+SprintBacklog --> Sprint : "Thực hiện sprint"
+Sprint --> Daily : "Họp mỗi ngày"
+Sprint --> Increment : "Tạo sản phẩm hoàn chỉnh"
+Increment --> Review : "Trình bày sản phẩm"
+Review --> Retro : "Phản hồi & cải tiến"
+Retro --> Backlog : "Cập nhật backlog"
+@enduml'''
@@ -0,0 +1,153 @@
+"""Multi-format export: one SVG render per diagram, other formats converted locally.
+
+Each diagram is fetched from the renderer once, as SVG; PNG and PDF are
+converted from that SVG in-process with the optional ``cairosvg`` package,
+so adding a format costs no extra server round trip. Without ``cairosvg``
+every format needs its own render, so only PNG is exported by default
+and other formats are rendered on request. All derived files go
+through the render cache, so a later ``render_diagram(source, "png")`` is a
+cache hit.
+"""
+import os
+import time
+from collections import namedtuple
+
+from artifacts import stream_zip
+from metrics import get_metrics
+from render import (
+    RENDER_TIMEOUT,
+    RenderError,
+    get_render_cache,
+    get_render_executor,
+    render_diagram,
+    run_with_timeouts,
+)
+
+# Empty means automatic, see export_formats().
+EXPORT_FORMATS = tuple(f.strip() for f in os.getenv("UML_EXPORT_FORMATS", "").split(",") if f.strip())
+EXPORT_PNG_SCALE = float(os.getenv("UML_EXPORT_PNG_SCALE", 1.0))
+EXPORT_MIMES = {
+    "puml": "text/plain",
+    "svg": "image/svg+xml",
+    "png": "image/png",
+    "pdf": "application/pdf",
+}
+# Formats cairosvg can produce from the SVG.
+CONVERTED_FORMATS = ("png", "pdf")
+
+ExportResult = namedtuple("ExportResult", ["name", "source", "files", "errors", "elapsed"])
+ExportResult.__doc__ = """``files``: ``{format: bytes}``; ``errors``: ``{format: exception}`` for the formats that failed."""
+
+_cairosvg = None
+
+
+def _converter():
+    global _cairosvg
+    if _cairosvg is None:
+        try:
+            import cairosvg
+        except (ImportError, OSError):
+            # OSError: the package is installed but the cairo library is not.
+            cairosvg = False
+        _cairosvg = cairosvg
+    return _cairosvg
+
+
+def can_convert():
+    """True when SVG can be converted to PNG/PDF locally (``cairosvg`` and cairo are installed)."""
+    return bool(_converter())
+
+
+def convert_svg(svg, fmt, scale=EXPORT_PNG_SCALE):
+    """Convert SVG bytes to "png" or "pdf" bytes."""
+    converter = _converter()
+    if not converter:
+        raise RenderError("cairosvg is not installed")
+    if fmt == "png":
+        return converter.svg2png(bytestring=svg, scale=scale)
+    if fmt == "pdf":
+        return converter.svg2pdf(bytestring=svg)
+    raise ValueError(f"Cannot convert SVG to {fmt!r}")
+
+
+def export_formats():
+    """Formats exported by default: ``UML_EXPORT_FORMATS`` if set, else svg, png and pdf when they can be
+    converted locally and png only otherwise, so the default costs one render per diagram."""
+    if EXPORT_FORMATS:
+        return EXPORT_FORMATS
+    return ("svg", "png", "pdf") if can_convert() else ("png",)
+
+
+def _derive(source, svg, fmt, cache):
+    data = cache.get(source, fmt)
+    if data is None:
+        metrics = get_metrics()
+        with metrics.span(f"export.svg_to_{fmt}"):
+            data = convert_svg(svg, fmt)
+        metrics.count(f"export.{fmt}_bytes", len(data))
+        cache.put(source, fmt, data)
+    return data
+
+
+def export_diagram(name, source, formats=None, cache=None, renderer=None):
+    """Return the :class:`ExportResult` of one diagram in ``formats`` (default :func:`export_formats`).
+
+    Failures are collected, not raised.
+    """
+    formats = formats or export_formats()
+    cache = cache if cache is not None else get_render_cache()
+    start = time.perf_counter()
+    files = {}
+    errors = {}
+    convert = can_convert() and any(fmt in CONVERTED_FORMATS for fmt in formats)
+    svg = svg_error = None
+    if convert or "svg" in formats:
+        try:
+            svg = render_diagram(source, "svg", cache=cache, renderer=renderer)
+        except Exception as e:
+            svg_error = e
+    for fmt in formats:
+        try:
+            if fmt == "svg":
+                data = svg
+            elif convert and fmt in CONVERTED_FORMATS:
+                data = _derive(source, svg, fmt, cache) if svg is not None else None
+            else:
+                data = render_diagram(source, fmt, cache=cache, renderer=renderer)
+        except Exception as e:
+            errors[fmt] = e
+            continue
+        if data is None:
+            errors[fmt] = svg_error
+        else:
+            files[fmt] = data
+    return ExportResult(name, source, files, errors, time.perf_counter() - start)
+
+
+def export_many(diagrams, formats=None, cache=None, renderer=None, timeout=RENDER_TIMEOUT, executor=None):
+    """Export ``{name: source}`` concurrently and yield an :class:`ExportResult` as each diagram finishes.
+
+    Same pool and timeout rules as :func:`render.render_many`.
+    """
+    formats = formats or export_formats()
+    executor = executor or get_render_executor()
+    tasks = {name: (export_diagram, name, source, formats, cache, renderer) for name, source in diagrams.items()}
+    for name, future in run_with_timeouts(executor, tasks, timeout):
+        if future is None:
+            error = RenderError(f"Export timed out after {timeout}s")
+            yield ExportResult(name, diagrams[name], {}, {fmt: error for fmt in formats}, timeout)
+        else:
+            yield future.result()
+
+
+def export_file_name(name, fmt):
+    return f"diagram_{name}.{fmt}"
+
+
+def write_bundle(entries, fileobj):
+    """Write a zip of ``(name, bytes)`` entries to ``fileobj`` chunk by chunk; return the bytes written."""
+    written = 0
+    for chunk in stream_zip(entries):
+        fileobj.write(chunk)
+        written += len(chunk)
+    return written
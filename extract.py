@@ -0,0 +1,261 @@
+"""Tolerant extraction and schema validation of the JSON object in an LLM response."""
+import json
+import re
+
+
+class ExtractionError(ValueError):
+    """Raised when no valid JSON object can be recovered from a response."""
+
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors or []
+
+
+_LITERALS = {"True": "true", "False": "false", "None": "null"}
+# An object opening that looks like JSON ('{"' or '{}'), so braces in leading prose are skipped.
+_OBJECT_START = re.compile(r'\{\s*["}]')
+
+
+def _scan(text):
+    match = _OBJECT_START.search(text)
+    start = match.start() if match else text.find("{")
+    if start == -1:
+        return None, None
+    out = []
+    closers = []
+    # Last point where every open element was complete (before a comma or
+    # after a closing bracket), used to cut a truncated response cleanly.
+    safe = None
+    in_string = False
+    escape = False
+    pending_comma = False
+    i = start
+    n = len(text)
+    while i < n:
+        ch = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            out.append(ch)
+            i += 1
+            continue
+        if ch in " \t\r\n":
+            i += 1
+            continue
+        if ch == ",":
+            if not pending_comma:
+                safe = (len(out), closers[:])
+            pending_comma = True
+            i += 1
+            continue
+        if ch in "}]":
+            pending_comma = False
+            if not closers:
+                break
+            out.append(closers.pop())
+            i += 1
+            if not closers:
+                return "".join(out), None
+            safe = (len(out), closers[:])
+            continue
+        if pending_comma:
+            out.append(",")
+            pending_comma = False
+        if ch == '"':
+            in_string = True
+            out.append(ch)
+        elif ch == "{":
+            closers.append("}")
+            out.append(ch)
+        elif ch == "[":
+            closers.append("]")
+            out.append(ch)
+        elif ch.isalpha():
+            j = i
+            while j < n and (text[j].isalnum() or text[j] == "_"):
+                j += 1
+            word = text[i:j]
+            out.append(_LITERALS.get(word, word))
+            i = j
+            continue
+        else:
+            out.append(ch)
+        i += 1
+    # Truncated response: close what is open, and also offer the cut at the
+    # last complete element in case the open tail is not valid on its own.
+    tail = out[:]
+    if in_string:
+        if escape:
+            tail.pop()
+        tail.append('"')
+    candidate = "".join(tail) + "".join(reversed(closers))
+    fallback = None
+    if safe is not None:
+        length, safe_closers = safe
+        fallback = "".join(out[:length]) + "".join(reversed(safe_closers))
+    return candidate, fallback
+
+
+def find_json_object(text):
+    """Return the outermost JSON object in ``text`` in one pass, repairing common damage on the way.
+
+    Leading prose and code fences (```json, ```JSON, none at all) are
+    skipped; inside the object, trailing commas are dropped, Python
+    literals become JSON ones, and an unterminated string or container is
+    closed, so truncated responses still parse. Returns None if ``text``
+    contains no ``{``.
+    """
+    return _scan(text)[0]
+
+
+def extract_json(text):
+    """Return the JSON object contained in an LLM response, or raise ExtractionError."""
+    candidate, fallback = _scan(text or "")
+    if candidate is None:
+        raise ExtractionError("Response contains no JSON object")
+    try:
+        # strict=False accepts raw newlines and tabs inside strings.
+        return json.loads(candidate, strict=False)
+    except json.JSONDecodeError as e:
+        if fallback is not None:
+            try:
+                return json.loads(fallback, strict=False)
+            except json.JSONDecodeError:
+                pass
+        raise ExtractionError(f"Response JSON could not be repaired: {e}") from e
+
+
+def _is_str_list(value):
+    return isinstance(value, list) and all(isinstance(v, str) for v in value)
+
+
+def _check_rows(rows, path, sizes, errors):
+    if not isinstance(rows, list):
+        errors.append(f"{path} must be a list")
+        return
+    for i, row in enumerate(rows):
+        if not isinstance(row, list) or len(row) not in sizes or not all(isinstance(v, str) for v in row):
+            errors.append(f"{path}[{i}] must be a list of {' or '.join(map(str, sizes))} strings")
+
+
+def validate_class(data, path="class"):
+    errors = []
+    if not isinstance(data, dict):
+        return [f"{path} must be an object"]
+    classes = data.get("classes")
+    if not isinstance(classes, list):
+        errors.append(f"{path}.classes must be a list")
+    else:
+        for i, cls in enumerate(classes):
+            if not isinstance(cls, dict) or not isinstance(cls.get("name"), str) or not cls["name"]:
+                errors.append(f"{path}.classes[{i}] must be an object with a non-empty name")
+                continue
+            for field in ("attributes", "methods"):
+                if not _is_str_list(cls.get(field, [])):
+                    errors.append(f"{path}.classes[{i}].{field} must be a list of strings")
+    _check_rows(data.get("relationships"), f"{path}.relationships", (3, 4), errors)
+    return errors
+
+
+def validate_sequence(data, path="sequence"):
+    errors = []
+    if not isinstance(data, dict):
+        return [f"{path} must be an object"]
+    if not _is_str_list(data.get("objects")):
+        errors.append(f"{path}.objects must be a list of strings")
+    _check_rows(data.get("messages"), f"{path}.messages", (3,), errors)
+    return errors
+
+
+def validate_functional(data):
+    if not isinstance(data, dict):
+        return ["response must be an object"]
+    return validate_class(data.get("class")) + validate_sequence(data.get("sequence"))
+
+
+def validate_functional_delta(data):
+    if not isinstance(data, dict):
+        return ["response must be an object"]
+    errors = []
+    class_delta = data.get("class", {})
+    sequence_delta = data.get("sequence", {})
+    if not isinstance(class_delta, dict) or not isinstance(sequence_delta, dict):
+        return ["class and sequence must be objects"]
+    upserts = class_delta.get("upsert_classes", [])
+    errors += validate_class({"classes": upserts, "relationships": []}, "class.upsert_classes")
+    for field in ("remove_classes",):
+        if not _is_str_list(class_delta.get(field, [])):
+            errors.append(f"class.{field} must be a list of strings")
+    for field in ("add_relationships", "remove_relationships"):
+        _check_rows(class_delta.get(field, []), f"class.{field}", (3, 4), errors)
+    for field in ("add_objects", "remove_objects"):
+        if not _is_str_list(sequence_delta.get(field, [])):
+            errors.append(f"sequence.{field} must be a list of strings")
+    for field in ("add_messages", "remove_messages"):
+        _check_rows(sequence_delta.get(field, []), f"sequence.{field}", (3,), errors)
+    return errors
+
+
+def validate_deployment(data):
+    errors = []
+    if not isinstance(data, dict):
+        return ["response must be an object"]
+    components = data.get("components")
+    if not isinstance(components, list):
+        errors.append("components must be a list")
+    else:
+        for i, component in enumerate(components):
+            if not isinstance(component, dict) or not isinstance(component.get("name"), str) or not component["name"]:
+                errors.append(f"components[{i}] must be an object with a non-empty name")
+            elif not _is_str_list(component.get("services", [])):
+                errors.append(f"components[{i}].services must be a list of strings")
+    _check_rows(data.get("relationships"), "relationships", (2, 3), errors)
+    return errors
+
+
+def validate_classify(data):
+    if not isinstance(data, dict):
+        return ["response must be an object"]
+    return [f"{label} must be a list of strings" for label in ("Functional", "Non-Functional")
+            if not _is_str_list(data.get(label, []))]
+
+
+VALIDATORS = {
+    "classify": validate_classify,
+    "functional": validate_functional,
+    "functional-delta": validate_functional_delta,
+    "deployment": validate_deployment,
+}
+
+
+def parse_response(text, kind, repair=None):
+    """Extract and validate the JSON of a ``kind`` response (see VALIDATORS).
+
+    If extraction or validation fails and ``repair`` is given, it is called
+    once as ``repair(response_text, errors)`` and must return a new response
+    text, typically from a small "fix this JSON" prompt; this is much cheaper
+    than regenerating. Raises ExtractionError if no valid object results.
+    """
+    validate = VALIDATORS[kind]
+    try:
+        data = extract_json(text)
+        errors = validate(data)
+    except ExtractionError as e:
+        errors = [str(e)]
+    if not errors:
+        return data
+    if repair is None:
+        raise ExtractionError(f"Invalid {kind} response: {'; '.join(errors[:5])}", errors)
+    repaired = repair(text, errors)
+    try:
+        data = extract_json(repaired)
+        errors = validate(data)
+    except ExtractionError as e:
+        errors = [str(e)]
+    if errors:
+        raise ExtractionError(f"Invalid {kind} response after repair: {'; '.join(errors[:5])}", errors)
+    return data
@@ -0,0 +1,97 @@
+"""Incremental regeneration of the Functional class/sequence model from a story diff."""
+import json
+import os
+
+INCREMENTAL_MAX_CHANGE_RATIO = float(os.getenv("UML_INCREMENTAL_MAX_CHANGE_RATIO", 0.5))
+
+
+def diff_stories(previous, stories):
+    """Compare ``{id: text}`` of the last generation with the current story list.
+
+    Returns ``{"added": [...], "edited": [...], "deleted": [...]}`` of story
+    dicts; deleted stories carry their previous text.
+    """
+    current = {story["id"]: story["text"] for story in stories}
+    diff = {"added": [], "edited": [], "deleted": []}
+    for sid, text in current.items():
+        if sid not in previous:
+            diff["added"].append({"id": sid, "text": text})
+        elif previous[sid] != text:
+            diff["edited"].append({"id": sid, "text": text})
+    for sid, text in previous.items():
+        if sid not in current:
+            diff["deleted"].append({"id": sid, "text": text})
+    return diff
+
+
+def plan_regeneration(previous_model, stories, provider=None, model=None, bypass_cache=False,
+                      max_change_ratio=INCREMENTAL_MAX_CHANGE_RATIO):
+    """Decide how to regenerate: ``("full" | "delta" | "reuse", diff)``.
+
+    A delta is only worth it when a previous model exists, was generated by
+    the same ``provider`` and ``model``, and the share of changed stories is
+    at most ``max_change_ratio``; with no change at all the previous model is
+    reused as is, unless ``bypass_cache`` asks for a fresh generation.
+    """
+    if not previous_model:
+        return "full", None
+    if (previous_model.get("provider"), previous_model.get("model")) != (provider, model):
+        return "full", None
+    diff = diff_stories(previous_model["stories"], stories)
+    changed = len(diff["added"]) + len(diff["edited"]) + len(diff["deleted"])
+    if changed == 0:
+        return ("full" if bypass_cache else "reuse"), diff
+    if changed > max_change_ratio * max(len(stories), len(previous_model["stories"])):
+        return "full", diff
+    return "delta", diff
+
+
+def _key(item):
+    return json.dumps(item, ensure_ascii=False)
+
+
+def merge_delta(model, delta):
+    """Apply a delta returned for :func:`prompts.build_functional_delta_prompt` to ``model``.
+
+    Returns a new ``{"class": ..., "sequence": ...}``; ``model`` is not modified.
+    Removing a class also drops the relationships that reference it.
+    """
+    class_data = model.get("class", {})
+    sequence_data = model.get("sequence", {})
+    class_delta = delta.get("class", {}) or {}
+    sequence_delta = delta.get("sequence", {}) or {}
+
+    classes = {cls["name"]: cls for cls in class_data.get("classes", [])}
+    removed_classes = set(class_delta.get("remove_classes", []))
+    for name in removed_classes:
+        classes.pop(name, None)
+    for cls in class_delta.get("upsert_classes", []):
+        classes[cls["name"]] = cls
+
+    removed_relations = {_key(r) for r in class_delta.get("remove_relationships", [])}
+    relationships = [
+        r for r in class_data.get("relationships", [])
+        if _key(r) not in removed_relations and r[0] not in removed_classes and r[1] not in removed_classes
+    ]
+    known_relations = {_key(r) for r in relationships}
+    for relation in class_delta.get("add_relationships", []):
+        if _key(relation) not in known_relations:
+            relationships.append(relation)
+            known_relations.add(_key(relation))
+
+    removed_objects = set(sequence_delta.get("remove_objects", []))
+    objects = [obj for obj in sequence_data.get("objects", []) if obj not in removed_objects]
+    for obj in sequence_delta.get("add_objects", []):
+        if obj not in objects:
+            objects.append(obj)
+    removed_messages = {_key(m) for m in sequence_delta.get("remove_messages", [])}
+    messages = [
+        m for m in sequence_data.get("messages", [])
+        if _key(m) not in removed_messages and m[0] not in removed_objects and m[1] not in removed_objects
+    ]
+    messages.extend(sequence_delta.get("add_messages", []))
+
+    return {
+        "class": {"classes": list(classes.values()), "relationships": relationships},
+        "sequence": {"objects": objects, "messages": messages},
+    }
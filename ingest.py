@@ -0,0 +1,174 @@
+"""Streaming ingestion of .docx/.txt story files, cached by content hash.
+
+A .docx is read straight from its ``word/document.xml`` with
+``iterparse``, one paragraph at a time, so paragraphs inside tables and
+list items are included and memory does not grow with the document.
+Repeated stories are dropped.
+"""
+import hashlib
+import io
+import os
+import re
+import threading
+import zipfile
+from collections import OrderedDict, namedtuple
+from xml.etree import ElementTree
+
+from llm_cache import normalize_story
+from stories import assign_story_ids
+
+STORY_FORMATS = {".docx": "docx", ".txt": "txt"}
+INGEST_CACHE_ENTRIES = int(os.getenv("UML_INGEST_CACHE_ENTRIES", 32))
+INGEST_MIN_STORY_CHARS = int(os.getenv("UML_INGEST_MIN_STORY_CHARS", 3))
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_PARAGRAPH = _W + "p"
+_TEXT = _W + "t"
+_TAB = _W + "tab"
+_BREAKS = (_W + "br", _W + "cr")
+# Bullets and typed list numbering ("1.", "2)", "a.", "(iv)") at the start of a line.
+_LIST_MARKER = re.compile(r"^\s*(?:[-*•◦▪·–]|\(?(?:\d{1,3}|[a-zA-Z]|[ivxlcIVXLC]{1,5})[.)])\s+")
+
+Ingested = namedtuple("Ingested", ["stories", "paragraphs", "duplicates", "digest"])
+Ingested.__doc__ = """``stories``: story dicts; ``paragraphs``: non-empty paragraphs read; ``duplicates``: how many
+were dropped as repeats; ``digest``: sha256 of the file content."""
+
+
+def iter_docx_paragraphs(source):
+    """Yield the text of every paragraph of a .docx path or file object, tables included, in document order."""
+    with zipfile.ZipFile(source) as archive, archive.open("word/document.xml") as xml:
+        for _, elem in ElementTree.iterparse(xml, events=("end",)):
+            if elem.tag != _PARAGRAPH:
+                continue
+            parts = []
+            for node in elem.iter():
+                if node.tag == _TEXT:
+                    parts.append(node.text or "")
+                elif node.tag == _TAB:
+                    parts.append("\t")
+                elif node.tag in _BREAKS:
+                    parts.append(" ")
+            # Drop the paragraph's content once read; a nested paragraph (text box) is then not read twice.
+            elem.clear()
+            yield "".join(parts)
+
+
+def iter_text_lines(source):
+    """Yield the lines of a UTF-8 text path or binary file object without reading it whole."""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, encoding="utf-8-sig", errors="replace") as f:
+            yield from f
+        return
+    wrapper = io.TextIOWrapper(source, encoding="utf-8-sig", errors="replace")
+    try:
+        yield from wrapper
+    finally:
+        # Leave the caller's file object open.
+        wrapper.detach()
+
+
+def clean_story(text):
+    """Strip list markers and collapse whitespace; return "" for text too short to be a story."""
+    text = normalize_story(_LIST_MARKER.sub("", text, count=1))
+    return text if len(text) >= INGEST_MIN_STORY_CHARS else ""
+
+
+def ingest_stories(paragraphs):
+    """Clean and deduplicate an iterable of paragraph texts into an :class:`Ingested` (without digest)."""
+    seen = set()
+    texts = []
+    read = 0
+    for paragraph in paragraphs:
+        text = clean_story(paragraph)
+        if not text:
+            continue
+        read += 1
+        key = text.casefold()
+        if key in seen:
+            continue
+        seen.add(key)
+        texts.append(text)
+    return Ingested(assign_story_ids(texts), read, read - len(texts), None)
+
+
+def file_digest(source, chunk_size=1 << 20):
+    """sha256 of a path or binary file object, read in chunks; the file position is restored."""
+    digest = hashlib.sha256()
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+    position = source.tell()
+    source.seek(0)
+    for chunk in iter(lambda: source.read(chunk_size), b""):
+        digest.update(chunk)
+    source.seek(position)
+    return digest.hexdigest()
+
+
+def story_format(name):
+    """Return "docx" or "txt" for a file name, or None."""
+    return STORY_FORMATS.get(os.path.splitext(str(name))[1].lower())
+
+
+def ingest_file(source, fmt):
+    """Read stories from a .docx or .txt path or binary file object."""
+    if fmt == "docx":
+        return ingest_stories(iter_docx_paragraphs(source))
+    if fmt == "txt":
+        return ingest_stories(iter_text_lines(source))
+    raise ValueError(f"Unsupported story file format: {fmt!r}")
+
+
+class IngestCache:
+    """LRU of ingested files keyed by content hash, so the same document is parsed once per process."""
+
+    def __init__(self, max_entries=INGEST_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def ingest(self, source, name=None, fmt=None):
+        """Return the :class:`Ingested` stories of ``source``, parsing it only if its content is new."""
+        fmt = fmt or story_format(name if name is not None else getattr(source, "name", source))
+        digest = file_digest(source)
+        key = (digest, fmt)
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return result
+            self.misses += 1
+        if not isinstance(source, (str, os.PathLike)):
+            source.seek(0)
+        result = ingest_file(source, fmt)._replace(digest=digest)
+        with self._lock:
+            self._entries[key] = result
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+_ingest_cache = None
+_ingest_cache_lock = threading.Lock()
+
+
+def get_ingest_cache():
+    """Return the process-wide ingest cache."""
+    global _ingest_cache
+    with _ingest_cache_lock:
+        if _ingest_cache is None:
+            _ingest_cache = IngestCache()
+        return _ingest_cache
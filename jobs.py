@@ -0,0 +1,200 @@
+"""Background jobs for long generations, shared by all sessions of the process.
+
+A job runs on a bounded worker pool, so a Streamlit session only keeps the
+job ID and polls it; reruns and widget interactions no longer restart or
+cancel the work. Admission control rejects new jobs once too many are
+waiting or one user already runs their share, and identical in-flight
+requests (same key) share one job.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import get_metrics
+
+JOB_WORKERS = int(os.getenv("UML_JOB_WORKERS", 4))
+JOB_MAX_QUEUED = int(os.getenv("UML_JOB_MAX_QUEUED", 32))
+JOB_PER_USER = int(os.getenv("UML_JOB_PER_USER", 2))
+JOB_RESULT_TTL = float(os.getenv("UML_JOB_RESULT_TTL", 30 * 60))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobRejected(Exception):
+    """Raised by :meth:`JobQueue.submit` when admission control turns a job away."""
+
+
+def job_key(*parts):
+    """Stable key for a request: the sha256 of its JSON-serialized parts."""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Job:
+    """One background computation; its function receives the job to report progress."""
+
+    def __init__(self, kind, key):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.key = key
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = ""
+        # Latest partial result (e.g. streamed diagram entries) for a preview.
+        self.partial = None
+        self.result = None
+        self.error = None
+        self.owners = set()
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.future = None
+
+    def report(self, progress=None, message=None, partial=None):
+        """Update the progress (0-1), status message and/or partial result; safe from any thread."""
+        if progress is not None:
+            self.progress = max(0.0, min(1.0, progress))
+        if message is not None:
+            self.message = message
+        if partial is not None:
+            self.partial = partial
+
+    @property
+    def done(self):
+        return self.status in FINISHED
+
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+
+class JobQueue:
+    """Bounded pool of workers with admission control and deduplication of in-flight jobs.
+
+    At most ``max_queued`` jobs wait for a worker and each owner (a session
+    or user ID) has at most ``per_user`` unfinished jobs. Finished jobs are
+    kept for ``result_ttl`` seconds so their owners can fetch the result.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, max_queued=JOB_MAX_QUEUED, per_user=JOB_PER_USER,
+                 result_ttl=JOB_RESULT_TTL):
+        self.max_queued = max_queued
+        self.per_user = per_user
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._stats = {"submitted": 0, "deduplicated": 0, "rejected": 0, "done": 0, "failed": 0, "cancelled": 0}
+
+    def submit(self, owner, kind, key, fn, *args, **kwargs):
+        """Run ``fn(job, *args, **kwargs)`` in the background and return its :class:`Job`.
+
+        If a job with the same ``key`` is still queued or running, ``owner``
+        joins it instead. Raises :class:`JobRejected` when the queue is full
+        or ``owner`` already has ``per_user`` unfinished jobs.
+        """
+        with self._lock:
+            self._prune()
+            job = self._inflight.get(key)
+            if job is not None:
+                job.owners.add(owner)
+                self._stats["deduplicated"] += 1
+                return job
+            active = [j for j in self._jobs.values() if not j.done]
+            if sum(owner in j.owners for j in active) >= self.per_user:
+                self._stats["rejected"] += 1
+                raise JobRejected(f"At most {self.per_user} jobs per user can run at once")
+            if sum(j.status == QUEUED for j in active) >= self.max_queued:
+                self._stats["rejected"] += 1
+                raise JobRejected("The job queue is full")
+            job = Job(kind, key)
+            job.owners.add(owner)
+            self._jobs[job.id] = job
+            self._inflight[key] = job
+            self._stats["submitted"] += 1
+            job.future = self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        with self._lock:
+            if job.status != QUEUED:
+                return
+            job.status = RUNNING
+            job.started = time.time()
+        get_metrics().observe("job.wait", job.started - job.created, kind=job.kind)
+        try:
+            result = fn(job, *args, **kwargs)
+        except Exception as e:
+            self._finish(job, FAILED, error=e)
+        else:
+            self._finish(job, DONE, result=result)
+
+    def _finish(self, job, status, result=None, error=None):
+        with self._lock:
+            job.result = result
+            job.error = error
+            job.finished = time.time()
+            job.status = status
+            if status == DONE:
+                job.progress = 1.0
+            self._stats[status] += 1
+            if self._inflight.get(job.key) is job:
+                del self._inflight[job.key]
+        if job.started is not None:
+            get_metrics().observe(f"job.{job.kind}", job.finished - job.started, status=status)
+
+    def get(self, job_id):
+        """Return the job, or None if it is unknown or its result has expired."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id, owner):
+        """Withdraw ``owner`` from a job; a queued job nobody else waits for is cancelled.
+
+        A running job cannot be interrupted and finishes for its other
+        owners (or for the cache). Returns True if the job was cancelled.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+            job.owners.discard(owner)
+            if job.owners or job.status != QUEUED or not job.future.cancel():
+                return False
+        self._finish(job, CANCELLED)
+        return True
+
+    def _prune(self):
+        limit = time.time() - self.result_ttl
+        for job_id in [i for i, j in self._jobs.items() if j.done and j.finished < limit]:
+            del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            active = [j for j in self._jobs.values() if not j.done]
+            return dict(self._stats, queued=sum(j.status == QUEUED for j in active),
+                        running=sum(j.status == RUNNING for j in active), kept=len(self._jobs))
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Return the process-wide job queue."""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+        return _job_queue
@@ -0,0 +1,87 @@
+"""Calls to the LLM providers, with an optional response cache."""
+import time
+
+from extract import parse_response
+from llm_cache import get_response_cache, make_cache_key
+from metrics import get_metrics
+from prompts import REPAIR_PROMPT_VERSION, build_repair_prompt
+from providers import get_provider
+
+
+def call_llm(prompt, model_option, selected_model, api_key, max_tokens, temperature):
+    """Send a single-message prompt to the selected provider and return the response text."""
+    return get_provider(model_option, api_key).complete(prompt, selected_model, max_tokens, temperature)
+
+
+def complete(prompt, model_option, selected_model, api_key, max_tokens, temperature,
+             kind, stories, prompt_version, bypass_cache=False, cache=None):
+    """Like :func:`call_llm`, but serve and store the response through the response cache.
+
+    The cache key is built from ``kind``, the normalized ``stories``, the model,
+    the temperature and ``prompt_version``. With ``bypass_cache`` the provider
+    is always called and the fresh response replaces the cached one.
+    """
+    cache = cache if cache is not None else get_response_cache()
+    key = make_cache_key(kind, stories, selected_model, temperature, prompt_version)
+    metrics = get_metrics()
+    if not bypass_cache:
+        response_text = cache.get(key)
+        if response_text is not None:
+            metrics.count("llm.cache_hits")
+            return response_text
+    with metrics.span(f"llm.{kind}", model=selected_model):
+        response_text = call_llm(prompt, model_option, selected_model, api_key, max_tokens, temperature)
+    _count_call(metrics, prompt, response_text)
+    cache.put(key, response_text)
+    return response_text
+
+
+def _count_call(metrics, prompt, response_text):
+    metrics.count("llm.calls")
+    metrics.count("llm.prompt_chars", len(prompt))
+    metrics.count("llm.response_chars", len(response_text))
+
+
+def stream_llm(prompt, model_option, selected_model, api_key, max_tokens, temperature):
+    """Like :func:`call_llm`, but yield the response text in chunks as it is generated."""
+    return get_provider(model_option, api_key).stream(prompt, selected_model, max_tokens, temperature)
+
+
+def stream_complete(prompt, model_option, selected_model, api_key, max_tokens, temperature,
+                    kind, stories, prompt_version, bypass_cache=False, cache=None):
+    """Streaming counterpart of :func:`complete`.
+
+    A cached response is yielded as a single chunk; a fresh one is streamed
+    and stored in the cache once it has been received completely.
+    """
+    cache = cache if cache is not None else get_response_cache()
+    key = make_cache_key(kind, stories, selected_model, temperature, prompt_version)
+    metrics = get_metrics()
+    if not bypass_cache:
+        response_text = cache.get(key)
+        if response_text is not None:
+            metrics.count("llm.cache_hits")
+            yield response_text
+            return
+    parts = []
+    start = time.perf_counter()
+    for chunk in stream_llm(prompt, model_option, selected_model, api_key, max_tokens, temperature):
+        parts.append(chunk)
+        yield chunk
+    # Time to the last chunk, including the time the caller spent on each chunk.
+    metrics.observe(f"llm.{kind}", time.perf_counter() - start, model=selected_model, streamed=True)
+    response_text = "".join(parts)
+    _count_call(metrics, prompt, response_text)
+    cache.put(key, response_text)
+
+
+def parse_llm_json(response_text, kind, model_option, selected_model, api_key, bypass_cache=False):
+    """Extract and validate the JSON of a response, with one small "repair only" retry if needed."""
+    def repair(text, errors):
+        return complete(
+            build_repair_prompt(text, errors), model_option, selected_model, api_key,
+            max_tokens=8096, temperature=0, kind=f"repair-{kind}", stories=[text],
+            prompt_version=REPAIR_PROMPT_VERSION, bypass_cache=bypass_cache,
+        )
+    with get_metrics().span(f"extract.{kind}"):
+        return parse_response(response_text, kind, repair=repair)
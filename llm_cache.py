@@ -0,0 +1,125 @@
+"""Persistent SQLite cache of LLM responses with TTL and LRU eviction."""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+LLM_CACHE_PATH = os.getenv(
+    "UML_LLM_CACHE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "uml-diagram-generator", "llm_cache.sqlite3"),
+)
+LLM_CACHE_TTL = float(os.getenv("UML_LLM_CACHE_TTL", 7 * 24 * 3600))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("UML_LLM_CACHE_MAX_ENTRIES", 5000))
+
+
+def normalize_story(text):
+    """Normalize a story so whitespace and Unicode form differences hash the same."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def make_cache_key(kind, stories, model, temperature, prompt_version):
+    """Return the cache key of an LLM call over ``stories``."""
+    payload = json.dumps(
+        {
+            "kind": kind,
+            "stories": [normalize_story(s) for s in stories],
+            "model": model,
+            "temperature": temperature,
+            "prompt_version": prompt_version,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Raw LLM response texts keyed by :func:`make_cache_key`.
+
+    Entries older than ``ttl`` seconds are treated as misses and purged;
+    beyond ``max_entries`` the least recently used entries are evicted.
+    """
+
+    def __init__(self, path=LLM_CACHE_PATH, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " response TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+
+    def get(self, key):
+        """Return the cached response for ``key``, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            response, created = row
+            if self.ttl and now - created > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self._stats["hits"] += 1
+            return response
+
+    def put(self, key, response):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, response, now, now),
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > self.max_entries:
+                cursor = self._conn.execute(
+                    "DELETE FROM responses WHERE key IN"
+                    " (SELECT key FROM responses ORDER BY accessed LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+                self._stats["evictions"] += cursor.rowcount
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            return stats
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Return the process-wide LLM response cache."""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+        return _response_cache
@@ -0,0 +1,156 @@
+"""Per-stage timing spans, counters and an optional cProfile hook for the pipeline.
+
+Stages time themselves with ``get_metrics().span("llm.functional")`` and
+count tokens and bytes with ``get_metrics().count(...)``. The process-wide
+:class:`Metrics` is exported as JSON (:meth:`Metrics.to_json`) or in the
+Prometheus text format (:meth:`Metrics.to_prometheus`).
+"""
+import cProfile
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+METRICS_SAMPLES = int(os.getenv("UML_METRICS_SAMPLES", 1024))
+METRICS_RECENT_SPANS = int(os.getenv("UML_METRICS_RECENT_SPANS", 256))
+# Directory for cProfile dumps; profiling is off when empty.
+METRICS_PROFILE_DIR = os.getenv("UML_METRICS_PROFILE_DIR", "")
+METRICS_PREFIX = "uml"
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _quantile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class Metrics:
+    """Thread-safe timing spans and counters.
+
+    Each span name keeps its count, total and maximum plus the last
+    ``samples`` durations for quantiles; the last ``recent`` spans are kept
+    as structured records (name, start, duration, thread, attributes).
+    """
+
+    def __init__(self, samples=METRICS_SAMPLES, recent=METRICS_RECENT_SPANS):
+        self.samples = samples
+        self._lock = threading.Lock()
+        self._spans = {}
+        self._counters = {}
+        self._recent = deque(maxlen=recent)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Time the block as one ``name`` span; the span is recorded even if the block raises."""
+        started = time.time()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, started, **attributes)
+
+    def observe(self, name, seconds, started=None, **attributes):
+        """Record a span measured elsewhere (e.g. a render timed by its worker thread)."""
+        with self._lock:
+            stats = self._spans.get(name)
+            if stats is None:
+                stats = self._spans[name] = {"count": 0, "total": 0.0, "max": 0.0,
+                                             "samples": deque(maxlen=self.samples)}
+            stats["count"] += 1
+            stats["total"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+            stats["samples"].append(seconds)
+            record = {"name": name, "start": started if started is not None else time.time() - seconds,
+                      "seconds": seconds, "thread": threading.current_thread().name}
+            if attributes:
+                record["attributes"] = attributes
+            self._recent.append(record)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+            self._recent.clear()
+
+    def snapshot(self):
+        """``{"spans": {name: stats}, "counters": {name: value}, "recent": [span records]}``."""
+        with self._lock:
+            spans = {name: (dict(stats), sorted(stats["samples"])) for name, stats in self._spans.items()}
+            counters = dict(self._counters)
+            recent = list(self._recent)
+        result = {}
+        for name, (stats, ordered) in sorted(spans.items()):
+            summary = {"count": stats["count"], "total": stats["total"], "mean": stats["total"] / stats["count"],
+                       "max": stats["max"]}
+            for q in QUANTILES:
+                summary[f"p{int(q * 100)}"] = _quantile(ordered, q)
+            result[name] = summary
+        return {"spans": result, "counters": dict(sorted(counters.items())), "recent": recent}
+
+    def to_json(self, indent=None):
+        return json.dumps(self.snapshot(), indent=indent)
+
+    def to_prometheus(self, prefix=METRICS_PREFIX):
+        """Spans as one ``<prefix>_stage_seconds`` summary labelled by stage; counters as ``_total`` counters."""
+        snapshot = self.snapshot()
+        lines = [f"# HELP {prefix}_stage_seconds Time spent per pipeline stage.",
+                 f"# TYPE {prefix}_stage_seconds summary"]
+        for name, stats in snapshot["spans"].items():
+            label = f'stage="{name}"'
+            for q in QUANTILES:
+                lines.append(f'{prefix}_stage_seconds{{{label},quantile="{q}"}} {stats[f"p{int(q * 100)}"]:.6f}')
+            lines.append(f"{prefix}_stage_seconds_sum{{{label}}} {stats['total']:.6f}")
+            lines.append(f"{prefix}_stage_seconds_count{{{label}}} {stats['count']}")
+        for name, value in snapshot["counters"].items():
+            metric = f"{prefix}_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics():
+    """Return the process-wide metrics registry."""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+        return _metrics
+
+
+_profile_lock = threading.Lock()
+
+
+@contextmanager
+def profiled(label, directory=None):
+    """Run the block under cProfile and dump the stats to ``<directory>/<label>-<time>.prof``.
+
+    ``directory`` defaults to ``UML_METRICS_PROFILE_DIR``; without one this
+    does nothing. Only one block is profiled at a time, and cProfile only
+    sees the thread that entered the block. Yields the dump path or None.
+    """
+    directory = directory if directory is not None else METRICS_PROFILE_DIR
+    if not directory or not _profile_lock.acquire(blocking=False):
+        yield None
+        return
+    try:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{label}-{time.time_ns()}.prof")
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield path
+        finally:
+            profile.disable()
+            profile.dump_stats(path)
+    finally:
+        _profile_lock.release()
@@ -0,0 +1,129 @@
+"""Split oversized class diagrams into size-bounded sub-diagrams that render quickly."""
+import os
+from collections import deque, namedtuple
+
+from diagram_model import Class, ClassModel
+
+PARTITION_MAX_CLASSES = int(os.getenv("UML_PARTITION_MAX_CLASSES", 25))
+# Roughly what the public PlantUML server still accepts once encoded into the URL.
+PARTITION_MAX_SOURCE_CHARS = int(os.getenv("UML_PARTITION_MAX_SOURCE_CHARS", 6000))
+
+Partition = namedtuple("Partition", ["clusters", "members", "links"])
+Partition.__doc__ = """``clusters``: one ClassModel per sub-diagram; ``members``: the class names each cluster owns
+(its other classes are stubs); ``links``: {(i, j): number of relationships from cluster i to j}."""
+
+
+def class_weight(cls):
+    """Approximate PlantUML characters needed to declare ``cls``."""
+    return 16 + len(cls.name) + sum(len(a) + 3 for a in cls.attributes) + sum(len(m) + 3 for m in cls.methods)
+
+
+def connected_components(model):
+    """Return the class names of each connected component, largest first."""
+    parent = {name: name for name in model.index}
+
+    def find(name):
+        while parent[name] != name:
+            parent[name] = parent[parent[name]]
+            name = parent[name]
+        return name
+
+    for rel in model.relationships:
+        a, b = find(rel.source), find(rel.target)
+        if a != b:
+            parent[a] = b
+    groups = {}
+    for name in model.index:
+        groups.setdefault(find(name), []).append(name)
+    return sorted(groups.values(), key=len, reverse=True)
+
+
+def _split(names, adjacency, weights, max_classes, max_chars):
+    # Breadth-first from the best connected class, so neighbours land in the same cluster.
+    remaining = set(names)
+    clusters = []
+    current, size = [], 0
+    while remaining:
+        start = max(remaining, key=lambda n: (len(adjacency[n]), n))
+        queue = deque([start])
+        remaining.discard(start)
+        while queue:
+            name = queue.popleft()
+            if current and (len(current) >= max_classes or size + weights[name] > max_chars):
+                clusters.append(current)
+                current, size = [], 0
+            current.append(name)
+            size += weights[name]
+            for neighbour in sorted(adjacency[name]):
+                if neighbour in remaining:
+                    remaining.discard(neighbour)
+                    queue.append(neighbour)
+    if current:
+        clusters.append(current)
+    return clusters
+
+
+def _pack(groups, weights, max_classes, max_chars):
+    # First-fit decreasing, so many small components share a diagram.
+    bins = []
+    for group in sorted(groups, key=len, reverse=True):
+        size = sum(weights[n] for n in group)
+        for b in bins:
+            if len(b[0]) + len(group) <= max_classes and b[1] + size <= max_chars:
+                b[0].extend(group)
+                b[1] += size
+                break
+        else:
+            bins.append([list(group), size])
+    return [b[0] for b in bins]
+
+
+def needs_partition(model, max_classes=PARTITION_MAX_CLASSES, max_chars=PARTITION_MAX_SOURCE_CHARS):
+    if len(model.classes) > max_classes:
+        return True
+    return sum(class_weight(c) for c in model.classes) + 40 * len(model.relationships) > max_chars
+
+
+def partition_class_model(model, max_classes=PARTITION_MAX_CLASSES, max_chars=PARTITION_MAX_SOURCE_CHARS):
+    """Split ``model`` along connected components, then into clusters of at most ``max_classes`` classes.
+
+    Each cluster becomes a ClassModel holding its classes, every relationship
+    touching them and member-less stubs for the classes at the other end of
+    relationships that leave the cluster. A model that already fits is
+    returned as a single cluster.
+    """
+    if not needs_partition(model, max_classes, max_chars):
+        return Partition([model], [list(model.index)], {})
+    weights = {cls.name: class_weight(cls) for cls in model.classes}
+    adjacency = {name: set() for name in model.index}
+    for rel in model.relationships:
+        adjacency[rel.source].add(rel.target)
+        adjacency[rel.target].add(rel.source)
+
+    small, groups = [], []
+    for component in connected_components(model):
+        if len(component) > max_classes or sum(weights[n] for n in component) > max_chars:
+            groups.extend(_split(component, adjacency, weights, max_classes, max_chars))
+        else:
+            small.append(component)
+    groups.extend(_pack(small, weights, max_classes, max_chars))
+
+    cluster_of = {name: i for i, group in enumerate(groups) for name in group}
+    relationships = [[] for _ in groups]
+    links = {}
+    for rel in model.relationships:
+        i, j = cluster_of[rel.source], cluster_of[rel.target]
+        relationships[i].append(rel)
+        if i != j:
+            relationships[j].append(rel)
+            links[(i, j)] = links.get((i, j), 0) + 1
+
+    clusters = []
+    for group, rels in zip(groups, relationships):
+        index = {name: model.index[name] for name in group}
+        for rel in rels:
+            for name in (rel.source, rel.target):
+                if name not in index:
+                    index[name] = Class(name)
+        clusters.append(ClassModel(list(index.values()), rels, index))
+    return Partition(clusters, groups, links)
@@ -0,0 +1,226 @@
+"""The story-to-diagram pipeline without any UI, shared by app.py and cli.py.
+
+Importing this module does not import Streamlit.
+"""
+import json
+import os
+import time
+from collections import namedtuple
+
+from classify import classify_in_batches
+from diagram_model import build_class_model, build_deployment_model, build_sequence_model
+from emitters import (
+    generate_class_plantuml,
+    generate_deployment_plantuml,
+    generate_overview_plantuml,
+    generate_sequence_plantuml,
+)
+from export import export_file_name, export_many
+from ingest import STORY_FORMATS, ingest_file, ingest_stories, story_format
+from incremental import merge_delta, plan_regeneration
+from llm import complete, parse_llm_json, stream_complete
+from metrics import get_metrics
+from partition import partition_class_model
+from prompts import (
+    DEPLOYMENT_PROMPT_VERSION,
+    FUNCTIONAL_DELTA_PROMPT_VERSION,
+    FUNCTIONAL_PROMPT_VERSION,
+    build_deployment_prompt,
+    build_functional_delta_prompt,
+    build_functional_prompt,
+)
+from providers import ANTHROPIC, MODELS
+from render import render_many
+from stories import StoryIndex
+from streaming import consume_stream
+
+DEFAULT_MODELS = {provider: next(iter(models.values())) for provider, models in MODELS.items()}
+
+LLMConfig = namedtuple("LLMConfig", ["model_option", "selected_model", "api_key", "bypass_cache"],
+                       defaults=(None, False))
+
+
+def split_story_lines(text):
+    """Return story dicts for the non-empty, non-repeated lines of ``text``."""
+    return ingest_stories(text.splitlines()).stories
+
+
+def load_stories(source, fmt=None):
+    """Load story dicts from a ``.docx`` or ``.txt`` path or binary file object (see :mod:`ingest`).
+
+    ``fmt`` ("docx" or "txt") defaults to the extension of ``source`` (or
+    of its ``name`` attribute for uploaded files).
+    """
+    if fmt is None:
+        fmt = story_format(source if isinstance(source, (str, os.PathLike)) else getattr(source, "name", ""))
+    return ingest_file(source, fmt).stories
+
+
+def classify(stories, config, progress_callback=None):
+    """Split ``stories`` into ``(functional, non_functional)`` lists of story dicts."""
+    with get_metrics().span("classify", stories=len(stories)):
+        result = classify_in_batches(
+            stories, config.model_option, config.selected_model, config.api_key, config.bypass_cache,
+            progress_callback=progress_callback,
+        )
+    index = StoryIndex(stories)
+    return index.select(result["Functional"]), index.select(result["Non-Functional"])
+
+
+def _llm_args(prompt, config, max_tokens, temperature):
+    return (prompt, config.model_option, config.selected_model, config.api_key, max_tokens, temperature)
+
+
+def _generate(prompt, config, max_tokens, temperature, kind, stories, prompt_version, on_items):
+    args = _llm_args(prompt, config, max_tokens, temperature)
+    kwargs = dict(kind=kind, stories=stories, prompt_version=prompt_version, bypass_cache=config.bypass_cache)
+    if on_items is not None:
+        response_text = consume_stream(stream_complete(*args, **kwargs), on_items=on_items)
+    else:
+        response_text = complete(*args, **kwargs)
+    return parse_llm_json(response_text, kind, config.model_option, config.selected_model, config.api_key,
+                          config.bypass_cache)
+
+
+def generate_functional(stories, config, previous_model=None, on_items=None):
+    """Generate the class and sequence data for ``stories``.
+
+    With ``previous_model`` (the value of :func:`functional_state` from an
+    earlier run) only the story diff is sent when that is worth it. Returns
+    ``(mode, story_diff, data)`` where ``mode`` is "full", "delta" or
+    "reuse" (see :func:`incremental.plan_regeneration`). ``on_items`` streams
+    the full generation and receives the partial entries as they arrive.
+    """
+    mode, story_diff = plan_regeneration(previous_model, stories, config.model_option, config.selected_model,
+                                         config.bypass_cache)
+    if mode == "reuse":
+        return mode, story_diff, {"class": previous_model["class"], "sequence": previous_model["sequence"]}
+    if mode == "delta":
+        current_model = {"class": previous_model["class"], "sequence": previous_model["sequence"]}
+        changed_texts = [s["text"] for s in story_diff["added"] + story_diff["edited"]]
+        removed_texts = [s["text"] for s in story_diff["deleted"]]
+        prompt = build_functional_delta_prompt(current_model, changed_texts, removed_texts)
+        delta = _generate(
+            prompt, config, 4096, 0.1, "functional-delta",
+            [json.dumps(current_model, ensure_ascii=False, sort_keys=True)]
+            + ["+" + t for t in changed_texts] + ["-" + t for t in removed_texts],
+            FUNCTIONAL_DELTA_PROMPT_VERSION, None,
+        )
+        return mode, story_diff, merge_delta(current_model, delta)
+    prompt_stories = [s["text"] for s in stories]
+    max_tokens, temperature = (8096, 1) if config.model_option == ANTHROPIC else (11000, 0.1)
+    data = _generate(build_functional_prompt(prompt_stories), config, max_tokens, temperature, "functional",
+                     prompt_stories, FUNCTIONAL_PROMPT_VERSION, on_items)
+    return mode, story_diff, data
+
+
+def generate_deployment(stories, config, on_items=None):
+    """Generate the deployment data for ``stories``."""
+    prompt_stories = [s["text"] for s in stories]
+    max_tokens, temperature = (8096, 1) if config.model_option == ANTHROPIC else (4096, 0.1)
+    return _generate(build_deployment_prompt(prompt_stories), config, max_tokens, temperature, "deployment",
+                     prompt_stories, DEPLOYMENT_PROMPT_VERSION, on_items)
+
+
+FunctionalDiagrams = namedtuple("FunctionalDiagrams", ["class_model", "sequence_model", "partition", "sources"])
+
+
+def emit_functional(data):
+    """Build the models for ``data`` and their PlantUML.
+
+    ``sources`` always holds "class" and "sequence"; when the class diagram
+    is too large to render at once it also holds "class_overview" and one
+    "class_<n>" per cluster (see :mod:`partition`).
+    """
+    metrics = get_metrics()
+    with metrics.span("emit.functional"):
+        class_model = build_class_model(data["class"])
+        sequence_model = build_sequence_model(data["sequence"])
+        partition = partition_class_model(class_model)
+        sources = {"class": generate_class_plantuml(class_model),
+                   "sequence": generate_sequence_plantuml(sequence_model)}
+        if len(partition.clusters) > 1:
+            sources["class_overview"] = generate_overview_plantuml(partition)
+            for i, cluster in enumerate(partition.clusters, 1):
+                sources[f"class_{i}"] = generate_class_plantuml(cluster)
+    metrics.count("emit.plantuml_chars", sum(len(source) for source in sources.values()))
+    return FunctionalDiagrams(class_model, sequence_model, partition, sources)
+
+
+def functional_state(stories, diagrams, config):
+    """Return what :func:`generate_functional` needs as ``previous_model`` next time."""
+    return {
+        "provider": config.model_option,
+        "model": config.selected_model,
+        "stories": {s["id"]: s["text"] for s in stories},
+        "class": diagrams.class_model.to_dict(),
+        "sequence": diagrams.sequence_model.to_dict(),
+    }
+
+
+def emit_deployment(data):
+    """Return ``(deployment_model, {"deployment": PlantUML})``."""
+    metrics = get_metrics()
+    with metrics.span("emit.deployment"):
+        model = build_deployment_model(data)
+        source = generate_deployment_plantuml(model)
+    metrics.count("emit.plantuml_chars", len(source))
+    return model, {"deployment": source}
+
+
+def render_targets(sources):
+    """Names in ``sources`` worth rendering: a partitioned class diagram is rendered per cluster."""
+    if "class_overview" in sources:
+        return [name for name in sources if name != "class"]
+    return list(sources)
+
+
+def render(sources, fmt="png", renderer=None):
+    """Render the :func:`render_targets` of ``sources`` concurrently; yields RenderResults as they finish."""
+    return render_many({name: sources[name] for name in render_targets(sources)}, fmt=fmt, renderer=renderer)
+
+
+def export(sources, formats, renderer=None):
+    """Like :func:`render` for several formats at once: one SVG render per diagram (see :mod:`export`)."""
+    return export_many({name: sources[name] for name in render_targets(sources)}, formats, renderer=renderer)
+
+
+FileResult = namedtuple("FileResult", ["path", "stories", "outputs", "errors", "elapsed"])
+
+
+def process_file(path, out_dir, config, formats=("puml", "png"), renderer=None):
+    """Run the whole pipeline for one story file and write its diagrams to ``out_dir``.
+
+    Files are named ``diagram_<name>.<format>``. Render failures are
+    collected in ``FileResult.errors`` instead of being raised.
+    """
+    start = time.perf_counter()
+    stories = load_stories(path)
+    functional, non_functional = classify(stories, config) if stories else ([], [])
+    sources = {}
+    if functional:
+        _, _, data = generate_functional(functional, config)
+        sources.update(emit_functional(data).sources)
+    if non_functional:
+        sources.update(emit_deployment(generate_deployment(non_functional, config))[1])
+
+    os.makedirs(out_dir, exist_ok=True)
+    outputs = []
+    errors = []
+    if "puml" in formats:
+        for name, source in sources.items():
+            out_path = os.path.join(out_dir, export_file_name(name, "puml"))
+            with open(out_path, "w", encoding="utf-8") as f:
+                f.write(source)
+            outputs.append(out_path)
+    image_formats = [fmt for fmt in formats if fmt != "puml"]
+    if image_formats:
+        for result in export(sources, image_formats, renderer):
+            for fmt, error in result.errors.items():
+                errors.append(f"{result.name}.{fmt}: {error}")
+            for fmt, data in result.files.items():
+                out_path = os.path.join(out_dir, export_file_name(result.name, fmt))
+                with open(out_path, "wb") as f:
+                    f.write(data)
+                outputs.append(out_path)
+    return FileResult(path, len(stories), outputs, errors, time.perf_counter() - start)
@@ -0,0 +1,144 @@
+"""Prompt templates for the LLM calls.
+
+Each template has a version string that is part of the LLM response cache
+key. Bump it whenever the template text changes so stale responses are not
+served for the new prompt.
+"""
+import json
+
+CLASSIFY_PROMPT_VERSION = "classify-v2"
+FUNCTIONAL_PROMPT_VERSION = "functional-v1"
+DEPLOYMENT_PROMPT_VERSION = "deployment-v1"
+FUNCTIONAL_DELTA_PROMPT_VERSION = "functional-delta-v1"
+REPAIR_PROMPT_VERSION = "repair-v1"
+
+
+def build_classify_prompt(stories):
+    """``stories`` is a list of ``{"id", "text"}`` dicts; the model answers with IDs only."""
+    story_lines = "\n".join(json.dumps({"id": s["id"], "text": s["text"]}, ensure_ascii=False) for s in stories)
+    return f"""
+    {story_lines}
+
+    Bạn là một chuyên gia phân tích hệ thống phần mềm. Hãy phân loại các câu chuyện người dùng (user stories) ở trên (mỗi dòng là một JSON có "id" và "text") thành các loại sau: 
+    - Functional
+    - Non-Functional
+
+    Chỉ trả về "id" của từng user story, không lặp lại nội dung. Mỗi id xuất hiện đúng một lần.
+    Trả về JSON với định dạng sau:
+    {{
+        "Functional": [
+            "id1",
+            "id2"
+        ],
+        "Non-Functional": [
+            "id3",
+            "id4"
+        ]
+    }}
+    """
+
+
+def build_functional_prompt(stories):
+    return f"""
+        json{stories}
+
+        Bạn là chuyên gia phân tích hệ thống phần mềm. Hãy thực hiện các bước sau và chỉ trả về một đối tượng JSON duy nhất với 2 trường: \"class\", \"sequence\". 
+        **YÊU CẦU BẮT BUỘC:** Mỗi trường trong JSON phải luôn có đầy đủ các trường con như mô tả dưới đây, kể cả khi không có dữ liệu thì trả về mảng rỗng.
+
+        **PHẦN 1: Class Diagram**
+        - Liệt kê tất cả các class, thuộc tính, phương thức.
+        - Liệt kê tất cả các mối quan hệ giữa các class (Association, Aggregation, Composition, Inheritance).
+        - Mỗi quan hệ phải có trường \"RelationshipType\" (ví dụ: Association, Aggregation, ...), và \"Multiplicity\" (ví dụ: 1-1, 1-n, n-n, hoặc rỗng nếu không xác định).
+        - Nếu không có mối quan hệ nào, trả về \"relationships\": [].
+        Trả về JSON:
+        \"class\": {{
+            \"classes\": [
+                {{
+                    \"name\": \"ClassName\",
+                    \"attributes\": [...],
+                    \"methods\": [...]
+                }},
+                ...
+            ],
+            \"relationships\": [
+                [\"Class1\", \"Class2\", \"RelationshipType\", \"Multiplicity\"],
+                ...
+            ]
+        }}
+
+        **PHẦN 2: Sequence Diagram**
+        - Liệt kê các đối tượng (objects/lifelines) tham gia vào kịch bản chính.
+        - Liệt kê các thông điệp (messages) trao đổi giữa các đối tượng theo thứ tự thời gian.
+        - Nếu không có đối tượng hoặc thông điệp nào, trả về mảng rỗng.
+        Trả về JSON:
+        \"sequence\": {{
+            \"objects\": [...],
+            \"messages\": [[\"Sender\", \"Receiver\", \"Message\"], ...]
+        }}
+
+        **LƯU Ý QUAN TRỌNG:**  
+        - JSON trả về phải luôn có đầy đủ các trường như trên, kể cả khi không có dữ liệu thì trả về mảng rỗng.
+        - Không được bỏ sót bất kỳ trường nào.
+        - Không trả về giải thích, chỉ trả về đúng một đối tượng JSON duy nhất theo cấu trúc trên.
+        """
+
+
+def build_functional_delta_prompt(model, changed_stories, removed_stories):
+    """Ask only for the changes to an existing class/sequence model.
+
+    ``model`` is ``{"class": ..., "sequence": ...}`` as produced by
+    :func:`build_functional_prompt`; ``changed_stories`` are the added or
+    edited story texts and ``removed_stories`` the deleted ones.
+    """
+    current = json.dumps(model, ensure_ascii=False, separators=(",", ":"))
+    return f"""
+        Mô hình hiện tại (JSON) của class diagram và sequence diagram:
+        {current}
+
+        User story mới hoặc đã sửa:
+        {json.dumps(changed_stories, ensure_ascii=False)}
+
+        User story đã bị xóa:
+        {json.dumps(removed_stories, ensure_ascii=False)}
+
+        Bạn là chuyên gia phân tích hệ thống phần mềm. Hãy cập nhật mô hình hiện tại cho phù hợp với các thay đổi trên.
+        CHỈ trả về phần thay đổi (delta), không trả lại toàn bộ mô hình, dưới dạng một đối tượng JSON duy nhất:
+        {{
+            \"class\": {{
+                \"upsert_classes\": [{{\"name\": \"ClassName\", \"attributes\": [...], \"methods\": [...]}}],
+                \"remove_classes\": [\"ClassName\"],
+                \"add_relationships\": [[\"Class1\", \"Class2\", \"RelationshipType\", \"Multiplicity\"]],
+                \"remove_relationships\": [[\"Class1\", \"Class2\", \"RelationshipType\", \"Multiplicity\"]]
+            }},
+            \"sequence\": {{
+                \"add_objects\": [...],
+                \"remove_objects\": [...],
+                \"add_messages\": [[\"Sender\", \"Receiver\", \"Message\"]],
+                \"remove_messages\": [[\"Sender\", \"Receiver\", \"Message\"]]
+            }}
+        }}
+
+        - \"upsert_classes\" chứa class mới hoặc class đã thay đổi, với đầy đủ thuộc tính và phương thức.
+        - Chỉ xóa những gì chỉ phục vụ cho user story đã bị xóa.
+        - Trường nào không có thay đổi thì trả về mảng rỗng.
+        - Không trả về giải thích, chỉ trả về đúng một đối tượng JSON duy nhất.
+        """
+
+
+def build_deployment_prompt(stories):
+    return f"""
+    {stories}\n\nBạn là chuyên gia phân tích hệ thống phần mềm. Hãy phân tích các yêu cầu phi chức năng trên và trả về một đối tượng JSON duy nhất mô tả deployment diagram với các trường sau:\n\n{{\n  \"components\": [{{\"name\": \"NodeName\", \"services\": [\"Service1\", ...]}}, ...],\n  \"relationships\": [[\"Node1\", \"Node2\", \"Kết nối hoặc giao thức\"], ...]\n}}\n\n- Luôn trả về đầy đủ các trường như trên, kể cả khi không có dữ liệu thì trả về mảng rỗng.\n- Không giải thích, chỉ trả về đúng một đối tượng JSON duy nhất.\n"""
+
+
+def build_repair_prompt(response_text, errors):
+    """Ask the model to fix only the JSON structure of a previous answer."""
+    error_lines = "\n".join(f"- {e}" for e in errors[:20])
+    return f"""
+    Đoạn JSON dưới đây bị lỗi cấu trúc:
+    {error_lines}
+
+    Hãy sửa lại để JSON hợp lệ và đúng cấu trúc được mô tả bởi các lỗi trên. Giữ nguyên nội dung, không thêm hay bớt dữ liệu.
+    Không giải thích, chỉ trả về đúng một đối tượng JSON duy nhất.
+
+    {response_text}
+    """
@@ -0,0 +1,346 @@
+"""LLM provider layer: pooled async clients shared per process, plus an offline fake provider.
+
+Every provider runs on one background asyncio event loop, so its HTTP
+connections (keep-alive, TLS sessions) are reused by every Streamlit
+session and every call. Synchronous callers use :meth:`Provider.complete`
+and :meth:`Provider.stream`, which hop onto that loop.
+"""
+import ast
+import asyncio
+import hashlib
+import json
+import os
+import queue
+import re
+import threading
+
+from metrics import get_metrics
+
+ANTHROPIC = "Anthropic Claude"
+OPENAI = "OpenAI GPT"
+FAKE = "Fake (offline)"
+
+# Display name -> model id, first entry is the default.
+MODELS = {
+    ANTHROPIC: {
+        "Claude 3.7 Sonnet": "claude-3-7-sonnet-latest",
+        "Claude 3.5 Sonnet": "claude-3-5-sonnet-latest",
+        "Claude 3.5 Haiku": "claude-3-5-haiku-latest",
+    },
+    OPENAI: {
+        "GPT-4o": "gpt-4o-2024-08-06",
+        "GPT-4.1": "gpt-4.1-2025-04-14",
+        "GPT-4o Mini": "gpt-4o-mini",
+        "GPT-3.5 Turbo": "gpt-3.5-turbo",
+    },
+    FAKE: {"Fake": "fake-model"},
+}
+
+PROVIDER_TIMEOUT = float(os.getenv("UML_PROVIDER_TIMEOUT", 180))
+PROVIDER_CONCURRENCY = int(os.getenv("UML_PROVIDER_CONCURRENCY", 8))
+
+
+class ProviderTimeout(Exception):
+    """Raised when a provider request exceeds its timeout."""
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop():
+    """Return the process-wide event loop running in a daemon thread."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-providers", daemon=True).start()
+        return _loop
+
+
+def run_sync(coro):
+    """Run a coroutine on the provider event loop and wait for its result."""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result()
+
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+class Provider:
+    """Base class: bounded concurrency and per-request timeouts around ``_complete`` / ``_stream``."""
+
+    name = None
+
+    def __init__(self, api_key=None, concurrency=PROVIDER_CONCURRENCY, timeout=PROVIDER_TIMEOUT):
+        self.api_key = api_key
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def acomplete(self, prompt, model, max_tokens, temperature):
+        async with self._semaphore:
+            try:
+                return await asyncio.wait_for(self._complete(prompt, model, max_tokens, temperature), self.timeout)
+            except asyncio.TimeoutError as e:
+                raise ProviderTimeout(f"{self.name} did not answer within {self.timeout}s") from e
+
+    async def astream(self, prompt, model, max_tokens, temperature):
+        async with self._semaphore:
+            async for chunk in self._stream(prompt, model, max_tokens, temperature):
+                yield chunk
+
+    def complete(self, prompt, model, max_tokens, temperature):
+        return run_sync(self.acomplete(prompt, model, max_tokens, temperature))
+
+    def stream(self, prompt, model, max_tokens, temperature):
+        """Yield response chunks synchronously while the request runs on the provider loop."""
+        chunks = queue.Queue()
+
+        async def pump():
+            async for chunk in self.astream(prompt, model, max_tokens, temperature):
+                chunks.put(chunk)
+
+        async def run():
+            try:
+                await asyncio.wait_for(pump(), self.timeout)
+            except asyncio.TimeoutError:
+                chunks.put(_Failure(ProviderTimeout(f"{self.name} did not finish within {self.timeout}s")))
+            except BaseException as e:
+                chunks.put(_Failure(e))
+            finally:
+                chunks.put(_DONE)
+
+        future = asyncio.run_coroutine_threadsafe(run(), get_event_loop())
+        try:
+            while True:
+                item = chunks.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, _Failure):
+                    raise item.error
+                yield item
+        finally:
+            future.cancel()
+
+    async def _complete(self, prompt, model, max_tokens, temperature):
+        raise NotImplementedError
+
+    async def _stream(self, prompt, model, max_tokens, temperature):
+        # Providers without native streaming answer in one chunk.
+        yield await self._complete(prompt, model, max_tokens, temperature)
+
+    async def aclose(self):
+        pass
+
+
+def count_usage(input_tokens, output_tokens):
+    """Add a response's token usage to the ``llm.input_tokens`` / ``llm.output_tokens`` counters."""
+    metrics = get_metrics()
+    metrics.count("llm.input_tokens", input_tokens or 0)
+    metrics.count("llm.output_tokens", output_tokens or 0)
+
+
+class AnthropicProvider(Provider):
+    name = ANTHROPIC
+
+    def __init__(self, api_key, **kwargs):
+        super().__init__(api_key, **kwargs)
+        import anthropic
+
+        # The SDK's own pooled keep-alive client; concurrency is bounded by the provider semaphore.
+        self.client = anthropic.AsyncAnthropic(api_key=api_key, timeout=self.timeout)
+
+    async def _complete(self, prompt, model, max_tokens, temperature):
+        message = await self.client.messages.create(
+            model=model,
+            max_tokens=max_tokens,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=temperature,
+        )
+        count_usage(message.usage.input_tokens, message.usage.output_tokens)
+        return message.content[0].text
+
+    async def _stream(self, prompt, model, max_tokens, temperature):
+        async with self.client.messages.stream(
+            model=model,
+            max_tokens=max_tokens,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=temperature,
+        ) as stream:
+            async for text in stream.text_stream:
+                yield text
+            message = await stream.get_final_message()
+            count_usage(message.usage.input_tokens, message.usage.output_tokens)
+
+    async def aclose(self):
+        await self.client.close()
+
+
+class OpenAIProvider(Provider):
+    name = OPENAI
+
+    def __init__(self, api_key, **kwargs):
+        super().__init__(api_key, **kwargs)
+        import openai
+
+        self.client = openai.AsyncOpenAI(api_key=api_key, timeout=self.timeout)
+
+    async def _complete(self, prompt, model, max_tokens, temperature):
+        response = await self.client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            temperature=temperature,
+        )
+        if response.usage is not None:
+            count_usage(response.usage.prompt_tokens, response.usage.completion_tokens)
+        return response.choices[0].message.content
+
+    async def _stream(self, prompt, model, max_tokens, temperature):
+        response = await self.client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        async for chunk in response:
+            if chunk.usage is not None:
+                count_usage(chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def aclose(self):
+        await self.client.close()
+
+
+_STORY_LINE = re.compile(r'^\s*(\{"id".*\})\s*$', re.MULTILINE)
+_STORY_LIST = re.compile(r"json(\[.*?\])\s*$", re.MULTILINE | re.DOTALL)
+
+
+class FakeProvider(Provider):
+    """Offline provider for load tests: deterministic, schema-valid answers after a simulated delay.
+
+    ``responder(prompt)`` may return the response text (e.g. a recorded
+    response); when it returns None or is not given, a synthetic answer is
+    built from the prompt. ``latency`` is the time to the first chunk and
+    ``chunk_delay`` the pause between streamed chunks.
+    """
+
+    name = FAKE
+
+    def __init__(self, api_key=None, responder=None, latency=0.05, chunk_size=64, chunk_delay=0.0, **kwargs):
+        super().__init__(api_key, **kwargs)
+        self.responder = responder
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.calls = 0
+
+    def respond(self, prompt):
+        self.calls += 1
+        text = self.responder(prompt) if self.responder is not None else None
+        if text is None:
+            text = "```json\n" + json.dumps(fake_answer(prompt), ensure_ascii=False, indent=2) + "\n```"
+        # Simulated usage, with the ~3 characters per token estimate of classify.estimate_tokens.
+        count_usage(len(prompt) // 3 + 1, len(text) // 3 + 1)
+        return text
+
+    async def _complete(self, prompt, model, max_tokens, temperature):
+        await asyncio.sleep(self.latency)
+        return self.respond(prompt)
+
+    async def _stream(self, prompt, model, max_tokens, temperature):
+        await asyncio.sleep(self.latency)
+        text = self.respond(prompt)
+        for start in range(0, len(text), self.chunk_size):
+            if self.chunk_delay:
+                await asyncio.sleep(self.chunk_delay)
+            yield text[start:start + self.chunk_size]
+
+
+def fake_answer(prompt):
+    """Build a plausible answer for one of the prompts in :mod:`prompts`."""
+    story_lines = _STORY_LINE.findall(prompt)
+    if story_lines:
+        result = {"Functional": [], "Non-Functional": []}
+        for line in story_lines:
+            story = json.loads(line)
+            # Stable split so repeated runs classify identically.
+            digest = hashlib.sha1(story["text"].encode("utf-8")).digest()[0]
+            result["Non-Functional" if digest % 4 == 0 else "Functional"].append(story["id"])
+        return result
+    if '"upsert_classes"' in prompt:
+        return {
+            "class": {"upsert_classes": [], "remove_classes": [], "add_relationships": [], "remove_relationships": []},
+            "sequence": {"add_objects": [], "remove_objects": [], "add_messages": [], "remove_messages": []},
+        }
+    if "deployment diagram" in prompt:
+        return {
+            "components": [
+                {"name": "WebServer", "services": ["Frontend"]},
+                {"name": "AppServer", "services": ["API"]},
+                {"name": "Database", "services": ["PostgreSQL"]},
+            ],
+            "relationships": [["WebServer", "AppServer", "HTTPS"], ["AppServer", "Database", "TCP"]],
+        }
+    names = [f"Entity{i}" for i in range(_count_stories(prompt))]
+    return {
+        "class": {
+            "classes": [{"name": n, "attributes": ["- id: int"], "methods": ["+ save()"]} for n in names],
+            "relationships": [[a, b, "Association", "1-n"] for a, b in zip(names, names[1:])],
+        },
+        "sequence": {
+            "objects": names[:5],
+            "messages": [[a, b, "request()"] for a, b in zip(names[:5], names[1:5])],
+        },
+    }
+
+
+def _count_stories(prompt):
+    match = _STORY_LIST.search(prompt)
+    if not match:
+        return 1
+    try:
+        stories = ast.literal_eval(match.group(1))
+    except (SyntaxError, ValueError):
+        return 1
+    return max(1, len(stories)) if isinstance(stories, list) else 1
+
+
+PROVIDERS = {
+    ANTHROPIC: AnthropicProvider,
+    OPENAI: OpenAIProvider,
+    FAKE: FakeProvider,
+}
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def get_provider(name, api_key=None):
+    """Return the shared provider for ``name`` and ``api_key``, creating it on first use.
+
+    Providers are keyed by a hash of the API key, so sessions using the same
+    key share one connection pool and no session can change another's key.
+    """
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown provider: {name}")
+    key = (name, hashlib.sha256((api_key or "").encode("utf-8")).hexdigest())
+    with _providers_lock:
+        provider = _providers.get(key)
+        if provider is None:
+            provider = _providers[key] = PROVIDERS[name](api_key)
+        return provider
+
+
+def set_provider(name, provider, api_key=None):
+    """Register a preconfigured provider instance (e.g. a FakeProvider with recorded responses)."""
+    key = (name, hashlib.sha256((api_key or "").encode("utf-8")).hexdigest())
+    with _providers_lock:
+        _providers[key] = provider
@@ -0,0 +1,485 @@
+"""Rendering of PlantUML sources to images, with a content-addressed LRU cache."""
+import hashlib
+import os
+import selectors
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from metrics import get_metrics
+
+PLANTUML_SERVER = os.getenv("PLANTUML_SERVER", "http://www.plantuml.com/plantuml/")
+PLANTUML_JAR = os.getenv("PLANTUML_JAR", "plantuml.jar")
+JAVA_BIN = os.getenv("JAVA_BIN", "java")
+RENDERER_MODE = os.getenv("UML_RENDERER", "remote")
+RENDERER_POOL_SIZE = int(os.getenv("UML_RENDERER_POOL_SIZE", 2))
+RENDER_TIMEOUT = float(os.getenv("UML_RENDER_TIMEOUT", 60))
+RENDER_WORKERS = int(os.getenv("UML_RENDER_WORKERS", 4))
+RENDER_CACHE_DIR = os.getenv("UML_RENDER_CACHE_DIR", os.path.join(tempfile.gettempdir(), "uml_render_cache"))
+RENDER_CACHE_MEMORY_BYTES = int(os.getenv("UML_RENDER_CACHE_MEMORY_BYTES", 64 * 1024 * 1024))
+RENDER_CACHE_DISK_BYTES = int(os.getenv("UML_RENDER_CACHE_DISK_BYTES", 512 * 1024 * 1024))
+
+
+def render_key(source, fmt):
+    """Return the cache key for a PlantUML source rendered to the given format."""
+    digest = hashlib.sha256()
+    digest.update(fmt.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(source.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class RenderCache:
+    """Two-tier (memory, then disk) LRU cache of rendered diagrams.
+
+    Both tiers are bounded by total size in bytes; the least recently used
+    entries are evicted first. Set ``disk_dir`` to None to keep the cache in
+    memory only.
+    """
+
+    def __init__(self, max_memory_bytes=RENDER_CACHE_MEMORY_BYTES, disk_dir=RENDER_CACHE_DIR,
+                 max_disk_bytes=RENDER_CACHE_DISK_BYTES):
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_dir = disk_dir
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    def _load_disk_index(self):
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            path = os.path.join(self.disk_dir, name)
+            if not name.endswith(".bin") or not os.path.isfile(path):
+                continue
+            st = os.stat(path)
+            entries.append((st.st_mtime, name[:-len(".bin")], st.st_size))
+        # Oldest first, so the OrderedDict keeps LRU order across restarts.
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key + ".bin")
+
+    def get(self, source, fmt="png"):
+        """Return cached bytes for ``source`` in ``fmt``, or None on a miss."""
+        key = render_key(source, fmt)
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return data
+            if key in self._disk:
+                path = self._disk_path(key)
+                try:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                    os.utime(path)
+                except OSError:
+                    self._disk_bytes -= self._disk.pop(key)
+                else:
+                    self._disk.move_to_end(key)
+                    self._stats["disk_hits"] += 1
+                    self._put_memory(key, data)
+                    return data
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, source, fmt, data):
+        """Store rendered bytes in both tiers."""
+        key = render_key(source, fmt)
+        with self._lock:
+            self._put_memory(key, data)
+            if self.disk_dir and key not in self._disk and len(data) <= self.max_disk_bytes:
+                tmp_path = self._disk_path(key) + ".tmp"
+                try:
+                    with open(tmp_path, "wb") as f:
+                        f.write(data)
+                    os.replace(tmp_path, self._disk_path(key))
+                except OSError:
+                    return
+                self._disk[key] = len(data)
+                self._disk_bytes += len(data)
+                self._evict_disk()
+
+    def _put_memory(self, key, data):
+        if len(data) > self.max_memory_bytes:
+            return
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self._stats["memory_evictions"] += 1
+
+    def _evict_disk(self):
+        while self._disk_bytes > self.max_disk_bytes:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self._stats["disk_evictions"] += 1
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._disk):
+                try:
+                    os.remove(self._disk_path(key))
+                except OSError:
+                    pass
+            self._memory.clear()
+            self._disk.clear()
+            self._memory_bytes = 0
+            self._disk_bytes = 0
+
+    def stats(self):
+        """Return hit/miss/eviction counters and current tier sizes."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["hits"] = stats["memory_hits"] + stats["disk_hits"]
+            stats["memory_entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_bytes
+            stats["disk_entries"] = len(self._disk)
+            stats["disk_bytes"] = self._disk_bytes
+            return stats
+
+
+class RenderError(Exception):
+    """Raised when a renderer backend fails to produce an image."""
+
+
+class RemoteRenderer:
+    """Render through a PlantUML HTTP server (plantuml.com, a self-hosted server or PicoWeb)."""
+
+    def __init__(self, server_url=PLANTUML_SERVER, timeout=RENDER_TIMEOUT):
+        self.server_url = server_url.rstrip("/") + "/"
+        self.timeout = timeout
+        # The plantuml client wraps an httplib2.Http, which is not thread-safe: one per thread and format.
+        self._clients = threading.local()
+
+    def _client(self, fmt):
+        clients = self._clients.__dict__
+        client = clients.get(fmt)
+        if client is None:
+            from plantuml import PlantUML
+
+            client = clients[fmt] = PlantUML(url=f"{self.server_url}{fmt}/", http_opts={"timeout": self.timeout})
+        return client
+
+    def render(self, source, fmt="png"):
+        return self._client(fmt).processes(source)
+
+    def close(self):
+        pass
+
+
+def _java_command(jar_path, fmt, *extra):
+    return [JAVA_BIN, "-Djava.awt.headless=true", "-jar", jar_path,
+            "-pipe", f"-t{fmt}", "-charset", "UTF-8", *extra]
+
+
+class LocalRenderer:
+    """Render with a fresh ``plantuml.jar`` process per diagram (pays JVM startup every time)."""
+
+    def __init__(self, jar_path=PLANTUML_JAR, timeout=RENDER_TIMEOUT):
+        self.jar_path = jar_path
+        self.timeout = timeout
+
+    def render(self, source, fmt="png"):
+        try:
+            result = subprocess.run(
+                _java_command(self.jar_path, fmt),
+                input=source.encode("utf-8"),
+                capture_output=True,
+                timeout=self.timeout,
+            )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise RenderError(f"plantuml.jar failed: {e}") from e
+        if not result.stdout:
+            raise RenderError(result.stderr.decode("utf-8", "replace").strip() or "plantuml.jar produced no output")
+        return result.stdout
+
+    def close(self):
+        pass
+
+
+class _PipeWorker:
+    """A long-lived ``plantuml.jar -pipe`` process for one output format."""
+
+    def __init__(self, jar_path, fmt):
+        self.fmt = fmt
+        self.delimiter = f"--uml-{uuid.uuid4().hex}--".encode("ascii")
+        self.proc = subprocess.Popen(
+            _java_command(jar_path, fmt, "-pipedelimitor", self.delimiter.decode("ascii")),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self._buffer = b""
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def render(self, source, timeout):
+        if not source.rstrip().endswith("@enduml"):
+            raise RenderError("PlantUML source must end with @enduml")
+        self.proc.stdin.write(source.encode("utf-8") + b"\n")
+        self.proc.stdin.flush()
+        deadline = time.monotonic() + timeout
+        fd = self.proc.stdout.fileno()
+        with selectors.DefaultSelector() as sel:
+            sel.register(fd, selectors.EVENT_READ)
+            while True:
+                # The delimiter line may still be trailing from the previous diagram.
+                self._buffer = self._buffer.lstrip(b"\r\n")
+                end = self._buffer.find(self.delimiter)
+                if end != -1:
+                    data = self._buffer[:end].rstrip(b"\r\n")
+                    self._buffer = self._buffer[end + len(self.delimiter):]
+                    return data
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not sel.select(remaining):
+                    raise RenderError(f"plantuml.jar timed out after {timeout}s")
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    raise RenderError("plantuml.jar exited unexpectedly")
+                self._buffer += chunk
+
+    def close(self):
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+
+class PooledLocalRenderer:
+    """Render with a pool of warm ``plantuml.jar -pipe`` processes per output format.
+
+    Workers are started lazily and reused, so only the first diagram of each
+    worker pays JVM startup. A worker that times out or dies is replaced.
+    """
+
+    def __init__(self, jar_path=PLANTUML_JAR, pool_size=RENDERER_POOL_SIZE, timeout=RENDER_TIMEOUT):
+        self.jar_path = jar_path
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._pools = {}
+        self._started = {}
+        # Signalled whenever a worker goes back to a pool or a worker slot frees up.
+        self._available = threading.Condition()
+
+    def _acquire(self, fmt):
+        """Take an idle worker, start one if the pool has room, or wait up to ``timeout`` for one."""
+        deadline = time.monotonic() + self.timeout
+        with self._available:
+            while True:
+                pool = self._pools.setdefault(fmt, [])
+                if pool:
+                    return pool.pop()
+                if self._started.get(fmt, 0) < self.pool_size:
+                    self._started[fmt] = self._started.get(fmt, 0) + 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RenderError(f"No plantuml.jar worker became free within {self.timeout}s")
+                self._available.wait(remaining)
+        try:
+            return _PipeWorker(self.jar_path, fmt)
+        except OSError as e:
+            self._free_slot(fmt)
+            raise RenderError(f"Cannot start plantuml.jar: {e}") from e
+
+    def _release(self, worker):
+        with self._available:
+            self._pools.setdefault(worker.fmt, []).append(worker)
+            self._available.notify()
+
+    def _free_slot(self, fmt):
+        with self._available:
+            self._started[fmt] = max(0, self._started.get(fmt, 0) - 1)
+            # A waiting caller can now start a replacement worker.
+            self._available.notify()
+
+    def _discard(self, worker):
+        worker.proc.kill()
+        self._free_slot(worker.fmt)
+
+    def render(self, source, fmt="png"):
+        worker = self._acquire(fmt)
+        if not worker.alive():
+            self._discard(worker)
+            worker = self._acquire(fmt)
+        try:
+            data = worker.render(source, self.timeout)
+        except Exception:
+            self._discard(worker)
+            raise
+        self._release(worker)
+        return data
+
+    def warm_up(self, fmt="png"):
+        """Start every worker of the pool for ``fmt`` ahead of the first request."""
+        workers = [self._acquire(fmt) for _ in range(self.pool_size)]
+        for worker in workers:
+            self._release(worker)
+
+    def close(self):
+        with self._available:
+            pools, self._pools, self._started = self._pools, {}, {}
+            self._available.notify_all()
+        for pool in pools.values():
+            for worker in pool:
+                worker.close()
+
+
+RENDERER_MODES = {
+    "remote": RemoteRenderer,
+    "local": LocalRenderer,
+    "pool": PooledLocalRenderer,
+}
+
+_renderers = {}
+_renderers_lock = threading.Lock()
+
+
+def get_renderer(mode=None):
+    """Return the process-wide renderer for ``mode`` (remote, local or pool)."""
+    mode = mode or RENDERER_MODE
+    if mode not in RENDERER_MODES:
+        raise ValueError(f"Unknown renderer mode: {mode}")
+    with _renderers_lock:
+        if mode not in _renderers:
+            _renderers[mode] = RENDERER_MODES[mode]()
+        return _renderers[mode]
+
+
+_render_cache = None
+_render_cache_lock = threading.Lock()
+
+
+def get_render_cache():
+    """Return the process-wide render cache, shared by all sessions."""
+    global _render_cache
+    with _render_cache_lock:
+        if _render_cache is None:
+            _render_cache = RenderCache()
+        return _render_cache
+
+
+def render_diagram(source, fmt="png", cache=None, renderer=None):
+    """Render a PlantUML source to image bytes, serving repeats from the cache."""
+    cache = cache if cache is not None else get_render_cache()
+    data = cache.get(source, fmt)
+    if data is None:
+        renderer = renderer if renderer is not None else get_renderer()
+        metrics = get_metrics()
+        with metrics.span(f"render.{fmt}"):
+            data = renderer.render(source, fmt)
+        metrics.count("render.source_chars", len(source))
+        metrics.count(f"render.{fmt}_bytes", len(data))
+        cache.put(source, fmt, data)
+    return data
+
+
+RenderResult = namedtuple("RenderResult", ["name", "source", "fmt", "data", "error", "elapsed"])
+
+_render_executor = None
+_render_executor_lock = threading.Lock()
+
+
+def get_render_executor():
+    """Return the process-wide, bounded thread pool used for concurrent renders."""
+    global _render_executor
+    with _render_executor_lock:
+        if _render_executor is None:
+            _render_executor = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix="render")
+        return _render_executor
+
+
+def run_with_timeouts(executor, tasks, timeout):
+    """Run ``{key: (fn, *args)}`` on ``executor`` and yield ``(key, future)`` as each task finishes.
+
+    A task still running ``timeout`` seconds after it started is yielded as
+    ``(key, None)`` and no longer waited for. Time spent queued behind other
+    work on a shared executor does not count against the timeout.
+    """
+    started = {}
+
+    def run(key, fn, args):
+        started[key] = time.monotonic()
+        return fn(*args)
+
+    pending = {executor.submit(run, key, fn, args): key for key, (fn, *args) in tasks.items()}
+    while pending:
+        done, _ = wait(pending, timeout=_next_check(pending, started, timeout), return_when=FIRST_COMPLETED)
+        for future in done:
+            yield pending.pop(future), future
+        now = time.monotonic()
+        for future, key in list(pending.items()):
+            if key in started and now - started[key] >= timeout and not future.done():
+                del pending[future]
+                yield key, None
+
+
+def _next_check(pending, started, timeout):
+    now = time.monotonic()
+    deadlines = [started[key] + timeout for key in pending.values() if key in started]
+    if len(deadlines) < len(pending):
+        # Queued tasks start without notice; look again soon to start their clocks.
+        deadlines.append(now + min(1.0, timeout))
+    return max(0.0, min(deadlines) - now)
+
+
+def _timed_render(name, source, fmt, cache, renderer):
+    start = time.perf_counter()
+    try:
+        data = render_diagram(source, fmt, cache=cache, renderer=renderer)
+    except Exception as e:
+        return RenderResult(name, source, fmt, None, e, time.perf_counter() - start)
+    return RenderResult(name, source, fmt, data, None, time.perf_counter() - start)
+
+
+def render_many(diagrams, fmt="png", cache=None, renderer=None, timeout=RENDER_TIMEOUT, executor=None):
+    """Render ``{name: source}`` concurrently and yield a RenderResult as each one finishes.
+
+    Failures are reported per diagram through ``RenderResult.error`` instead of
+    being raised. ``timeout`` bounds each render from the moment it starts
+    running (see :func:`run_with_timeouts`), so renders waiting for a slot of
+    the shared pool never time out.
+    """
+    executor = executor or get_render_executor()
+    tasks = {name: (_timed_render, name, source, fmt, cache, renderer) for name, source in diagrams.items()}
+    for name, future in run_with_timeouts(executor, tasks, timeout):
+        if future is None:
+            error = RenderError(f"Render timed out after {timeout}s")
+            yield RenderResult(name, diagrams[name], fmt, None, error, timeout)
+        else:
+            yield future.result()
@@ -0,0 +1,343 @@
+"""Persistent SQLite store of projects: stories, board state, sprints, generated models and diagrams.
+
+Every save creates a new version of the project. A version holds only
+rows pointing at content-addressed story texts and artifact blobs, so
+unchanged stories and diagrams are stored once however many versions
+and projects share them. Versions are read lazily: opening a project
+reads nothing until its stories, board, state or artifacts are asked for.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+PROJECT_STORE_PATH = os.getenv(
+    "UML_PROJECT_STORE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "uml-diagram-generator", "projects.sqlite3"),
+)
+PROJECT_MAX_VERSIONS = int(os.getenv("UML_PROJECT_MAX_VERSIONS", 50))
+
+ProjectInfo = namedtuple("ProjectInfo", ["name", "version", "updated", "stories"])
+VersionInfo = namedtuple("VersionInfo", ["version", "created", "note"])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    head INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS versions (
+    project_id INTEGER NOT NULL REFERENCES projects (id) ON DELETE CASCADE,
+    version INTEGER NOT NULL,
+    created REAL NOT NULL,
+    note TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (project_id, version)
+);
+CREATE TABLE IF NOT EXISTS story_texts (
+    text_id TEXT PRIMARY KEY,
+    text TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS version_stories (
+    project_id INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    story_id TEXT NOT NULL,
+    text_id TEXT NOT NULL,
+    status TEXT,
+    PRIMARY KEY (project_id, version, kind, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sprints (
+    project_id INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    story_ids TEXT NOT NULL,
+    PRIMARY KEY (project_id, version, kind, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS state (
+    project_id INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (project_id, version, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS artifacts (
+    project_id INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    mime TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (project_id, version, name)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Per-version tables copied forward when a save does not replace them.
+_VERSIONED_TABLES = {
+    "stories": ("version_stories", "kind, position, story_id, text_id, status"),
+    "sprints": ("sprints", "kind, position, name, story_ids"),
+    "state": ("state", "key, value"),
+    "artifacts": ("artifacts", "name, mime, digest, size"),
+}
+
+
+def _text_id(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class ProjectVersion:
+    """One saved version of a project; every part is read from the store on first access only."""
+
+    def __init__(self, store, project_id, name, version, created, note):
+        self.store = store
+        self.project_id = project_id
+        self.name = name
+        self.version = version
+        self.created = created
+        self.note = note
+        self._stories = None
+        self._sprints = None
+        self._state = None
+        self._artifacts = None
+
+    def _query(self, sql, *params):
+        return self.store._query(sql, (self.project_id, self.version) + params)
+
+    def _load_stories(self):
+        if self._stories is None:
+            self._stories = {}
+            rows = self._query(
+                "SELECT s.kind, s.story_id, t.text, s.status FROM version_stories s"
+                " JOIN story_texts t ON t.text_id = s.text_id"
+                " WHERE s.project_id = ? AND s.version = ? ORDER BY s.kind, s.position"
+            )
+            for kind, sid, text, status in rows:
+                self._stories.setdefault(kind, []).append(({"id": sid, "text": text}, status))
+        return self._stories
+
+    def kinds(self):
+        return list(self._load_stories())
+
+    def stories(self, kind):
+        """Story dicts of ``kind`` in their saved order."""
+        return [story for story, _ in self._load_stories().get(kind, [])]
+
+    def statuses(self, kind):
+        """``{story id: board status}`` for the stories of ``kind`` that had one."""
+        return {story["id"]: status for story, status in self._load_stories().get(kind, []) if status}
+
+    def sprints(self, kind):
+        """``{sprint name: [story ids]}`` in their saved order."""
+        if self._sprints is None:
+            self._sprints = {}
+            rows = self._query(
+                "SELECT kind, name, story_ids FROM sprints WHERE project_id = ? AND version = ? ORDER BY kind, position"
+            )
+            for row_kind, name, ids in rows:
+                self._sprints.setdefault(row_kind, {})[name] = json.loads(ids)
+        return self._sprints.get(kind, {})
+
+    def state(self, key, default=None):
+        """A JSON value saved with the version (e.g. the generated Functional model)."""
+        if self._state is None:
+            self._state = dict(self._query("SELECT key, value FROM state WHERE project_id = ? AND version = ?"))
+        value = self._state.get(key)
+        return json.loads(value) if value is not None else default
+
+    def artifact_names(self):
+        """``{name: (mime, size)}`` of the saved artifacts; their content is not read."""
+        if self._artifacts is None:
+            rows = self._query("SELECT name, mime, digest, size FROM artifacts WHERE project_id = ? AND version = ?"
+                               " ORDER BY name")
+            self._artifacts = {name: (mime, digest, size) for name, mime, digest, size in rows}
+        return {name: (mime, size) for name, (mime, _, size) in self._artifacts.items()}
+
+    def artifact(self, name):
+        """Return ``(data, mime)`` of a saved artifact, or None."""
+        self.artifact_names()
+        entry = self._artifacts.get(name)
+        if entry is None:
+            return None
+        mime, digest, _ = entry
+        rows = self.store._query("SELECT data FROM blobs WHERE digest = ?", (digest,))
+        return (bytes(rows[0][0]), mime) if rows else None
+
+
+class ProjectStore:
+    """Projects and their versions in one SQLite database, safe to share between sessions and threads."""
+
+    def __init__(self, path=PROJECT_STORE_PATH, max_versions=PROJECT_MAX_VERSIONS):
+        self.path = path
+        self.max_versions = max_versions
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def list_projects(self):
+        rows = self._query(
+            "SELECT p.name, p.head, p.updated,"
+            " (SELECT COUNT(*) FROM version_stories s WHERE s.project_id = p.id AND s.version = p.head)"
+            " FROM projects p ORDER BY p.updated DESC"
+        )
+        return [ProjectInfo(*row) for row in rows]
+
+    def versions(self, name):
+        rows = self._query(
+            "SELECT v.version, v.created, v.note FROM versions v JOIN projects p ON p.id = v.project_id"
+            " WHERE p.name = ? ORDER BY v.version DESC",
+            (name,),
+        )
+        return [VersionInfo(*row) for row in rows]
+
+    def open(self, name, version=None):
+        """Return the :class:`ProjectVersion` ``version`` (default: latest) of ``name``, or None."""
+        rows = self._query("SELECT id, head FROM projects WHERE name = ?", (name,))
+        if not rows or not rows[0][1]:
+            return None
+        project_id, head = rows[0]
+        version = version or head
+        rows = self._query("SELECT created, note FROM versions WHERE project_id = ? AND version = ?",
+                           (project_id, version))
+        if not rows:
+            return None
+        return ProjectVersion(self, project_id, name, version, *rows[0])
+
+    def save(self, name, stories=None, statuses=None, sprints=None, state=None, artifacts=None, note=""):
+        """Save a new version of project ``name`` (created if needed) in one transaction and return its number.
+
+        ``stories``: ``{kind: [story dicts]}``; ``statuses``: ``{kind: {id: status}}``;
+        ``sprints``: ``{kind: {name: [ids]}}``; ``state``: ``{key: JSON value}``
+        merged over the previous version's; ``artifacts``: ``{name: (data, mime)}``
+        merged over the previous version's. Parts left as None are carried
+        over from the previous version unchanged.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            conn = self._conn
+            conn.execute("INSERT OR IGNORE INTO projects (name, created, updated) VALUES (?, ?, ?)", (name, now, now))
+            project_id, head = conn.execute("SELECT id, head FROM projects WHERE name = ?", (name,)).fetchone()
+            version = head + 1
+            conn.execute("INSERT INTO versions (project_id, version, created, note) VALUES (?, ?, ?, ?)",
+                         (project_id, version, now, note))
+            if head:
+                # state and artifacts are merged, so they always start from the previous version.
+                replaced = {"stories": stories is not None, "sprints": sprints is not None}
+                for part, (table, columns) in _VERSIONED_TABLES.items():
+                    if replaced.get(part):
+                        continue
+                    conn.execute(
+                        f"INSERT INTO {table} (project_id, version, {columns})"
+                        f" SELECT project_id, ?, {columns} FROM {table} WHERE project_id = ? AND version = ?",
+                        (version, project_id, head),
+                    )
+            if stories is not None:
+                statuses = statuses or {}
+                conn.executemany(
+                    "INSERT OR IGNORE INTO story_texts (text_id, text) VALUES (?, ?)",
+                    ((_text_id(s["text"]), s["text"]) for kind_stories in stories.values() for s in kind_stories),
+                )
+                conn.executemany(
+                    "INSERT INTO version_stories (project_id, version, kind, position, story_id, text_id, status)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        (project_id, version, kind, i, s["id"], _text_id(s["text"]), statuses.get(kind, {}).get(s["id"]))
+                        for kind, kind_stories in stories.items() for i, s in enumerate(kind_stories)
+                    ),
+                )
+            if sprints is not None:
+                conn.executemany(
+                    "INSERT INTO sprints (project_id, version, kind, position, name, story_ids) VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        (project_id, version, kind, i, sprint, json.dumps(ids))
+                        for kind, kind_sprints in sprints.items() for i, (sprint, ids) in enumerate(kind_sprints.items())
+                    ),
+                )
+            if state:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO state (project_id, version, key, value) VALUES (?, ?, ?, ?)",
+                    ((project_id, version, key, json.dumps(value, ensure_ascii=False)) for key, value in state.items()),
+                )
+            if artifacts:
+                rows = []
+                blobs = []
+                for artifact_name, (data, mime) in artifacts.items():
+                    if isinstance(data, str):
+                        data = data.encode("utf-8")
+                    digest = hashlib.sha256(data).hexdigest()
+                    blobs.append((digest, data))
+                    rows.append((project_id, version, artifact_name, mime, digest, len(data)))
+                conn.executemany("INSERT OR IGNORE INTO blobs (digest, data) VALUES (?, ?)", blobs)
+                conn.executemany(
+                    "INSERT OR REPLACE INTO artifacts (project_id, version, name, mime, digest, size)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+            conn.execute("UPDATE projects SET head = ?, updated = ? WHERE id = ?", (version, now, project_id))
+            self._prune(project_id, version)
+        return version
+
+    def _prune(self, project_id, head):
+        cutoff = head - self.max_versions
+        if cutoff <= 0:
+            return
+        for table in ("versions", "version_stories", "sprints", "state", "artifacts"):
+            self._conn.execute(f"DELETE FROM {table} WHERE project_id = ? AND version <= ?", (project_id, cutoff))
+        self._collect_garbage()
+
+    def _collect_garbage(self):
+        self._conn.execute("DELETE FROM blobs WHERE digest NOT IN (SELECT digest FROM artifacts)")
+        self._conn.execute("DELETE FROM story_texts WHERE text_id NOT IN (SELECT text_id FROM version_stories)")
+
+    def delete(self, name):
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT id FROM projects WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                return False
+            for table in ("version_stories", "sprints", "state", "artifacts", "versions"):
+                self._conn.execute(f"DELETE FROM {table} WHERE project_id = ?", row)
+            self._conn.execute("DELETE FROM projects WHERE id = ?", row)
+            self._collect_garbage()
+            return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "projects": self._conn.execute("SELECT COUNT(*) FROM projects").fetchone()[0],
+                "versions": self._conn.execute("SELECT COUNT(*) FROM versions").fetchone()[0],
+                "stories": self._conn.execute("SELECT COUNT(*) FROM story_texts").fetchone()[0],
+                "blobs": self._conn.execute("SELECT COUNT(*) FROM blobs").fetchone()[0],
+            }
+
+
+_project_store = None
+_project_store_lock = threading.Lock()
+
+
+def get_project_store():
+    """Return the process-wide project store."""
+    global _project_store
+    with _project_store_lock:
+        if _project_store is None:
+            _project_store = ProjectStore()
+        return _project_store
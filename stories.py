@@ -0,0 +1,66 @@
+"""User story model with deterministic, content-derived IDs."""
+import hashlib
+
+from llm_cache import normalize_story
+
+STORY_ID_LENGTH = 12
+
+
+def story_id(text):
+    """Return the stable ID of a story text: a hash of its normalized content."""
+    return hashlib.sha1(normalize_story(text).encode("utf-8")).hexdigest()[:STORY_ID_LENGTH]
+
+
+def assign_story_ids(stories):
+    """Assign a content-hash ID to each user story and return as list of dicts.
+
+    The same texts always get the same IDs, so IDs survive Streamlit reruns.
+    Repeated texts get ``-2``, ``-3``... suffixes in order of appearance.
+    """
+    seen = {}
+    result = []
+    for text in stories:
+        sid = story_id(text)
+        count = seen.get(sid, 0) + 1
+        seen[sid] = count
+        result.append({"id": sid if count == 1 else f"{sid}-{count}", "text": text})
+    return result
+
+
+def new_story(text, existing_ids):
+    """Create a story dict for ``text`` whose ID does not collide with ``existing_ids``."""
+    base = story_id(text)
+    sid, count = base, 1
+    while sid in existing_ids:
+        count += 1
+        sid = f"{base}-{count}"
+    return {"id": sid, "text": text}
+
+
+class StoryIndex:
+    """O(1) lookup of stories by ID, preserving the original order."""
+
+    def __init__(self, stories):
+        self._stories = {story["id"]: story for story in stories}
+
+    def __contains__(self, sid):
+        return sid in self._stories
+
+    def __getitem__(self, sid):
+        return self._stories[sid]
+
+    def __len__(self):
+        return len(self._stories)
+
+    def __iter__(self):
+        return iter(self._stories.values())
+
+    def get(self, sid, default=None):
+        return self._stories.get(sid, default)
+
+    def ids(self):
+        return list(self._stories)
+
+    def select(self, ids):
+        """Return copies of the stories with the given IDs, skipping unknown ones."""
+        return [dict(self._stories[sid]) for sid in ids if sid in self._stories]
@@ -0,0 +1,146 @@
+"""Incremental parsing of a streamed JSON response into completed array entries."""
+import json
+
+STREAM_KEYS = ("classes", "relationships", "objects", "messages", "components")
+
+
+class StreamingJSONParser:
+    """Scan a JSON document chunk by chunk and emit array entries as soon as they close.
+
+    Only the direct entries of arrays stored under one of ``keys`` are
+    emitted, as ``(key, value)`` tuples, e.g. every ``{"name": ...}`` of
+    ``"classes"``. Text before the first ``{`` (prose, a code fence) is
+    skipped. The scan is a single pass: each character is looked at once.
+    """
+
+    def __init__(self, keys=STREAM_KEYS):
+        self.keys = frozenset(keys)
+        self._text = ""
+        self._pos = 0
+        self._started = False
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        # Frames: [kind, key of this container, expecting_key, element start, last key]
+        self._stack = []
+
+    def feed(self, chunk):
+        """Consume a chunk of text and return the newly completed ``(key, value)`` entries."""
+        self._text += chunk
+        emitted = []
+        text = self._text
+        pos = self._pos
+        while pos < len(text):
+            ch = text[pos]
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._stack.append(["{", None, True, None, None])
+                pos += 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._end_string(text, pos, emitted)
+                pos += 1
+                continue
+            if not self._stack:
+                break
+            frame = self._stack[-1]
+            if ch.isspace():
+                pass
+            elif ch == '"':
+                self._begin_value(pos)
+                self._in_string = True
+                self._string_start = pos
+            elif ch in "{[":
+                self._begin_value(pos)
+                key = frame[4] if frame[0] == "{" else None
+                self._stack.append([ch, key, ch == "{", None, None])
+            elif ch in "}]":
+                self._close_scalar(text, pos, emitted)
+                self._stack.pop()
+                if self._stack:
+                    self._end_value(text, pos + 1, emitted)
+            elif ch == ",":
+                self._close_scalar(text, pos, emitted)
+                if frame[0] == "{":
+                    frame[2] = True
+            elif ch == ":":
+                frame[2] = False
+            else:
+                self._begin_value(pos)
+            pos += 1
+        self._pos = pos
+        self._trim()
+        return emitted
+
+    def _trim(self):
+        # Drop text no pending entry or string can still need, so memory stays
+        # bounded by the largest open entry instead of the whole response.
+        keep = self._string_start if self._in_string else self._pos
+        for frame in self._stack:
+            if frame[3] is not None:
+                keep = min(keep, frame[3])
+        if keep < 4096:
+            return
+        self._text = self._text[keep:]
+        self._pos -= keep
+        self._string_start -= keep
+        for frame in self._stack:
+            if frame[3] is not None:
+                frame[3] -= keep
+
+    def _begin_value(self, pos):
+        frame = self._stack[-1]
+        if frame[0] == "[" and frame[3] is None:
+            frame[3] = pos
+
+    def _end_string(self, text, pos, emitted):
+        frame = self._stack[-1]
+        if frame[0] == "{" and frame[2]:
+            frame[4] = json.loads(text[self._string_start:pos + 1])
+        else:
+            self._end_value(text, pos + 1, emitted)
+
+    def _end_value(self, text, end, emitted):
+        frame = self._stack[-1]
+        if frame[0] != "[" or frame[3] is None:
+            return
+        start, frame[3] = frame[3], None
+        if frame[1] in self.keys:
+            emitted.append((frame[1], json.loads(text[start:end])))
+
+    def _close_scalar(self, text, pos, emitted):
+        # Numbers, true/false/null have no closing character of their own.
+        frame = self._stack[-1]
+        if frame[0] == "[" and frame[3] is not None:
+            self._end_value(text, pos, emitted)
+
+
+def consume_stream(chunks, on_items=None, keys=STREAM_KEYS):
+    """Read a stream of text chunks and return the full text.
+
+    ``on_items(items)`` is called with ``{key: [entries so far]}`` every time
+    new entries complete, so callers can show a progressive preview.
+    """
+    parser = StreamingJSONParser(keys)
+    parts = []
+    items = {}
+    for chunk in chunks:
+        parts.append(chunk)
+        try:
+            new_items = parser.feed(chunk)
+        except ValueError:
+            # Malformed partial JSON only costs the preview, not the final parse.
+            parser = StreamingJSONParser(())
+            new_items = []
+        for key, value in new_items:
+            items.setdefault(key, []).append(value)
+        if new_items and on_items:
+            on_items(items)
+    return "".join(parts)